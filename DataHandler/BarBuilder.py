@@ -0,0 +1,124 @@
+# BarBuilder.py
+
+"""
+由 trade 增量聚合 bar
+
+1. 每个 symbol 每种 bar 一个 BarBuilder, handler 在推送 trade 时调用 update, 每条 trade 的开销为 O(1)
+   当前 (未完成的) bar 只保存几个标量, 不保存 trade 本身
+2. 支持三种 bar:
+    ('time', 1000)     每 1000 ms 一根, 按 epoch 对齐, 时间戳 >= bar 结束时间的第一条 trade (或者推送时间) 完成该 bar
+                       没有成交的时间段不生成 bar
+    ('tick', 100)      每 100 笔成交一根
+    ('volume', 10.0)   成交量达到 10.0 时完成, 完成该 bar 的 trade 全部计入该 bar (不拆分)
+3. 完成的 bar 保存在 RingBuffer 中 (每一列一个 numpy 数组), 策略直接读取最近 N 根, 不需要每次重新聚合 trade
+"""
+
+import numpy as np
+
+from DataHandler.MarketDataStructure import Bar
+from DataHandler.RingBuffer import RingBuffer
+
+
+BAR_TYPES = ('time', 'tick', 'volume')
+# time: 完成该 bar 的时间, start: bar 的开始时间 (time bar 为对齐后的时间, 其余为第一笔成交的时间)
+BAR_COLUMNS = [('time', np.int64), ('start', np.int64),
+               ('open', np.float64), ('high', np.float64), ('low', np.float64), ('close', np.float64),
+               ('volume', np.float64), ('amount', np.float64), ('vwap', np.float64), ('ticks', np.int64)]
+
+
+class BarBuilder(object):
+    """
+    symbol 的 bar_type bar, size 为 bar 的大小 (毫秒/成交笔数/成交量)
+    history_depth: 保存最近多少根完成的 bar
+    """
+
+    def __init__(self, symbol, bar_type, size, history_depth=1000):
+        if bar_type not in BAR_TYPES:
+            raise ValueError('unknown bar_type: %s' % bar_type)
+        if size <= 0:
+            raise ValueError('bar size should be > 0')
+        self.symbol = symbol
+        self.bar_type = bar_type
+        self.size = int(size) if bar_type != 'volume' else float(size)
+        self.history = RingBuffer(history_depth, BAR_COLUMNS)
+        self.n_closed = 0               # 已经完成的 bar 数量
+        self.receive_time = None        # 完成最近一根 bar 的 trade 的接收时间
+        # 当前 bar
+        self.ticks = 0
+        self.start = self.end = 0
+        self.open = self.high = self.low = self.close = 0.0
+        self.volume = self.amount = 0.0
+
+    def _open(self, t, price):
+        if self.bar_type == 'time':
+            self.start = t - t % self.size
+            self.end = self.start + self.size
+        else:
+            self.start = t
+        self.open = self.high = self.low = price
+        self.volume = self.amount = 0.0
+
+    def _close(self, t, receive_time=None):
+        self.history.append({'time': t, 'start': self.start, 'open': self.open, 'high': self.high,
+                             'low': self.low, 'close': self.close, 'volume': self.volume,
+                             'amount': self.amount, 'vwap': self.amount / self.volume if self.volume else self.close,
+                             'ticks': self.ticks})
+        self.ticks = 0
+        self.n_closed += 1
+        self.receive_time = receive_time
+
+    def update(self, store, lo, hi):
+        """
+        聚合 store 中 [lo, hi) 行的 trade, 返回完成的 bar 数量
+        """
+        closed = self.n_closed
+        is_time, is_tick = self.bar_type == 'time', self.bar_type == 'tick'
+        size = self.size
+        times = store.time[lo:hi].tolist()
+        prices = store.price[lo:hi].tolist()
+        qtys = store.qty[lo:hi].tolist()
+        for k in range(hi - lo):
+            t, price, qty = times[k], prices[k], qtys[k]
+            if self.ticks and is_time and t >= self.end:
+                self._close(t, store.receive_time_of(lo + k))
+            if not self.ticks:
+                self._open(t, price)
+            if price > self.high:
+                self.high = price
+            elif price < self.low:
+                self.low = price
+            self.close = price
+            self.volume += qty
+            self.amount += price * qty
+            self.ticks += 1
+            if not is_time and (self.ticks >= size if is_tick else self.volume >= size):
+                self._close(t, store.receive_time_of(lo + k))
+        return self.n_closed - closed
+
+    def advance(self, now):
+        """
+        time bar: 推送时间 now 越过当前 bar 的结束时间时, 即使该 symbol 没有新的成交也完成该 bar
+        返回完成的 bar 数量
+        """
+        if self.ticks and self.bar_type == 'time' and now >= self.end:
+            self._close(now)
+            return 1
+        return 0
+
+    def latest(self, N=1):
+        """
+        最近 N 根完成的 bar {列名: 只读的 numpy view}, 见 RingBuffer.latest
+        """
+        return self.history.latest(N)
+
+    def last_bar(self):
+        """
+        最近一根完成的 bar (Bar), 还没有时返回 None
+        """
+        if not len(self.history):
+            return None
+        row = {name: arr[0].item() for name, arr in self.history.latest(1).items()}
+        return Bar(symbol=self.symbol, bar_type=self.bar_type, td=self.size, ts=row['start'],
+                   open=row['open'], high=row['high'], low=row['low'], close=row['close'],
+                   volume=row['volume'], amount=row['amount'], vwap=row['vwap'], ticks=row['ticks'],
+                   timestamp=row['time'], receive_time=self.receive_time)
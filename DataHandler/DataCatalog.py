@@ -0,0 +1,265 @@
+# DataCatalog.py
+
+"""
+多日数据目录 (catalog)
+
+数据按日期分目录保存:
+    root_dir/20240101/btc_usdt_bybit_trade.parquet
+    root_dir/20240301/btc_usdt_coinbase_trade.parquet ...
+
+1. DataCatalog 记录每个文件的 日期, symbol_exchange, 类型(trade/LOB), 时间范围 (min/max) 以及行数
+   保存在 root_dir/catalog.json 中, 文件的大小或 mtime 改变时只重新扫描该文件
+   parquet 文件只读取 footer 中的统计信息, 不读取数据
+2. MultiDaySource 把一个 symbol 在多天中的文件串联为一个连续的数据源 (与 ColumnStore/ParquetWindowReader 接口一致)
+   与窗口没有交集的文件不会被打开, 已经推送完的文件会被释放
+"""
+
+import json
+import os
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from DataHandler.MarketDataStore import open_source
+
+
+# catalog 格式发生改变时增加版本号, 旧的 catalog 会被重新生成
+CATALOG_VERSION = 1
+CATALOG_FILE = 'catalog.json'
+KINDS = ('trade', 'LOB', 'L2diff')
+
+
+def _parse_file_name(name):
+    """
+    'btc_usdt_bybit_trade.parquet' -> ('btc_usdt_bybit', 'trade', 'parquet'), 不是数据文件时返回 None
+    """
+    stem, ext = os.path.splitext(name)
+    if ext not in ('.csv', '.parquet') or '_' not in stem:
+        return None
+    symbol, kind = stem.rsplit('_', 1)
+    if kind not in KINDS:
+        return None
+    return symbol, kind, ext[1:]
+
+
+def _scan_file(path, file_format, time_column):
+    """
+    返回文件的 (min_time, max_time, rows)
+    parquet 优先使用 row group 的统计信息, 没有统计信息时才读取 time 列
+    """
+    if file_format == 'parquet':
+        parquet_file = pq.ParquetFile(path)
+        meta = parquet_file.metadata
+        col = parquet_file.schema_arrow.get_field_index(time_column)
+        mins, maxs = [], []
+        for i in range(meta.num_row_groups):
+            stats = meta.row_group(i).column(col).statistics
+            if stats is None or not stats.has_min_max:
+                break
+            mins.append(stats.min)
+            maxs.append(stats.max)
+        else:
+            if mins:
+                return int(min(mins)), int(max(maxs)), int(meta.num_rows)
+        time = parquet_file.read(columns=[time_column]).column(time_column).to_numpy()
+    else:
+        time = pd.read_csv(path, usecols=[time_column])[time_column].to_numpy()
+    if len(time) == 0:
+        return None, None, 0
+    return int(time.min()), int(time.max()), len(time)
+
+
+class DataCatalog(object):
+    """
+    root_dir 下所有日期目录中数据文件的索引
+    """
+
+    def __init__(self, root_dir, time_column='time', catalog_path=None):
+        self.root_dir = root_dir
+        self.time_column = time_column
+        self.catalog_path = catalog_path or os.path.join(root_dir, CATALOG_FILE)
+        self.files = {}     # 相对路径 -> 文件信息
+        self.refresh()
+
+    def _load(self):
+        try:
+            with open(self.catalog_path) as f:
+                catalog = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if catalog.get('version') != CATALOG_VERSION or catalog.get('time_column') != self.time_column:
+            return {}
+        return catalog.get('files', {})
+
+    def _save(self):
+        tmp_path = '%s.tmp-%d' % (self.catalog_path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': CATALOG_VERSION, 'time_column': self.time_column, 'files': self.files},
+                      f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.catalog_path)
+
+    def refresh(self):
+        """
+        扫描 root_dir, 只重新读取新增或者发生改变的文件, 有变化时保存 catalog
+        """
+        old = self._load()
+        files = {}
+        for date in sorted(os.listdir(self.root_dir)):
+            date_dir = os.path.join(self.root_dir, date)
+            if not (date.isdigit() and os.path.isdir(date_dir)):
+                continue
+            for name in sorted(os.listdir(date_dir)):
+                parsed = _parse_file_name(name)
+                if parsed is None:
+                    continue
+                symbol, kind, file_format = parsed
+                rel_path = date + '/' + name
+                stat = os.stat(os.path.join(date_dir, name))
+                entry = old.get(rel_path)
+                if entry is None or entry['size'] != stat.st_size or entry['mtime_ns'] != stat.st_mtime_ns:
+                    min_time, max_time, rows = _scan_file(os.path.join(date_dir, name), file_format, self.time_column)
+                    entry = {'date': date, 'symbol': symbol, 'kind': kind, 'format': file_format,
+                             'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                             'min_time': min_time, 'max_time': max_time, 'rows': rows}
+                files[rel_path] = entry
+        self.files = files
+        if files != old:
+            self._save()
+
+    def dates(self):
+        return sorted({entry['date'] for entry in self.files.values()})
+
+    def symbols(self, kind=None):
+        return sorted({entry['symbol'] for entry in self.files.values() if kind is None or entry['kind'] == kind})
+
+    def find(self, symbol, kind, is_csv=True, start_date=None, end_date=None, start=None, end=None):
+        """
+        返回 symbol 在 [start_date, end_date] 日期目录中, 时间与 [start, end] 有交集的文件, 按时间排序
+        只使用 catalog 中的信息, 不打开任何文件
+        return: [(file_dir, entry), ...]
+        """
+        file_format = 'csv' if is_csv else 'parquet'
+        outcomes = []
+        for rel_path, entry in self.files.items():
+            if entry['symbol'] != symbol or entry['kind'] != kind or entry['format'] != file_format:
+                continue
+            if entry['rows'] == 0:
+                continue
+            if start_date is not None and entry['date'] < str(start_date):
+                continue
+            if end_date is not None and entry['date'] > str(end_date):
+                continue
+            if start is not None and entry['max_time'] < start:
+                continue
+            if end is not None and entry['min_time'] > end:
+                continue
+            outcomes.append((os.path.join(self.root_dir, entry['date']), entry))
+        outcomes.sort(key=lambda x: (x[1]['min_time'], x[1]['date']))
+        return outcomes
+
+
+class MultiDaySource(object):
+    """
+    把同一个 symbol 多天的文件串联为一个数据源, 接口与 ColumnStore/ParquetWindowReader 一致
+    每天的文件在第一次有窗口与之相交时才用 open_source 打开, 窗口越过该文件之后释放
+    """
+
+    def __init__(self, store_cls, symbol, files, kind, columns, is_csv=True, read_mode='full', cache_dir=None, clean=None):
+        self.store_cls = store_cls
+        self.symbol = symbol
+        self.kind = kind
+        self.columns = columns
+        self.is_csv = is_csv
+        self.read_mode = read_mode
+        self.cache_dir = cache_dir
+        self.clean = clean
+        self.reports = {}   # 文件序号 -> 清洗报告 (文件被释放之后仍然保留)
+        self.file_dirs = [file_dir for file_dir, _ in files]
+        self.min_time = np.array([entry['min_time'] for _, entry in files], dtype=np.int64)
+        self.max_time = np.array([entry['max_time'] for _, entry in files], dtype=np.int64)
+        self.rows = np.array([entry['rows'] for _, entry in files], dtype=np.int64)
+        self.opened = {}    # 文件序号 -> 打开的数据源
+
+    def _source(self, i):
+        source = self.opened.get(i)
+        if source is None:
+            source = self.opened[i] = open_source(self.store_cls, self.symbol, self.file_dirs[i], self.kind,
+                                                  self.columns, self.is_csv, self.read_mode, self.cache_dir, self.clean)
+            if source.quality_report is not None:
+                self.reports[i] = source.quality_report
+        return source
+
+    @property
+    def quality_report(self):
+        """
+        已经打开过的文件的清洗报告之和
+        """
+        if not self.reports:
+            return None
+        from DataHandler.DataCleaning import QualityReport
+        report = QualityReport(self.symbol, self.kind, self.clean)
+        for i in sorted(self.reports):
+            report.merge(self.reports[i])
+        return report
+
+    def _release_before(self, t):
+        """
+        释放所有数据都早于 t 的文件
+        """
+        for i in [i for i in self.opened if self.max_time[i] < t]:
+            del self.opened[i]
+
+    def read_window(self, start, end):
+        self._release_before(start)
+        overlap = np.flatnonzero((self.max_time >= start) & (self.min_time <= end)).tolist()
+        return self.store_cls.concat(self.symbol, [self._source(i).read_window(start, end) for i in overlap])
+
+    def next_time_after(self, after=None):
+        """
+        完全晚于 after 的文件直接使用 catalog 中的 min_time, 不需要打开
+        """
+        if after is None:
+            return int(self.min_time.min()) if len(self.min_time) else None
+        candidates = []
+        later = self.min_time > after
+        if later.any():
+            candidates.append(int(self.min_time[later].min()))
+        for i in np.flatnonzero((self.min_time <= after) & (self.max_time > after)).tolist():
+            t = self._source(i).next_time_after(after)
+            if t is not None:
+                candidates.append(t)
+        return min(candidates) if candidates else None
+
+    @property
+    def row_nbytes(self):
+        return self.store_cls.row_nbytes
+
+    def last_time(self):
+        return int(self.max_time.max()) if len(self.max_time) else None
+
+    def count_between(self, start, end):
+        """
+        已经打开的文件使用其自身的 count_between, 没有打开的文件根据 catalog 估计 (假设时间上均匀分布)
+        """
+        total = 0
+        for i in np.flatnonzero((self.max_time >= start) & (self.min_time <= end)).tolist():
+            if i in self.opened:
+                total += self.opened[i].count_between(start, end)
+                continue
+            lo, hi = max(self.min_time[i], start), min(self.max_time[i], end)
+            span = self.max_time[i] - self.min_time[i] + 1
+            total += int(np.ceil(self.rows[i] * (hi - lo + 1) / span))
+        return total
+
+
+def open_multi_day_sources(catalog, tasks, date_range=(None, None)):
+    """
+    tasks 与 ParallelLoader.open_sources 相同 (open_source 的参数, 其中 file_dir 被忽略)
+    返回每个 task 在 date_range=(start_date, end_date) 内的 MultiDaySource, 某个 symbol 没有文件时该数据源为空
+    """
+    start_date, end_date = date_range
+    sources = []
+    for store_cls, symbol, _, kind, columns, is_csv, read_mode, cache_dir, clean in tasks:
+        files = catalog.find(symbol, kind, is_csv, start_date, end_date)
+        sources.append(MultiDaySource(store_cls, symbol, files, kind, columns, is_csv, read_mode, cache_dir, clean))
+    return sources
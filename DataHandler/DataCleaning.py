@@ -0,0 +1,164 @@
+# DataCleaning.py
+
+"""
+数据清洗与校验
+
+每个数据文件在打开时 (read_mode='full'/'mmap' 每个文件一次, 'window' 每个窗口一次) 向量化地完成:
+    1. 按 time 稳定排序, 统计乱序的行数
+    2. 删除 price/qty 不是有限数的行
+    3. trade: qty <= 0 或者 price <= 0, maker 不是 BUY/SELL 的行
+       LOB:   bid1 >= ask1 (crossed), bidqty1/askqty1 <= 0 的行
+       policy='drop' 时删除, policy='flag' 时保留但在报告中计数
+    4. LOB 同一个时间戳只保留最后一行
+清洗之后的数据直接用 from_arrays 构造 store, 回放时不再做任何检查
+清洗的结果记录在 QualityReport 中, 保存为 store.quality_report (mmap 缓存中保存在 meta.json)
+"""
+
+import numpy as np
+
+from DataHandler.MarketDataStore import LOBStore, time_groups
+
+
+POLICIES = ('drop', 'flag')
+# 报告中的计数项
+QUALITY_ITEMS = ('out_of_order', 'non_finite', 'zero_qty', 'bad_price', 'unknown_side', 'crossed', 'duplicated_time')
+
+
+class QualityReport(object):
+    """
+    一个数据源的清洗报告: 输入/输出的行数以及每一项问题的行数
+    """
+
+    def __init__(self, symbol=None, kind=None, policy='drop', rows_in=0, rows_out=0, **counts):
+        self.symbol = symbol
+        self.kind = kind
+        self.policy = policy
+        self.rows_in = rows_in
+        self.rows_out = rows_out
+        self.counts = {item: int(counts.get(item, 0)) for item in QUALITY_ITEMS}
+
+    def merge(self, other):
+        """
+        累加另一个报告 (例如同一个文件的另一个窗口)
+        """
+        self.rows_in += other.rows_in
+        self.rows_out += other.rows_out
+        for item in QUALITY_ITEMS:
+            self.counts[item] += other.counts[item]
+        return self
+
+    def is_clean(self):
+        return not any(self.counts[item] for item in QUALITY_ITEMS if item != 'duplicated_time')
+
+    def to_dict(self):
+        return dict(symbol=self.symbol, kind=self.kind, policy=self.policy,
+                    rows_in=self.rows_in, rows_out=self.rows_out, **self.counts)
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(**d)
+
+    def __repr__(self):
+        issues = ', '.join('%s %d' % (item, n) for item, n in self.counts.items() if n)
+        return '%s %s: rows %d -> %d%s' % (self.symbol, self.kind, self.rows_in, self.rows_out,
+                                           ' (%s)' % issues if issues else '')
+
+
+def _top_of_book(arrays):
+    """
+    LOBStore 为 bid1/ask1 列, L2SnapshotStore 为二维数组的第一档
+    """
+    if 'bid1' in arrays:
+        return arrays['bid1'], arrays['bidqty1'], arrays['ask1'], arrays['askqty1']
+    return arrays['bid_px'][:, 0], arrays['bid_qty'][:, 0], arrays['ask_px'][:, 0], arrays['ask_qty'][:, 0]
+
+
+def _flag(report, item, mask):
+    n = int(np.count_nonzero(mask))
+    report.counts[item] += n
+    return n
+
+
+def _checks(store_cls, arrays, report, side_known):
+    """
+    返回 (必须删除的行, policy='drop' 时删除的行)
+    """
+    if 'is_buyer_maker' in arrays:
+        price, qty = arrays['price'], arrays['qty']
+        invalid = ~(np.isfinite(price) & np.isfinite(qty))
+        _flag(report, 'non_finite', invalid)
+        zero = ~invalid & (qty <= 0)
+        bad_price = ~invalid & (price <= 0)
+        _flag(report, 'zero_qty', zero)
+        _flag(report, 'bad_price', bad_price)
+        suspect = zero | bad_price
+        if side_known is not None:
+            _flag(report, 'unknown_side', ~side_known)
+            suspect |= ~side_known
+        return invalid, suspect
+    if issubclass(store_cls, LOBStore):
+        bid1, bidqty1, ask1, askqty1 = _top_of_book(arrays)
+        invalid = ~(np.isfinite(bid1) & np.isfinite(ask1) & np.isfinite(bidqty1) & np.isfinite(askqty1))
+        _flag(report, 'non_finite', invalid)
+        zero = ~invalid & ((bidqty1 <= 0) | (askqty1 <= 0))
+        crossed = ~invalid & (bid1 >= ask1)
+        _flag(report, 'zero_qty', zero)
+        _flag(report, 'crossed', crossed)
+        return invalid, zero | crossed
+    return None, None
+
+
+def clean_arrays(store_cls, symbol, time, arrays, policy='drop', report=None, side_known=None):
+    """
+    清洗 raw_columns 给出的数组, 返回 (store, report)
+    side_known: trade 的 maker 列是否为 BUY/SELL (bool 数组), None 表示不检查
+    """
+    if policy not in POLICIES:
+        raise ValueError('unknown cleaning policy: %s' % policy)
+    if report is None:
+        report = QualityReport(symbol, None, policy)
+    time = np.ascontiguousarray(time, dtype=np.int64)
+    report.rows_in += len(time)
+    # 1. 排序
+    if len(time) > 1:
+        out_of_order = np.diff(time) < 0
+        if _flag(report, 'out_of_order', out_of_order):
+            order = np.argsort(time, kind='stable')
+            time = time[order]
+            arrays = {name: values[order] for name, values in arrays.items()}
+            if side_known is not None:
+                side_known = side_known[order]
+    # 2/3. 删除 (或者标记) 有问题的行
+    invalid, suspect = _checks(store_cls, arrays, report, side_known)
+    if invalid is not None:
+        drop = invalid | suspect if policy == 'drop' else invalid
+        if drop.any():
+            keep = ~drop
+            time = time[keep]
+            arrays = {name: values[keep] for name, values in arrays.items()}
+    # 4. LOB 同一个时间戳只保留最后一行
+    group_time, group_start = time_groups(time)
+    if issubclass(store_cls, LOBStore) and len(group_time) < len(time):
+        report.counts['duplicated_time'] += len(time) - len(group_time)
+        last = group_start[1:] - 1
+        time = time[last]
+        arrays = {name: values[last] for name, values in arrays.items()}
+        group_time, group_start = time_groups(time)
+    report.rows_out += len(time)
+    arrays = {name: np.ascontiguousarray(values) for name, values in arrays.items()}
+    return store_cls.from_arrays(symbol, time, arrays, group_time, group_start), report
+
+
+def clean_frame(store_cls, symbol, df, columns, policy='drop', kind=None, report=None):
+    """
+    从 DataFrame 构造清洗后的 store, 返回 (store, report)
+    """
+    time, arrays = store_cls.raw_columns(df, columns)
+    side_known = None
+    if 'is_buyer_maker' in arrays:
+        maker = df[columns[3]]
+        if maker.dtype != bool:
+            side_known = maker.isin(['BUY', 'SELL']).to_numpy(dtype=bool)
+    if report is None:
+        report = QualityReport(symbol, kind, policy)
+    return clean_arrays(store_cls, symbol, time, arrays, policy, report, side_known)
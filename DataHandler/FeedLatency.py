@@ -0,0 +1,133 @@
+# FeedLatency.py
+
+"""
+行情推送延迟 (feed latency) 的模拟
+
+回测默认在交易所时间 (timestamp) 推送数据, 对跨交易所的 lead-lag 策略过于乐观
+这里为每个交易所的行情设置延迟模型, 得到每条数据的接收时间 receive_time, 并按接收时间推送:
+
+1. 延迟模型 (向量化, 每个窗口调用一次):
+    ConstantLatency(latency)         固定延迟 (ms)
+    EmpiricalLatency(samples, seed)  从实际测量的延迟样本中有放回地抽样
+    ColumnLatency(column)            文件中的接收时间列
+2. 同一个数据流 (一个 symbol 的 trade 或 LOB) 按顺序到达 (FIFO): receive_time 为前缀最大值, 单调不减
+3. FeedLatencySimulator 把每个窗口的 store 改为按 receive_time 分组, 由 TimelineMerger 的堆按接收时间归并推送
+   接收时间晚于窗口结束的数据保留到下一个窗口 (下一个窗口的数据接收时间都晚于该窗口结束), 保证跨窗口的推送顺序
+"""
+
+import numpy as np
+
+from DataHandler.MarketDataStore import time_groups
+
+
+class ConstantLatency(object):
+    """
+    固定延迟 latency (ms)
+    """
+
+    def __init__(self, latency):
+        self.latency = int(latency)
+
+    def sample(self, store):
+        return np.full(len(store), self.latency, dtype=np.int64)
+
+
+class EmpiricalLatency(object):
+    """
+    从延迟样本 samples (ms) 中有放回地抽样, seed 固定时回测结果可以复现
+    """
+
+    def __init__(self, samples, seed=None):
+        self.samples = np.asarray(samples, dtype=np.int64)
+        if len(self.samples) == 0 or (self.samples < 0).any():
+            raise ValueError('latency samples should be non-empty and >= 0')
+        self.rng = np.random.default_rng(seed)
+
+    def sample(self, store):
+        return self.rng.choice(self.samples, len(store))
+
+
+class ColumnLatency(object):
+    """
+    使用文件中的接收时间列 column, handler 会额外读取该列
+    """
+
+    def __init__(self, column='receive_time'):
+        self.column = column
+
+    def sample(self, store):
+        if store.receive_time is None:
+            raise ValueError('receive time column %s is not loaded' % self.column)
+        return np.maximum(store.receive_time - store.time, 0)
+
+
+class FeedLatencySimulator(object):
+    """
+    models: 每个数据流的延迟模型 (与 stores 的顺序一致), None 表示没有延迟
+    apply 必须按照窗口的顺序调用 (在 prefetch 的后台线程中调用也是顺序的)
+    """
+
+    def __init__(self, models):
+        self.models = list(models)
+        n = len(self.models)
+        self.pending = [None] * n                         # 还没有送达的数据 (store)
+        self.last_receive = [np.iinfo(np.int64).min] * n  # 每个数据流最后一条数据的接收时间
+
+    def _receive_times(self, i, store):
+        receive = store.time + self.models[i].sample(store)
+        if len(receive):
+            receive[0] = max(receive[0], self.last_receive[i])
+            np.maximum.accumulate(receive, out=receive)
+            self.last_receive[i] = int(receive[-1])
+        return receive
+
+    def _deliver(self, i, cutoff):
+        """
+        取出数据流 i 中接收时间 <= cutoff 的数据, 其余的继续等待
+        """
+        store = self.pending[i]
+        k = int(np.searchsorted(store.receive_time, cutoff, side='right'))
+        columns = store.column_arrays(k)
+        self.pending[i] = store.from_arrays(store.symbol, store.time[k:], columns,
+                                            *time_groups(columns['receive_time']))
+        columns = store.column_arrays(0, k)
+        return store.from_arrays(store.symbol, store.time[:k], columns,
+                                 *time_groups(columns['receive_time']))
+
+    def apply(self, stores, cutoff):
+        """
+        stores 为窗口 [start, cutoff] 内每个数据流的 store
+        返回按接收时间分组的 store, 只包含接收时间 <= cutoff 的数据
+        """
+        outcomes = []
+        for i, store in enumerate(stores):
+            if self.models[i] is None:
+                outcomes.append(store)
+                continue
+            store = store.with_receive_time(self._receive_times(i, store))
+            if self.pending[i] is not None and len(self.pending[i]):
+                store = _join(self.pending[i], store)
+            self.pending[i] = store
+            outcomes.append(self._deliver(i, cutoff))
+        return outcomes
+
+    def flush(self):
+        """
+        所有窗口都读取完之后, 返回还没有送达的数据; 没有时返回 None
+        """
+        if not any(store is not None and len(store) for store in self.pending):
+            return None
+        outcomes = []
+        for i, store in enumerate(self.pending):
+            outcomes.append(None if store is None or not len(store) else self._deliver(i, np.iinfo(np.int64).max))
+        return outcomes
+
+
+def _join(a, b):
+    """
+    拼接同一个数据流前后两段按接收时间分组的 store (a 的接收时间都不晚于 b)
+    """
+    columns_a, columns_b = a.column_arrays(), b.column_arrays()
+    columns = {name: np.concatenate([columns_a[name], columns_b[name]]) for name in columns_a}
+    return a.from_arrays(a.symbol, np.concatenate([a.time, b.time]), columns,
+                         *time_groups(columns['receive_time']))
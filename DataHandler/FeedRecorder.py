@@ -0,0 +1,332 @@
+# FeedRecorder.py
+
+"""
+行情录制与回放
+
+1. FeedRecorder: 把实时 (或者 ReplayFeedServer 回放的) trade/LOB 数据分批追加写入二进制日志, 每个数据流一个文件
+       record_dir/btc_usdt_bybit_trade.bin     数据
+       record_dir/btc_usdt_bybit_trade.idx     稀疏的时间索引
+2. RecordedFeedReader: 读取录制的日志, 接口与 ColumnStore/ParquetWindowReader 一致
+   历史数据的 handler 使用 read_mode='recorded', file_dir=record_dir 即可回放录制的数据
+
+.bin 文件格式 (little endian, 只追加):
+    文件头: MAGIC (8 bytes) + uint32 长度 + 行的 dtype 描述 (json)
+    之后每一批数据: 批次头 (uint32 payload 字节数, uint32 行数, int64 第一行 time, int64 最后一行 time) + payload
+    payload 为结构化数组 (time, receive_time, store 的各列) 的原始字节, 回放时逐字节还原
+    程序中断时最后一批可能不完整, 读取时忽略, 重新打开录制时截断
+
+.idx 文件为 (time, offset) 的数组: 每写入至少 index_every 行之后, 在下一批的开头记录一次 (该批第一行的 time, 文件偏移)
+按时间定位时在索引上二分 (O(log n)), 之后只顺序读取相邻的少量批次, 不需要从文件开头扫描
+
+每个数据流的 time 需要单调不减 (同一个交易所同一个 symbol 的推送本来就是有序的)
+"""
+
+import json
+import os
+import struct
+import numpy as np
+
+from DataHandler.MarketDataStore import TradeStore, LOBStore
+
+
+MAGIC = b'LTFEED01'
+_BATCH_HEADER = struct.Struct('<IIqq')
+_INDEX_DTYPE = np.dtype([('time', '<i8'), ('offset', '<i8')])
+STORE_CLASSES = {'trade': TradeStore, 'LOB': LOBStore}
+
+
+def record_dtype(store_cls):
+    """
+    录制文件中一行数据的结构化 dtype: time, receive_time, store 的各列
+    """
+    fields = [('time', '<i8'), ('receive_time', '<i8')]
+    fields += [(name, np.dtype(dtype).newbyteorder('<').str) for name, dtype in zip(store_cls.fields, store_cls.field_dtypes)]
+    return np.dtype(fields)
+
+
+def record_paths(symbol, record_dir, kind):
+    stem = os.path.join(record_dir, '%s_%s' % (symbol, kind))
+    return stem + '.bin', stem + '.idx'
+
+
+def _file_header(dtype):
+    descr = json.dumps(dtype.descr).encode()
+    return MAGIC + struct.pack('<I', len(descr)) + descr
+
+
+def _read_file_header(f, dtype, path):
+    """
+    检查文件头, 返回第一批数据的偏移
+    """
+    head = f.read(len(MAGIC) + 4)
+    if len(head) < len(MAGIC) + 4 or head[:len(MAGIC)] != MAGIC:
+        raise ValueError('%s is not a recorded feed file' % path)
+    n = struct.unpack('<I', head[len(MAGIC):])[0]
+    descr = f.read(n)
+    if json.loads(descr.decode()) != json.loads(json.dumps(dtype.descr)):
+        raise ValueError('%s was recorded with different columns' % path)
+    return len(MAGIC) + 4 + n
+
+
+def _iter_batches(f, offset, with_payload=True):
+    """
+    从 offset 开始顺序读取批次, 产生 (offset, 行数, 第一行 time, 最后一行 time, payload)
+    最后一批不完整时停止; with_payload=False 时跳过 payload, 只读取批次头
+    """
+    f.seek(offset)
+    while True:
+        head = f.read(_BATCH_HEADER.size)
+        if len(head) < _BATCH_HEADER.size:
+            return
+        nbytes, n, first_time, last_time = _BATCH_HEADER.unpack(head)
+        if with_payload:
+            payload = f.read(nbytes)
+            if len(payload) < nbytes:
+                return
+        else:
+            payload = None
+            f.seek(nbytes, os.SEEK_CUR)
+            if f.tell() > os.fstat(f.fileno()).st_size:
+                return
+        yield offset, n, first_time, last_time, payload
+        offset += _BATCH_HEADER.size + nbytes
+
+
+class _StreamWriter(object):
+    """
+    一个数据流 (一个 symbol 的 trade 或 LOB) 的录制文件
+    """
+
+    def __init__(self, store_cls, symbol, record_dir, index_every):
+        self.dtype = record_dtype(store_cls)
+        self.index_every = index_every
+        self.path, self.index_path = record_paths(symbol, record_dir, kind_of(store_cls))
+        self.last_time = None
+        self.since_index = None     # 上一个索引点之后写入的行数, None 表示还没有索引点
+        self.data = open(self.path, 'a+b')
+        self.index = open(self.index_path, 'a+b')
+        self._recover()
+
+    def _recover(self):
+        """
+        打开已有的文件时: 截断不完整的最后一批, 丢弃超出文件的索引点, 恢复 last_time 和 since_index
+        """
+        self.data.seek(0, os.SEEK_END)
+        if self.data.tell() == 0:
+            self.data.write(_file_header(self.dtype))
+            self.data.flush()
+            self.index.truncate(0)
+            return
+        self.data.seek(0)
+        start = _read_file_header(self.data, self.dtype, self.path)
+        index = _load_index(self.index_path)
+        while True:
+            end = int(index['offset'][-1]) if len(index) else start
+            rows = 0
+            for offset, n, _, last_time, _ in _iter_batches(self.data, end, with_payload=False):
+                end = offset + _BATCH_HEADER.size + n * self.dtype.itemsize
+                self.last_time = last_time
+                rows += n
+            if rows or not len(index):
+                break
+            index = index[:-1]
+        self.since_index = rows if len(index) else None
+        self.index.truncate(len(index) * _INDEX_DTYPE.itemsize)
+        self.data.truncate(end)
+
+    def write(self, rows):
+        if not len(rows):
+            return
+        time = rows['time']
+        if (self.last_time is not None and time[0] < self.last_time) or (len(time) > 1 and (np.diff(time) < 0).any()):
+            raise ValueError('%s: time should be non-decreasing' % self.path)
+        offset = self.data.seek(0, os.SEEK_END)
+        payload = rows.tobytes()
+        self.data.write(_BATCH_HEADER.pack(len(payload), len(rows), int(time[0]), int(time[-1])))
+        self.data.write(payload)
+        self.data.flush()
+        # 批次写入完整之后再写索引, 索引不会指向不完整的批次
+        if self.since_index is None or self.since_index >= self.index_every:
+            self.index.write(np.array([(int(time[0]), offset)], dtype=_INDEX_DTYPE).tobytes())
+            self.index.flush()
+            self.since_index = 0
+        self.since_index += len(rows)
+        self.last_time = int(time[-1])
+
+    def close(self):
+        self.data.close()
+        self.index.close()
+
+
+def kind_of(store_cls):
+    for kind, cls in STORE_CLASSES.items():
+        if issubclass(store_cls, cls) and store_cls.fields == cls.fields:
+            return kind
+    raise ValueError('%s can not be recorded' % store_cls.__name__)
+
+
+def _load_index(index_path):
+    try:
+        index = np.fromfile(index_path, dtype=_INDEX_DTYPE)
+    except (OSError, ValueError):
+        return np.empty(0, dtype=_INDEX_DTYPE)
+    return index
+
+
+class FeedRecorder(object):
+    """
+    record_dir: 录制文件的目录, 已有的文件会继续追加
+    batch_rows: 每个数据流缓存多少行后写入一批 (flush/close 时写入剩余的数据)
+    index_every: 稀疏索引的间隔 (行数)
+    """
+
+    def __init__(self, record_dir, batch_rows=1000, index_every=10000):
+        os.makedirs(record_dir, exist_ok=True)
+        self.record_dir = record_dir
+        self.batch_rows = batch_rows
+        self.index_every = index_every
+        self.writers = {}       # (symbol, kind) -> _StreamWriter
+        self.pending = {}       # (symbol, kind) -> [结构化数组, ...]
+        self.pending_rows = {}
+
+    def record(self, store_cls, symbol, time, receive_time, **columns):
+        """
+        录制一个数据流的若干行, columns 为 store_cls.fields 中的每一列 (数组)
+        """
+        key = (symbol, kind_of(store_cls))
+        if key not in self.writers:
+            self.writers[key] = _StreamWriter(store_cls, symbol, self.record_dir, self.index_every)
+            self.pending[key] = []
+            self.pending_rows[key] = 0
+        rows = np.empty(len(time), dtype=self.writers[key].dtype)
+        rows['time'] = time
+        rows['receive_time'] = receive_time
+        for name in store_cls.fields:
+            rows[name] = columns[name]
+        self.pending[key].append(rows)
+        self.pending_rows[key] += len(rows)
+        if self.pending_rows[key] >= self.batch_rows:
+            self._flush(key)
+
+    def record_store(self, store, lo=0, hi=None):
+        """
+        录制 store 中 [lo, hi) 行, store 没有 receive_time 时以 time 作为接收时间
+        """
+        hi = len(store) if hi is None else hi
+        columns = store.column_arrays(lo, hi)
+        receive_time = columns.pop('receive_time', store.time[lo:hi])
+        self.record(type(store), store.symbol, store.time[lo:hi], receive_time, **columns)
+
+    def _flush(self, key):
+        if self.pending_rows[key]:
+            self.writers[key].write(np.concatenate(self.pending[key]))
+            self.pending[key] = []
+            self.pending_rows[key] = 0
+
+    def flush(self):
+        for key in self.writers:
+            self._flush(key)
+
+    def close(self):
+        self.flush()
+        for writer in self.writers.values():
+            writer.close()
+        self.writers = {}
+
+
+class RecordedFeedReader(object):
+    """
+    录制文件的数据源, 与 ColumnStore/ParquetWindowReader 接口一致 (read_window, next_time_after, last_time, count_between)
+    只在内存中保存稀疏索引, 每次读取时按索引定位后顺序读取需要的批次
+    """
+    quality_report = None
+
+    def __init__(self, store_cls, symbol, record_dir):
+        self.store_cls = store_cls
+        self.symbol = symbol
+        self.dtype = record_dtype(store_cls)
+        self.path, self.index_path = record_paths(symbol, record_dir, kind_of(store_cls))
+        with open(self.path, 'rb') as f:
+            self.data_start = _read_file_header(f, self.dtype, self.path)
+        self.index = _load_index(self.index_path)
+        self._last_time = None
+
+    @property
+    def row_nbytes(self):
+        return self.store_cls.row_nbytes + 8
+
+    def _seek(self, t):
+        """
+        可能包含 time >= t 的第一批数据的偏移: 第一行 time < t 的最后一个索引点
+        """
+        i = int(np.searchsorted(self.index['time'], t, side='left')) - 1
+        return int(self.index['offset'][i]) if i >= 0 else self.data_start
+
+    def _batches(self, start=None, with_payload=True, offset=None):
+        """
+        从可能包含 time >= start 的批次开始顺序读取, start 为 None 时从文件开头 (或者 offset) 开始
+        """
+        if offset is None:
+            offset = self.data_start if start is None else self._seek(start)
+        with open(self.path, 'rb') as f:
+            yield from _iter_batches(f, offset, with_payload)
+
+    def _rows(self, payload):
+        return np.frombuffer(payload, dtype=self.dtype)
+
+    def read_window(self, start, end):
+        chunks = []
+        for _, _, first_time, last_time, payload in self._batches(start):
+            if first_time > end:
+                break
+            if last_time < start:
+                continue
+            rows = self._rows(payload)
+            if first_time < start or last_time > end:
+                time = rows['time']
+                rows = rows[np.searchsorted(time, start, side='left'):np.searchsorted(time, end, side='right')]
+            chunks.append(rows)
+        rows = np.concatenate(chunks) if chunks else np.empty(0, dtype=self.dtype)
+        return self.store_cls(self.symbol, rows['time'], receive_time=rows['receive_time'],
+                              **{name: rows[name] for name in self.store_cls.fields})
+
+    def next_time_after(self, after=None):
+        if after is None:
+            for _, _, first_time, _, _ in self._batches(with_payload=False):
+                return first_time
+            return None
+        for _, _, first_time, last_time, payload in self._batches(after + 1):
+            if last_time <= after:
+                continue
+            if first_time > after:
+                return first_time
+            time = self._rows(payload)['time']
+            return int(time[np.searchsorted(time, after, side='right')])
+        return None
+
+    def last_time(self):
+        if self._last_time is None:
+            offset = int(self.index['offset'][-1]) if len(self.index) else self.data_start
+            for _, _, _, last_time, _ in self._batches(with_payload=False, offset=offset):
+                self._last_time = last_time
+        return self._last_time
+
+    def count_between(self, start, end):
+        """
+        完全在 [start, end] 内的批次只读取批次头, 边界上的批次读取 time 列计数
+        """
+        total = 0
+        with open(self.path, 'rb') as f:
+            for offset, n, first_time, last_time, _ in _iter_batches(f, self._seek(start), with_payload=False):
+                if first_time > end:
+                    break
+                if last_time < start:
+                    continue
+                if first_time >= start and last_time <= end:
+                    total += n
+                    continue
+                f.seek(offset + _BATCH_HEADER.size)
+                time = self._rows(f.read(n * self.dtype.itemsize))['time']
+                total += int(np.searchsorted(time, end, side='right') - np.searchsorted(time, start, side='left'))
+                f.seek(offset + _BATCH_HEADER.size + n * self.dtype.itemsize)
+        return total
@@ -0,0 +1,320 @@
+# HistoricHourlyDataHandler.py
+
+"""
+分窗口读取并推送历史数据的 DataHandler 基类
+HistoricTradeLOBHourlyDataHandler 以及 HistoricLOBHourlyDataHandler 共用的读取部分:
+
+1. 打开数据源: read_mode/cache_dir/n_workers/date_range/clean/shared_data, 行情延迟模型 (feed_latency)
+2. 窗口: window_rows/memory_budget/bucket_ms 决定每个窗口的范围, prefetch 时由后台线程预读取
+3. 回放: 每个窗口的数据流由 TimelineMerger 归并, 每次取出一个时间戳 (或者一个 bucket) 的数据
+4. close(): 停止预读取线程以及读取窗口的进程池
+
+子类给出每个 symbol 有哪些数据流 (_stream_specs), 初始化每个 symbol 的数据结构 (_register_sources),
+并实现推送 (_get_new_data) 以及查询数据的接口
+数据流序号: symbol 序号 * 数据流数量 + 数据流在 _stream_specs 中的序号
+"""
+
+import queue
+from typing import List, Tuple, Dict
+import sys
+sys.path.append("..")
+
+from event import MARKET_EVENT
+from object import DataHandler, DataHandlerError
+from DataHandler.MarketDataStore import next_window, bucket_end, window_rows_from_budget
+from DataHandler.TimelineMerger import TimelineMerger
+from DataHandler.WindowPrefetcher import WindowPrefetcher
+from DataHandler.ParallelLoader import open_sources, WindowReaderPool
+from DataHandler.DataCatalog import DataCatalog, open_multi_day_sources
+from DataHandler.MarketState import MarketState
+from DataHandler.FeedLatency import FeedLatencySimulator
+from DataHandler.SharedMarketData import attach
+
+
+class HistoricHourlyDataHandler(DataHandler):
+    """
+    从本地文件中分窗口读取历史数据的 DataHandler 基类, 见模块说明
+    """
+    def __init__(self, events:queue.Queue, symbol_list:List[str], exchange_list:List[str],
+                 file_dir: str, is_csv:bool = True, read_mode:str = 'full', cache_dir:str = None,
+                 prefetch:int = 0, n_workers:int = 1, window_rows:int = None,
+                 memory_budget:int = None, history_depth:int = 1000,
+                 date_range:Tuple[str, str] = None, bucket_ms:int = None,
+                 feed_latency:Dict[str, object] = None, clean:str = 'drop',
+                 shared_data:List[dict] = None) -> None:
+        """
+        Parameters:
+        events - The Event Queue (EventQueue).
+        file_dir - 数据文件所在的目录, 文件名为 'symbol_exchange_{trade,LOB}.csv/parquet'
+        symbol_list - A list of symbol strings.
+        exchange_list - A list of symbol exchange corresponding to the symbol_list
+        read_mode - 'full' 每个文件读取一次后在内存中切片; 'window' (仅 parquet) 每小时只读取窗口内的 row group 和列;
+                    'mmap' 使用内存映射的二进制缓存, 重复回测同一天的数据时不再解析文件;
+                    'recorded' 回放 FeedRecorder 录制的数据, file_dir 为录制目录
+        cache_dir - read_mode='mmap' 时缓存的位置, 默认为 file_dir/.cache
+        prefetch - 大于 0 时开启后台线程预读取, 最多提前准备 prefetch 个小时的数据; 0 为在主线程中读取
+        n_workers - 大于 1 时在进程池中并行解码每个 symbol 的文件
+        window_rows - 每次 load 的窗口最多包含的行数 (所有数据流之和), None 时为固定的一小时窗口
+        memory_budget - 窗口数据的内存预算 (bytes), 会换算为 window_rows, 与 window_rows 同时给出时取较小者
+        history_depth - 每个 symbol 保存最近多少条历史, 用于 get_latest_ticks 等
+        date_range - (start_date, end_date), 例如 ('20240101', '20240310'), None 表示不限制起止日期
+                     给出时 file_dir 为按日期分目录的根目录 (file_dir/20240101/...), 由 DataCatalog 把多天的文件串联为连续的回测
+        bucket_ms - 给出时按 bucket_ms 毫秒分桶推送: 同一个 bucket 内所有 symbol 的数据合并为一次 MarketEvent,
+                    latest_symbol_exchange_*_data 为该 bucket 内的全部数据, backtest_now 为 bucket 内最后一个时间戳;
+                    None 时每个时间戳推送一次
+        feed_latency - 每个交易所 (key 为 exchange 或者 symbol_exchange) 的行情延迟模型, 见 FeedLatency
+                       (ConstantLatency/EmpiricalLatency/ColumnLatency); 给出时数据的 receive_time 为模拟的接收时间,
+                       按接收时间推送, backtest_now 为接收时间
+        clean - 数据清洗 (见 DataCleaning), 每个文件只在打开时做一次: 'drop' 删除 crossed/数量为 0 等有问题的行,
+                'flag' 只在报告中计数, None 不清洗; 报告通过 get_quality_reports 获取
+        shared_data - SharedMarketData.manifest, 给出时直接使用父进程放在共享内存中的数据 (只读, 不复制),
+                      其它读取参数需要与创建 SharedMarketData 时一致
+        """
+        self.events = events
+        self.file_dir = file_dir
+        self.is_csv = is_csv
+        self.read_mode = read_mode
+        self.cache_dir = cache_dir
+        self.prefetch = prefetch
+        self.n_workers = n_workers
+        self.window_rows = window_rows
+        self.memory_budget = memory_budget
+        self.history_depth = history_depth
+        self.date_range = date_range
+        self.bucket_ms = bucket_ms
+        self.feed_latency = feed_latency
+        self.clean = clean
+        self.shared_data = shared_data
+        self._latency_simulator = None        # FeedLatencySimulator, 没有延迟模型时为 None
+        self._window_reader_pool = None
+        self._opened_sources = []             # 按数据流序号排列的打开的数据源 (数据源缓存/共享内存中的对象)
+        self._data_sources = []               # 回放使用的数据源, 由 _prepare_sources 给出 (默认即打开的数据源)
+        self.symbol_exchange_list = self._agg_symbol_exchange_list(symbol_list, exchange_list)
+        print('backtest on: ', self.symbol_exchange_list)
+
+        self.market_state = MarketState(self.symbol_exchange_list)   # 所有 symbol 最新行情的共享状态 (O(1) 读取)
+        # 时间相关的指标
+        self.start_time = None
+        self._merger = None                   # 当前小时数据 (store 切片) 的 k 路归并, 替代全局的 time index
+        self.hourly_load_list = None
+        self.backtest_now = None
+        self.continue_backtest = True
+        self.hourly_start = -1
+        self.hourly_end = -1
+
+        # 需要处理的数据队列
+        self.market_data_q = queue.Queue()    # MarketData队列（带数据）
+
+    def _initialize_data(self):
+        """
+        打开数据源并准备窗口, 由子类在初始化完自己的数据结构之后调用
+        """
+        print('/*----- start initialize the DataHandler -----*/')
+        # 打开每个 symbol 的数据源
+        self._open_data_sources()
+        # 获取需要迭代的
+        self._get_hourly_load_list()
+        print('/*----- DataHandler initialization ends -----*/')
+
+    def _stream_specs(self):
+        """
+        每个 symbol 的数据流 [(store 类, kind, 需要的列), ...], 按推送优先级排列
+        kind 为文件名中的 'trade'/'LOB'
+        """
+        raise NotImplementedError("Should implement _stream_specs()")
+
+    def _prepare_sources(self, sources):
+        """
+        打开的数据源在回放之前的转换 (例如由逐档增量重建订单簿), 返回回放使用的数据源, 默认不转换
+        """
+        return sources
+
+    def _register_sources(self, sources):
+        """
+        数据源打开之后初始化每个 symbol 的数据结构, sources 按数据流序号排列 (同 _get_data_sources())
+        """
+        raise NotImplementedError("Should implement _register_sources()")
+
+    def _data_source_tasks(self):
+        """
+        open_source 的参数列表 (按数据流序号排列) 以及每个数据流的延迟模型
+        """
+        specs = self._stream_specs()
+        tasks = []
+        models = []
+        for s in self.symbol_exchange_list:
+            model = self._get_latency_model(s)
+            # ColumnLatency 需要额外读取接收时间列
+            extra = [model.column] if getattr(model, 'column', None) else []
+            for store_cls, kind, columns in specs:
+                tasks.append((store_cls, s, self.file_dir, kind, list(columns) + extra, self.is_csv, self.read_mode, self.cache_dir, self.clean))
+                models.append(model)
+        return tasks, models
+
+    def _open_data_sources(self):
+        """
+        打开每个 symbol 的数据源
+        read_mode='full' 时每个文件在整个回测中只读取一次, 读取后保存为按列存储的 store, 之后每小时只做切片
+        read_mode='window' 时这里只读取 parquet 的统计信息
+        read_mode='mmap' 时直接映射打开缓存, 缓存失效时重新生成
+        date_range 不为 None 时根据 catalog 打开多天的数据源, 与回测区间没有交集的文件不会被打开
+        """
+        # 读取 csv/parquet 数据 (只读取需要的列, LOB 在 LOBStore 中删除重复的时间)
+        # n_workers > 1 时每个文件在进程池中并行解码
+        tasks, models = self._data_source_tasks()
+        if any(model is not None for model in models):
+            self._latency_simulator = FeedLatencySimulator(models)
+        # 共享内存中的数据放入进程内的数据源缓存, open_sources 直接返回
+        shared = attach(self.shared_data) if self.shared_data is not None else {}
+        if self.date_range is not None:
+            # 多天的数据: 每天的文件在回测推进到该天时才打开
+            sources = open_multi_day_sources(DataCatalog(self.file_dir), tasks, self.date_range)
+        else:
+            sources = open_sources(tasks, self.n_workers)
+        if self.shared_data is not None:
+            shared_ids = {id(store) for store in shared.values()}
+            if any(id(source) not in shared_ids for source in sources):
+                raise DataHandlerError(' shared_data 与 handler 的读取参数不一致, 请使用创建 SharedMarketData 时的参数')
+        self._opened_sources = sources
+        self._data_sources = self._prepare_sources(sources)
+        self._register_sources(self._data_sources)
+
+        # read_mode='window' 时每个窗口的读取也在进程池中进行
+        if self.read_mode == 'window' and self.n_workers > 1:
+            self._window_reader_pool = WindowReaderPool(self.n_workers)
+
+        for report in self.get_quality_reports().values():
+            if report.rows_in:
+                print('data quality:', report)
+
+    def get_quality_reports(self):
+        """
+        每个数据源的清洗报告 (DataCleaning.QualityReport), key 为 'symbol_exchange_{trade,LOB}'
+        read_mode='window' 以及多天的数据源为已经读取部分的累计
+        """
+        kinds = [kind for _, kind, _ in self._stream_specs()]
+        reports = {}
+        for i, source in enumerate(self._opened_sources):
+            if source.quality_report is not None:
+                s = self.symbol_exchange_list[i // len(kinds)]
+                reports['%s_%s' % (s, kinds[i % len(kinds)])] = source.quality_report
+        return reports
+
+    def _get_latency_model(self, s):
+        """
+        symbol_exchange 的延迟模型, 优先使用 symbol_exchange 为 key 的设置
+        """
+        if not self.feed_latency:
+            return None
+        return self.feed_latency.get(s, self.feed_latency.get(s.split('_')[-1]))
+
+    def _get_data_sources(self):
+        """
+        按数据流序号 (推送优先级) 排列的回放使用的数据源
+        """
+        return self._data_sources
+
+    def _get_opened_sources(self):
+        """
+        按数据流序号排列的打开的数据源 (_prepare_sources 转换之前), 与数据源缓存中的对象一致
+        """
+        return self._opened_sources
+
+    def _get_hourly_load_list(self):
+        """
+        用来生成我们每一个小时load一次数据的
+        窗口是惰性生成的, 不需要全局的 time index
+        给出 window_rows/memory_budget 时窗口的长度根据行数决定, 而不是固定的一小时
+        prefetch > 0 时由后台线程提前读取之后的窗口
+        """
+        if self.memory_budget is not None:
+            # 同时在内存中的窗口: 正在推送的窗口, 队列中预读取的窗口以及后台线程正在读取的窗口
+            n_windows = self.prefetch + 2 if self.prefetch else 1
+            budget_rows = window_rows_from_budget(self._get_data_sources(), self.memory_budget, n_windows)
+            self.window_rows = budget_rows if self.window_rows is None else min(self.window_rows, budget_rows)
+        first_window = next_window(self._get_data_sources(), max_rows=self.window_rows, bucket=self.bucket_ms)
+        if first_window is None:
+            raise DataHandlerError(' 没有可以回测的数据, 请检查您的输入')
+        self.start_time = first_window[0]
+        windows = self._iter_hourly_windows(first_window)
+        if self.prefetch:
+            self.hourly_load_list = WindowPrefetcher(windows, self._load_hourly_data_from_csv_file, self.prefetch)
+        else:
+            self.hourly_load_list = ((window, self._load_hourly_data_from_csv_file(window)) for window in windows)
+
+    def _iter_hourly_windows(self, window):
+        """
+        下一个窗口从所有数据源中 hourly_end 之后的第一个时间戳开始
+        """
+        sources = self._get_data_sources()
+        while window is not None:
+            yield window
+            window = next_window(sources, window[1], max_rows=self.window_rows, bucket=self.bucket_ms)
+
+    def _load_hourly_data_from_csv_file(self, window):
+        """
+        取出 window=[start, end] 内的数据, 按数据流序号返回每个数据流的 store
+        read_mode='full' 时数据已经在内存中, 这里只对 store 做切片, 不会重新读取文件
+        read_mode='window' 时只读取与窗口有交集的 parquet row group
+        prefetch > 0 时在后台线程中调用, 这里不修改 handler 的状态 (FeedLatencySimulator 的状态只在这里按窗口顺序修改)
+        """
+        start, end = window
+        if self._window_reader_pool is not None:
+            stores = self._window_reader_pool.read_window(self._get_data_sources(), start, end)
+        else:
+            stores = [source.read_window(start, end) for source in self._get_data_sources()]
+        if self._latency_simulator is not None:
+            # 窗口按顺序读取, 接收时间晚于窗口结束的数据留到下一个窗口推送
+            stores = self._latency_simulator.apply(stores, end)
+        return stores
+
+    def _next_updates(self):
+        """
+        取出下一次推送的数据, 更新 backtest_now, 返回 TimelineMerger 给出的 updates [(数据流序号, RecordView), ...]
+        当前窗口推送完时 load 下一个窗口; 所有数据推送完时 raise StopIteration
+        """
+        # 检查是否需要load新的历史数据
+        while not self._merger:
+            try:
+                [self.hourly_start, self.hourly_end], stores = self.hourly_load_list.__next__()
+            except StopIteration:
+                # 所有窗口读取完之后, 推送因为延迟还没有送达的数据
+                stores = self._latency_simulator.flush() if self._latency_simulator is not None else None
+                if stores is None:
+                    raise
+            self._merger = TimelineMerger(stores)
+        # 获取现在迭代的时间戳以及该时间戳下的数据
+        if self.bucket_ms:
+            # 合并当前 bucket 内的所有数据 (窗口已经按 bucket 对齐, bucket 不会跨窗口)
+            bucket = bucket_end(self._merger.peek_time(), self.bucket_ms)
+            self.backtest_now, updates = self._merger.pop_until(bucket)
+        else:
+            self.backtest_now, updates = self._merger.pop()
+        return updates
+
+    def _get_new_data(self, updates):
+        raise NotImplementedError("Should implement _get_new_data()")
+
+    def update_TradeLOB(self):
+        """
+        Pushes the latest trade/LOB info in that time
+        """
+        try:
+            updates = self._next_updates()
+            # 开始推送新的行情数据
+            self._get_new_data(updates)
+            self.events.put(MARKET_EVENT)
+        except StopIteration:
+            self.continue_backtest = False
+            self.close()
+
+    def close(self):
+        """
+        停止后台预读取线程 (prefetch > 0) 并关闭读取窗口的进程池, 回测结束时自动调用
+        提前丢弃 handler 时 (例如参数扫描中只用来读取数据的 handler) 需要手动调用, 可以重复调用
+        """
+        if isinstance(self.hourly_load_list, WindowPrefetcher):
+            self.hourly_load_list.close()
+        if self._window_reader_pool is not None:
+            self._window_reader_pool.close()
+            self._window_reader_pool = None
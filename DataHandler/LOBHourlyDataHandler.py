@@ -20,12 +20,18 @@ from abc import ABCMeta, abstractmethod
 import sys
 sys.path.append("..")
 
-from event import MarketEvent
-from object import DataHandler, DataHandlerError
+from object import DataHandlerError
 from DataHandler.MarketDataStructure import Orderbook, Trade
+from DataHandler.MarketDataStore import LOBStore
+from DataHandler.HistoricHourlyDataHandler import HistoricHourlyDataHandler
+from DataHandler.RingBuffer import RingBuffer
 
 
-class HistoricLOBHourlyDataHandler(DataHandler):
+# 该数据源 LOB 文件的列名
+LOB_COLUMNS = ['time','bid1','bid_qty1','ask1','ask_qty1']
+
+
+class HistoricLOBHourlyDataHandler(HistoricHourlyDataHandler):
     """
     从本地文件中读取历史数据生成 DataHandler, 读取的数据主要为 LOB
     读取程序兼容 parquet 以及 csv 文件
@@ -34,7 +40,7 @@ class HistoricLOBHourlyDataHandler(DataHandler):
     The reading program is compatible with both Parquet and CSV files.
     """
     def __init__(self, events:queue.Queue, symbol_list:List[str], exchange_list:List[str], 
-                 file_dir: str, is_csv:bool = True) -> None:
+                 file_dir: str, is_csv:bool = True, **kwargs) -> None:
         """
         初始化历史数据处理程序
         请求CSV文件的位置和符号列表。假设所有文件的格式都是 'symbol_exchange_trade.csv'/'symbol_exchange_LOB.csv'，其中 symbol/exchange 是列表中的str。
@@ -46,229 +52,68 @@ class HistoricLOBHourlyDataHandler(DataHandler):
         csv_dir - Absolute directory path to the CSV files.
         symbol_list - A list of symbol strings.
         exchange_list - A list of symbol exchange corresponding to the symbol_list
+        kwargs - 读取/窗口/回放的参数 (read_mode, cache_dir, prefetch, n_workers, window_rows, memory_budget,
+                 history_depth, date_range, bucket_ms, feed_latency, clean, shared_data), 见 HistoricHourlyDataHandler
         """ 
-
-        self.events = events
-        self.file_dir = file_dir
-        self.is_csv = is_csv
-        self.symbol_exchange_list = self._agg_symbol_exchange_list(symbol_list, exchange_list)
-        print('backtest on: ', self.symbol_exchange_list)
+        super().__init__(events, symbol_list, exchange_list, file_dir, is_csv, **kwargs)
 
         # 为了时间效率我们这里暂时不处理trade数据
-        # # trade 数据
-        # self.__symbol_exchange_trade_data = {}                # 从csv读取的表单
-        # self.registered_symbol_exchange_trade_data = {}     # 最新的以及历史的数据
-        # self.latest_symbol_exchange_trade_data_time = {}    # 更新到的时间表
         # LOB 数据 (最高频的LOB 仅保存bid1&ask1)
-        self.__symbol_exchange_LOB_data = {}                  # 从csv读取的表单
-        self.registered_symbol_exchange_LOB_data = {}       # 最新的以及历史的数据
+        self.latest_symbol_exchange_LOB_data = {}           # 最新一次推送的数据 (RecordView), 历史见 get_latest_ticks
         self.latest_symbol_exchange_LOB_data_time = {}      # 更新到的时间表
-        # 时间相关的指标
-        self.start_time = None
-        self.__comb_time_index = None
-        self.comb_time_index_iter = None
-        self.backtest_now = None
-        self.continue_backtest = True
-        self.hourly_start = -1
-        self.hourly_end = -1
-
-        # 需要处理的数据队列
-        self.market_data_q = queue.Queue()    # MarketData队列（带数据）     
+        self.__symbol_exchange_LOB_history = {}               # 最近 history_depth 条 LOB (RingBuffer)
 
-        print('/*----- start initialize the DataHandler -----*/')
-        # 浏览一遍全数据获取要回测的 time id
-        self._get_backtest_time_index()
-        # 获取需要迭代的
-        self._get_hourly_load_list()
-        print('/*----- DataHandler initialization ends -----*/')
+        # 打开每个 symbol 的数据源, 准备需要迭代的窗口
+        self._initialize_data()
 
-    def _agg_symbol_exchange_list(self, symbol_list, exchange_list):
-        """
-        用于聚合 symbol_exchange_list 的工具函数
-        """
-        symbol_exchange_list_temp  = []
-        if len(symbol_list) != len(exchange_list):
-            raise DataHandlerError(' symbol_list 和 exchange_list 长度不同, 请检查您的输入')
-        for i in range(len(symbol_list)):
-            symbol_exchange = str(symbol_list[i]) + '_' + str(exchange_list[i])
-            if symbol_exchange in symbol_exchange_list_temp:
-                raise DataHandlerError(' symbol_list 和 exchange_list 聚合后不能形成数据的 key, 请检查您的输入')
-            symbol_exchange_list_temp.append(symbol_exchange)
-        
-        return symbol_exchange_list_temp
-    
-    def _process_duplicated_time(self, df):
-        """
-        因为 Sys 把 timestep 作为数据的 key 推送， 必须删除其中重复的
-        我们仅保留最后一次出现的样本
+    def _stream_specs(self):
         """
-        df = df.drop_duplicates(subset=['time'],keep='last').reset_index(drop=True)
-        return df
-    
-    def _get_backtest_time_index(self):
+        每个 symbol 只有 LOB 一个数据流, 数据流序号即 symbol 的序号
         """
-        获取回测的time_index
-        """
-        ## trade
-        comb_time_index = None
-        for s in self.symbol_exchange_list:
-            # 读取 csv/parquet 数据
-            if self.is_csv:
-                # history_data_trade = pd.read_csv(
-                #     os.path.join(self.file_dir, '%s_trade.csv' % s)
-                #     )
-                history_data_LOB = pd.read_csv(
-                    os.path.join(self.file_dir, '%s_LOB.csv' % s)
-                    )
-            if not self.is_csv:
-                # history_data_trade = pd.read_parquet(
-                #     os.path.join(self.file_dir, '%s_trade.parquet' % s)
-                #     )
-                history_data_LOB = pd.read_parquet(
-                    os.path.join(self.file_dir, '%s_LOB.parquet' % s)
-                    )
-
-            # 约束存在的列
-            # history_data_trade = history_data_trade[['time','price','qty','is_buyer_maker']]
-            history_data_LOB = history_data_LOB[['time','bid1','bid_qty1','ask1','ask_qty1']]
-            history_data_LOB = self._process_duplicated_time(history_data_LOB)  #删除重复的时间
+        return [(LOBStore, 'LOB', LOB_COLUMNS)]
 
+    def _register_sources(self, sources):
+        for s in self.symbol_exchange_list:
             # 初始化 latest 和 registered
-            self.registered_symbol_exchange_LOB_data[s] = {}
+            self.latest_symbol_exchange_LOB_data[s] = []
             self.latest_symbol_exchange_LOB_data_time[s] = None
+            self.__symbol_exchange_LOB_history[s] = RingBuffer(self.history_depth, LOBStore.column_dtypes())
 
-            # 集合时间的index
-            if comb_time_index is None:
-                # comb_time_index = history_data_trade.time.to_list() + history_data_LOB.time.to_list()
-                comb_time_index = history_data_LOB.time.to_list()
-            else:
-                # comb_time_index += (history_data_trade.time.to_list() + history_data_LOB.time.to_list())
-                comb_time_index += history_data_LOB.time.to_list()
-
-        comb_time_index = list(set(comb_time_index))
-        comb_time_index.sort()
-        self.start_time = comb_time_index[0]
-        self.__comb_time_index = comb_time_index
-        self.comb_time_index_iter = iter(comb_time_index)
-
-    def _get_hourly_load_list(self):
+    def _get_new_data(self, updates):
         """
-        用来生成我们每一个小时load一次数据的
-        注意，这段代码的冗余性可能并不好
+        updates 为 TimelineMerger.pop() 给出的该时间戳下有数据的数据流, 数据流序号即 symbol 的序号
         """
-        start = self.__comb_time_index[0]
-        last = self.__comb_time_index[1]
-        self.hourly_load_list = []
-        for i in self.__comb_time_index:
-            if i - start > (60*60*1000): # 一小时
-                self.hourly_load_list.append([start,last])
-                start = i
-            last = i
-        self.hourly_load_list.append([start,last])
-        self.hourly_load_list = iter(self.hourly_load_list)
-        # print(self.hourly_load_list)
+        self.market_state.advance(self.backtest_now)
+        for i, LOBs in updates:
+            s = self.symbol_exchange_list[i]
+            self.latest_symbol_exchange_LOB_data[s] = LOBs
+            self.latest_symbol_exchange_LOB_data_time[s] = self.backtest_now
+            self.__symbol_exchange_LOB_history[s].extend(LOBs.store, LOBs.lo, LOBs.hi)
+            self.market_state.update_LOB(i, LOBs.store, LOBs.hi - 1)
 
-    def _load_hourly_data_from_csv_file(self):
+    def get_latest_ticks(self, symbol, exchange=None, N=1):
         """
-        获取回测的time_index
-        """
-        comb_time_index = None
-        for s in self.symbol_exchange_list:
-            # 读取 csv/parquet 数据
-            if self.is_csv:
-                # history_data_trade = pd.read_csv(
-                #     os.path.join(self.file_dir, '%s_trade.csv' % s)
-                #     )
-                history_data_LOB = pd.read_csv(
-                    os.path.join(self.file_dir, '%s_LOB.csv' % s)
-                    )
-            if not self.is_csv:
-                # history_data_trade = pd.read_parquet(
-                #     os.path.join(self.file_dir, '%s_trade.parquet' % s)
-                #     )
-                history_data_LOB = pd.read_parquet(
-                    os.path.join(self.file_dir, '%s_LOB.parquet' % s)
-                    )
+        获取某个 symbol 最近 N 条 LOB (bid1/ask1, 不足 N 条时返回全部), 最多保存 history_depth 条
+        symbol/exchange 可以分开给出, 也可以直接给出 symbol_exchange (此时 exchange=None)
+        返回只读的 numpy view, 不复制数据; view 会在之后的推送中被覆盖, 如果需要长期保存请 copy
 
-            # 约束存在的列
-            # history_data_trade = history_data_trade[['time','price','qty','is_buyer_maker']]
-            history_data_LOB = history_data_LOB[['time','bid1','bid_qty1','ask1','ask_qty1']]
-            history_data_LOB = self._process_duplicated_time(history_data_LOB)  #删除重复的时间
-            history_data_LOB = history_data_LOB.loc[(history_data_LOB.time>self.hourly_start)&
-                                                    (history_data_LOB.time<self.hourly_end),].reset_index(drop=True)
-            
-            # # 记录trade数据 目前很花时间
-            # self.__symbol_exchange_trade_data[s] = {i:[] for i in history_data_trade.time.unique()}
-            # for i in range(len(history_data_trade.time)):
-            #     market_event = Trade(symbol=s, price=history_data_trade['price'][i], qty=history_data_trade['qty'][i], 
-            #                          is_buyer_maker=history_data_trade['is_buyer_maker'][i], timestamp=history_data_trade['time'][i])
-            #     self.__symbol_exchange_trade_data[s][market_event.timestamp] += [market_event]
-            
-            # 记录LOB数据 目前很花时间
-            self.__symbol_exchange_LOB_data[s] = {i:[] for i in history_data_LOB.time.unique()}
-            for i in range(len(history_data_LOB.time)):
-                market_event = Orderbook(symbol=s, bid1=history_data_LOB['bid1'][i], bidqty1=history_data_LOB['bid_qty1'][i], 
-                                         ask1=history_data_LOB['ask1'][i], askqty1=history_data_LOB['ask_qty1'][i], 
-                                         timestamp=history_data_LOB['time'][i])
-                self.__symbol_exchange_LOB_data[s][market_event.timestamp] += [market_event]
-
-    def _get_new_data(self):
-        for s in self.symbol_exchange_list:
-            try:
-                self.registered_symbol_exchange_trade_data[s][self.backtest_now] = self.__symbol_exchange_trade_data[s][self.backtest_now]
-                self.latest_symbol_exchange_trade_data_time[s] = self.backtest_now
-            except: pass
-            try:
-                self.registered_symbol_exchange_LOB_data[s][self.backtest_now] = self.__symbol_exchange_LOB_data[s][self.backtest_now]
-                self.latest_symbol_exchange_LOB_data_time[s] = self.backtest_now
-            except: pass
-
-    def update_TradeLOB(self):
-        """
-        Pushes the latest trade/LOB info in that time
+        return sample:
+            {'time': array([...]), 'bid1': array([...]), 'bidqty1': array([...]),
+             'ask1': array([...]), 'askqty1': array([...])}
         """
-        try: # 获取现在迭代的时间戳
-            self.backtest_now = self.comb_time_index_iter.__next__()
-            # 检查是否需要load新的历史数据
-            if self.backtest_now > self.hourly_end:
-                print('\n===== reload data from new hour =====')
-                [self.hourly_start, self.hourly_end] = self.hourly_load_list.__next__()
-                self._load_hourly_data_from_csv_file()
-            # 开始推送新的行情数据
-            print('\n===== processing market event in ',self.backtest_now,' =====')
-            self._get_new_data()
-            self.events.put(MarketEvent())
-            print('get new market events and push to queue')
-        except StopIteration:
-            self.continue_backtest = False
+        s = symbol if exchange is None else str(symbol) + '_' + str(exchange)
+        if s not in self.__symbol_exchange_LOB_history:
+            raise DataHandlerError(' %s 不在回测的 symbol_exchange_list 中' % s)
+        return self.__symbol_exchange_LOB_history[s].latest(N)
 
-    def get_latest_trades(self):
-        """
-        获取最新的成交信息
-        """
-        outcomes = dict()
-        for s in self.symbol_exchange_list:
-            latest_time = self.latest_symbol_exchange_trade_data_time[s]
-            if latest_time is not None:
-                outcomes[s] = self.registered_symbol_exchange_trade_data[s][latest_time][-1].price
-        return outcomes
-    
     def get_latest_prices(self):
         """
         获取最新的价格
-        会先寻找成交信息
-        没有的话用LOB信息取代
+        这里不处理trade数据, 使用最新LOB的中间价; 还没有数据的 symbol 不返回
         """
         outcomes = dict()
-        try:
-            for s in self.symbol_exchange_list:
-                latest_time = self.latest_symbol_exchange_trade_data_time[s]
-                if latest_time is not None:
-                    outcomes[s] = self.registered_symbol_exchange_trade_data[s][latest_time][-1].price
-        except:
-            for s in self.symbol_exchange_list:
-                latest_time = self.latest_symbol_exchange_LOB_data_time[s]
-                if latest_time is not None:
-                    outcomes[s] = (self.registered_symbol_exchange_LOB_data[s][latest_time][-1].bid1 +\
-                          self.registered_symbol_exchange_LOB_data[s][latest_time][-1].ask1)/2
-        return outcomes         
+        for s in self.symbol_exchange_list:
+            if self.latest_symbol_exchange_LOB_data_time[s] is not None:
+                LOB = self.latest_symbol_exchange_LOB_data[s][-1]
+                outcomes[s] = (LOB.bid1 + LOB.ask1)/2
+        return outcomes
@@ -0,0 +1,280 @@
+# LiveTradeLOBDataHandler.py
+
+"""
+实时行情的 DataHandler, 与 HistoricTradeLOBHourlyDataHandler 的接口一致
+策略/portfolio/executor 不需要修改即可从回测切换到实盘数据
+
+1. 后台线程中运行 asyncio event loop, 通过 TCP 读取行情 (每行一个 json, 格式见 ReplayFeedServer)
+2. 收到的数据先放进有界的缓冲区, 主线程调用 update_TradeLOB() 时一次取出上一次之后的所有数据, 推送一个 MarketEvent
+3. 给出 recorder (FeedRecorder) 时, 收到的每一条数据 (包括之后被合并的 LOB) 都会被录制, 之后可以用 read_mode='recorded' 回放
+4. 内存有上限:
+    LOB 在缓冲区中只保留每个 symbol 最新的一条 (coalescing)
+    trade 不丢弃, 缓冲区中的 trade 数量达到 max_pending 时暂停读取 socket (背压), 直到主线程取走数据
+"""
+
+import asyncio
+import json
+import queue
+import threading
+import time
+from collections import deque
+from typing import List, Tuple, Dict
+import numpy as np
+import sys
+sys.path.append("..")
+
+from event import MARKET_EVENT
+from object import DataHandler
+from DataHandler.MarketDataStructure import Orderbook, Trade
+from DataHandler.MarketDataStore import TradeStore, LOBStore
+from DataHandler.MarketState import MarketState
+from DataHandler.TradeLOBDataMixin import TradeLOBDataMixin
+
+
+class _Columns(object):
+    """
+    一批数据的列, 用于写入 RingBuffer/MarketState (与 store 的列名一致)
+    """
+
+    def __init__(self, time, receive_time=None, **columns):
+        self.time = np.asarray(time, dtype=np.int64)
+        self.receive_time = receive_time
+        for name, values in columns.items():
+            setattr(self, name, np.asarray(values))
+
+    def receive_time_of(self, i):
+        return None if self.receive_time is None else self.receive_time[i]
+
+
+class _FeedBuffer(object):
+    """
+    后台线程写入, 主线程读取的缓冲区
+    trade 按顺序保存, LOB 只保存每个 symbol 最新的一条
+    """
+
+    def __init__(self, max_pending):
+        self.max_pending = max_pending
+        self.condition = threading.Condition()
+        self.trades = {}            # symbol -> deque of Trade
+        self.LOBs = {}              # symbol -> Orderbook (最新)
+        self.n_trades = 0
+        self.n_coalesced = 0        # 被合并 (覆盖) 的 LOB 数量
+        self.closed = False
+        self.error = None
+
+    def full(self):
+        return self.n_trades >= self.max_pending
+
+    def put(self, kind, s, record):
+        with self.condition:
+            if kind == 'trade':
+                self.trades.setdefault(s, deque()).append(record)
+                self.n_trades += 1
+            else:
+                if s in self.LOBs:
+                    self.n_coalesced += 1
+                self.LOBs[s] = record
+            self.condition.notify()
+
+    def close(self, error=None):
+        with self.condition:
+            self.closed = True
+            self.error = error
+            self.condition.notify()
+
+    def take(self, timeout=None):
+        """
+        取出缓冲区中的所有数据, 没有数据时最多等待 timeout 秒
+        return: (trades, LOBs), 都为空并且 closed 时表示行情结束
+        """
+        with self.condition:
+            if not self.trades and not self.LOBs and not self.closed:
+                self.condition.wait(timeout)
+            trades, LOBs = self.trades, self.LOBs
+            self.trades, self.LOBs = {}, {}
+            self.n_trades = 0
+            return trades, LOBs
+
+
+class LiveTradeLOBDataHandler(TradeLOBDataMixin, DataHandler):
+    """
+    从 TCP 行情接口读取实时的 trade 以及 LOB (bid1&ask1) 数据
+    """
+    def __init__(self, events:queue.Queue, symbol_list:List[str], exchange_list:List[str],
+                 host:str = '127.0.0.1', port:int = 8765, max_pending:int = 100000,
+                 history_depth:int = 1000, timeout:float = None, recorder = None, 
+                 bars:List[Tuple[str, float]] = None) -> None:
+        """
+        Parameters:
+        events - The Event Queue.
+        symbol_list - A list of symbol strings.
+        exchange_list - A list of symbol exchange corresponding to the symbol_list
+        host/port - 行情接口的地址
+        max_pending - 缓冲区中最多保存的 trade 数量, 达到后暂停读取行情 (背压)
+        history_depth - 每个 symbol 保存最近多少条 trade/LOB 历史, 用于 get_latest_ticks/get_latest_LOB_ticks
+        timeout - update_TradeLOB 等待新数据的最长时间 (秒), None 为一直等待
+        recorder - FeedRecorder, 在后台线程中录制收到的数据, 行情结束时 flush (由调用方 close)
+        bars - 由 trade 增量聚合的 bar, 见 BarBuilder; 实盘中 time bar 只由交易所时间晚于 bar 结束时间的 trade 完成
+        """
+        self.events = events
+        self.host = host
+        self.port = port
+        self.max_pending = max_pending
+        self.history_depth = history_depth
+        self.timeout = timeout
+        self.recorder = recorder
+        self.symbol_exchange_list = self._agg_symbol_exchange_list(symbol_list, exchange_list)
+        self.symbol_index = {s: i for i, s in enumerate(self.symbol_exchange_list)}
+        print('live on: ', self.symbol_exchange_list)
+
+        # trade/LOB 的数据结构以及查询接口见 TradeLOBDataMixin (LOB 仅保存bid1&ask1)
+        self._init_trade_LOB_data(bars)
+        for s in self.symbol_exchange_list:
+            self._register_symbol(s)
+        self.market_state = MarketState(self.symbol_exchange_list)
+        # 时间相关的指标, 实盘中 backtest_now 为本地接收时间 (ms)
+        self.start_time = int(time.time() * 1000)
+        self.backtest_now = self.start_time
+        self.continue_backtest = True
+
+        # 后台线程中的 asyncio 行情读取
+        self.__buffer = _FeedBuffer(max_pending)
+        self.__loop = None
+        self.__resume = None
+        self.__thread = threading.Thread(target=self._run_feed, daemon=True)
+        self.__thread.start()
+
+    ###########################################
+    ########## asyncio feed (后台线程) ##########
+    ###########################################
+
+    def _run_feed(self):
+        try:
+            asyncio.run(self._read_feed())
+        except BaseException as e:
+            self.__buffer.close(e)
+        else:
+            self.__buffer.close()
+
+    async def _read_feed(self):
+        self.__loop = asyncio.get_running_loop()
+        self.__resume = asyncio.Event()
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            while True:
+                # 背压: 缓冲区满时不再读取 socket, 由 TCP 让服务器等待
+                while self.__buffer.full():
+                    self.__resume.clear()
+                    await self.__resume.wait()
+                line = await reader.readline()
+                if not line:
+                    break
+                self._on_message(json.loads(line))
+        finally:
+            writer.close()
+            if self.recorder is not None:
+                self.recorder.flush()
+
+    def _on_message(self, message):
+        """
+        把行情消息转换为 Trade/Orderbook, receive_time 为本地接收时间
+        """
+        s = message['symbol']
+        if s not in self.symbol_index:
+            return
+        receive_time = int(time.time() * 1000)
+        if message['type'] == 'trade':
+            record = Trade(symbol=s, price=float(message['price']), qty=float(message['qty']),
+                           is_buyer_maker=bool(message['is_buyer_maker']), timestamp=int(message['time']),
+                           receive_time=receive_time)
+            if self.recorder is not None:
+                self.recorder.record(TradeStore, s, [record.timestamp], [receive_time], price=[record.price],
+                                     qty=[record.qty], is_buyer_maker=[record.is_buyer_maker])
+        else:
+            record = Orderbook(symbol=s, bid1=float(message['bid1']), bidqty1=float(message['bidqty1']),
+                               ask1=float(message['ask1']), askqty1=float(message['askqty1']),
+                               timestamp=int(message['time']), receive_time=receive_time)
+            if self.recorder is not None:
+                self.recorder.record(LOBStore, s, [record.timestamp], [receive_time], bid1=[record.bid1],
+                                     bidqty1=[record.bidqty1], ask1=[record.ask1], askqty1=[record.askqty1])
+        self.__buffer.put(message['type'], s, record)
+
+    def _resume_feed(self):
+        """
+        主线程取走数据后, 通知后台线程继续读取 (行情已经结束时 event loop 可能已经关闭)
+        """
+        if self.__resume is None or self.__buffer.closed:
+            return
+        try:
+            self.__loop.call_soon_threadsafe(self.__resume.set)
+        except RuntimeError:
+            pass
+
+    ###########################################
+    ########## push market events ############
+    ###########################################
+
+    def _get_new_data(self, trades, LOBs):
+        """
+        把缓冲区中取出的数据写入 latest_symbol_exchange_* 等结构, 按 symbol_exchange_list 的顺序
+        """
+        updated_trade_symbols = []
+        updated_LOB_symbols = []
+        updated_bar_symbols = {bar: [] for bar in self.bars}
+        self.market_state.advance(self.backtest_now)
+        for s in self.symbol_exchange_list:
+            i = self.symbol_index[s]
+            if s in trades:
+                records = list(trades[s])
+                self.latest_symbol_exchange_trade_data[s] = records
+                self.latest_symbol_exchange_trade_data_time[s] = self.backtest_now
+                columns = _Columns([r.timestamp for r in records], [r.receive_time for r in records],
+                                   price=[r.price for r in records], qty=[r.qty for r in records],
+                                   is_buyer_maker=[r.is_buyer_maker for r in records])
+                self._trade_history[s].extend(columns, 0, len(records))
+                for bar, builder in zip(self.bars, self._bar_builders[s]):
+                    if builder.update(columns, 0, len(records)):
+                        updated_bar_symbols[bar].append(s)
+                self.market_state.update_trade(i, columns, len(records) - 1)
+                self._latest_trade_views[s] = records
+                self._latest_trade_prices[s] = records[-1].price
+                updated_trade_symbols.append(s)
+            if s in LOBs:
+                record = LOBs[s]
+                self.latest_symbol_exchange_LOB_data[s] = [record]
+                self.latest_symbol_exchange_LOB_data_time[s] = self.backtest_now
+                columns = _Columns([record.timestamp], bid1=[record.bid1], bidqty1=[record.bidqty1],
+                                   ask1=[record.ask1], askqty1=[record.askqty1])
+                self._LOB_history[s].extend(columns, 0, 1)
+                self.market_state.update_LOB(i, columns, 0)
+                self._latest_LOB_views[s] = self.latest_symbol_exchange_LOB_data[s]
+                updated_LOB_symbols.append(s)
+        self._updated_trade_symbols = updated_trade_symbols
+        self._updated_LOB_symbols = updated_LOB_symbols
+        self._updated_bar_symbols = updated_bar_symbols
+
+    def update_TradeLOB(self):
+        """
+        取出上一次推送之后收到的所有数据, 推送一个 MarketEvent
+        行情接口关闭并且数据已经全部推送后 continue_backtest = False
+        """
+        trades, LOBs = self.__buffer.take(self.timeout)
+        self._resume_feed()
+        if not trades and not LOBs:
+            if self.__buffer.closed:
+                self.continue_backtest = False
+                if self.__buffer.error is not None:
+                    raise self.__buffer.error
+            return
+        self.backtest_now = int(time.time() * 1000)
+        self._get_new_data(trades, LOBs)
+        self.events.put(MARKET_EVENT)
+
+    def update_ticks(self):
+        self.update_TradeLOB()
+
+    def coalesced_count(self):
+        """
+        因为策略处理不及时而被合并 (只保留最新) 的 LOB 数量
+        """
+        return self.__buffer.n_coalesced
@@ -0,0 +1,109 @@
+# MarketDataCache.py
+
+"""
+行情数据的内存映射二进制缓存
+
+每个 'symbol_exchange_{trade,LOB}' 数据源第一次被使用时:
+    读取 csv/parquet -> 排序, 去重, 列投影 (即 store 的标准化结果) -> 每一列保存为一个 .npy 文件
+之后的回测直接用 np.load(mmap_mode='r') 打开, 不复制数据, 由操作系统按需读取页面
+
+缓存目录结构:
+    cache_dir/symbol_exchange_kind-列名hash/meta.json      数据源的大小, mtime, 列名, 版本
+    cache_dir/symbol_exchange_kind-列名hash/time.npy ...   每一列以及时间分组
+当数据源文件的大小或者 mtime 发生改变时, 缓存自动失效并重新生成
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+
+from DataHandler.MarketDataStore import load_store, source_path
+
+
+# 缓存格式发生改变时增加版本号, 旧的缓存会自动失效
+CACHE_VERSION = 3
+
+
+def _source_signature(path, columns, clean=None):
+    stat = os.stat(path)
+    return {'version': CACHE_VERSION,
+            'source': os.path.abspath(path),
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'columns': list(columns),
+            'clean': clean}
+
+
+def _array_names(store_cls):
+    return ('time', 'group_time', 'group_start') + tuple(store_cls.fields)
+
+
+# 可选的列, 只有 store 中存在时才保存
+_OPTIONAL_ARRAYS = ('receive_time',)
+
+
+def _read_meta(cache_path):
+    try:
+        with open(os.path.join(cache_path, 'meta.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_cache(store, cache_path, signature):
+    """
+    先写入临时目录再整体替换, 避免中断时留下不完整的缓存
+    meta.json 最后写入, 作为缓存完整的标志
+    """
+    tmp_path = '%s.tmp-%d' % (cache_path, os.getpid())
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    for name in _array_names(type(store)) + _OPTIONAL_ARRAYS:
+        array = getattr(store, name)
+        if array is not None:
+            np.save(os.path.join(tmp_path, name + '.npy'), np.ascontiguousarray(array))
+    meta = dict(signature)
+    if store.quality_report is not None:
+        meta['quality_report'] = store.quality_report.to_dict()
+    with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    shutil.rmtree(cache_path, ignore_errors=True)
+    os.replace(tmp_path, cache_path)
+
+
+def _open_cache(store_cls, symbol, cache_path):
+    arrays = {name: np.load(os.path.join(cache_path, name + '.npy'), mmap_mode='r')
+              for name in _array_names(store_cls)}
+    for name in _OPTIONAL_ARRAYS:
+        path = os.path.join(cache_path, name + '.npy')
+        if os.path.exists(path):
+            arrays[name] = np.load(path, mmap_mode='r')
+    return store_cls.from_arrays(symbol, arrays['time'], arrays,
+                                 arrays['group_time'], arrays['group_start'])
+
+
+def load_cached_store(store_cls, symbol, file_dir, kind, columns, is_csv=True, cache_dir=None, clean=None):
+    """
+    返回内存映射的 store, 缓存不存在或者已经失效时先生成缓存
+    cache_dir 默认为 file_dir/.cache
+    clean 不为 None 时缓存的是清洗后的数据, 清洗只在生成缓存时进行一次, 报告保存在 meta.json
+    """
+    path = source_path(symbol, file_dir, kind, is_csv)
+    if cache_dir is None:
+        cache_dir = os.path.join(file_dir, '.cache')
+    # 不同的 handler 可能从同一个文件读取不同的列, 用列名区分缓存
+    column_key = hashlib.md5(','.join(columns).encode()).hexdigest()[:8]
+    cache_path = os.path.join(cache_dir, '%s_%s-%s' % (symbol, kind, column_key))
+    signature = _source_signature(path, columns, clean)
+    meta = _read_meta(cache_path)
+    if meta is None or {k: meta.get(k) for k in signature} != signature:
+        os.makedirs(cache_dir, exist_ok=True)
+        _write_cache(load_store(store_cls, symbol, file_dir, kind, columns, is_csv, clean), cache_path, signature)
+        meta = _read_meta(cache_path)
+    store = _open_cache(store_cls, symbol, cache_path)
+    if meta.get('quality_report') is not None:
+        from DataHandler.DataCleaning import QualityReport
+        store.quality_report = QualityReport.from_dict(meta['quality_report'])
+    return store
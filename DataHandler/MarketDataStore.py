@@ -0,0 +1,601 @@
+# MarketDataStore.py
+
+"""
+按列存储的行情数据
+替代原来 "每一行数据一个 Trade/Orderbook object" 的存储方式
+
+1. 每个 symbol 的 trade/LOB 数据存为连续的 numpy 数组 (int64 time, float price/qty, bool maker ...)
+2. 读取数据时只做向量化的切片, 不再逐行生成 object
+3. 推送数据时通过 RecordView 按需生成 Trade/Orderbook, 策略端访问方式不变
+
+author: AbsoluteX
+email: xilinliu@link.cuhk.edu.cn
+"""
+
+import os
+from collections.abc import Mapping
+import numpy as np
+import pandas as pd
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from DataHandler.MarketDataStructure import Orderbook, Trade
+
+
+# 各类数据文件中需要的列
+TRADE_COLUMNS = ['time', 'price', 'qty', 'maker']
+LOB_COLUMNS = ['time', 'bid1', 'bid1_qty', 'ask1', 'ask1_qty']
+
+
+def time_groups(key):
+    """
+    对已经排好序的 key 计算每一个不同取值的起始行
+    return: (group_time, group_start), 第 i 组为 [group_start[i], group_start[i+1])
+    """
+    if len(key) == 0:
+        return key, np.zeros(1, dtype=np.int64)
+    is_start = np.empty(len(key), dtype=bool)
+    is_start[0] = True
+    np.not_equal(key[1:], key[:-1], out=is_start[1:])
+    starts = np.flatnonzero(is_start)
+    return key[starts], np.append(starts, len(key))
+
+
+class ColumnStore(object):
+    """
+    列存储的基类
+    数据按照 time 排序, 并且预先计算好每一个时间戳对应的行区间 [group_start[i], group_start[i+1])
+    receive_time 为可选的列 (数据的接收时间), 没有时为 None
+    """
+    fields = ()
+    field_dtypes = ()
+    row_nbytes = 0      # 每一行数据占用的内存 (bytes), 用于根据内存预算计算窗口大小
+    default_columns = None
+    quality_report = None   # 清洗后的 store 为 DataCleaning.QualityReport
+
+    def __init__(self, symbol, time, receive_time=None, **columns):
+        self.symbol = symbol
+        time = np.ascontiguousarray(time, dtype=np.int64)
+        if receive_time is not None:
+            columns['receive_time'] = np.asarray(receive_time, dtype=np.int64)
+        # 保证数据按时间排序 (稳定排序, 同一时间戳内保留文件中的顺序)
+        if len(time) > 1 and (np.diff(time) < 0).any():
+            order = np.argsort(time, kind='stable')
+            time = time[order]
+            columns = {k: np.asarray(v)[order] for k, v in columns.items()}
+        self.time = time
+        for name in self.fields:
+            setattr(self, name, np.ascontiguousarray(columns[name]))
+        self.receive_time = columns.get('receive_time')
+        self._build_time_groups()
+        self.cursor = 0
+
+    def _build_time_groups(self):
+        """
+        计算每一个不同时间戳的起始行
+        """
+        self.group_time, self.group_start = time_groups(self.time)
+
+    def column_arrays(self, lo=0, hi=None):
+        """
+        [lo, hi) 行的所有列 {列名: 数组 view}, 包括 receive_time (如果有), 不包括 time
+        """
+        outcomes = {name: getattr(self, name)[lo:hi] for name in self.fields}
+        if self.receive_time is not None:
+            outcomes['receive_time'] = self.receive_time[lo:hi]
+        return outcomes
+
+    def __len__(self):
+        return len(self.time)
+
+    @classmethod
+    def raw_columns(cls, df, columns):
+        """
+        从 DataFrame 向量化地取出各列 (不排序, 不去重)
+        return: (time, {列名: 数组}), 文件中有接收时间列时包括 receive_time
+        """
+        raise NotImplementedError("Should implement raw_columns()")
+
+    @classmethod
+    def from_frame(cls, symbol, df, columns=None):
+        """
+        从 DataFrame 构造, 由构造函数排序 (以及去重); 清洗后的数据见 DataCleaning.clean_frame
+        """
+        time, arrays = cls.raw_columns(df, columns or cls.default_columns)
+        return cls(symbol, time, **arrays)
+
+    @classmethod
+    def column_dtypes(cls):
+        """
+        [(列名, dtype), ...], 包括 time
+        """
+        return [('time', np.int64)] + list(zip(cls.fields, cls.field_dtypes))
+
+    @classmethod
+    def from_arrays(cls, symbol, time, columns, group_time, group_start):
+        """
+        直接使用已经排好序(以及去重)的数组构造 store, 不做任何检查和复制
+        用于切片以及读取缓存
+        """
+        new = object.__new__(cls)
+        new.symbol = symbol
+        new.time = time
+        for name in cls.fields:
+            setattr(new, name, columns[name])
+        new.receive_time = columns.get('receive_time')
+        new.group_time = group_time
+        new.group_start = group_start
+        new.cursor = 0
+        return new
+
+    def with_receive_time(self, receive_time):
+        """
+        返回按 receive_time 分组的新 store (不复制数据), receive_time 需要单调不减
+        之后 group_time 为接收时间, TimelineMerger 会按接收时间推送; 返回的 store 只用于推送
+        """
+        columns = self.column_arrays()
+        columns['receive_time'] = receive_time
+        group_time, group_start = time_groups(receive_time)
+        return self.from_arrays(self.symbol, self.time, columns, group_time, group_start)
+
+    @classmethod
+    def concat(cls, symbol, stores):
+        """
+        按顺序拼接多个 store (例如相邻两天的数据), 重新排序并计算时间分组
+        """
+        stores = [store for store in stores if len(store)]
+        if len(stores) == 1:
+            return stores[0]
+        if not stores:
+            return cls(symbol, np.empty(0, dtype=np.int64),
+                       **{name: np.empty(0, dtype=dtype) for name, dtype in zip(cls.fields, cls.field_dtypes)})
+        columns = [store.column_arrays() for store in stores]
+        return cls(symbol, np.concatenate([store.time for store in stores]),
+                   **{name: np.concatenate([c[name] for c in columns]) for name in columns[0]})
+
+    def slice(self, start, end):
+        """
+        取出时间在 [start, end] 内的数据, 返回共享底层数组的新 store (不复制数据)
+        """
+        i0, i1 = np.searchsorted(self.time, start, side='left'), np.searchsorted(self.time, end, side='right')
+        g0, g1 = np.searchsorted(self.group_time, start, side='left'), np.searchsorted(self.group_time, end, side='right')
+        return self.from_arrays(self.symbol, self.time[i0:i1], self.column_arrays(i0, i1),
+                                self.group_time[g0:g1], self.group_start[g0:g1 + 1] - i0)
+
+    def read_window(self, start, end):
+        """
+        与 ParquetWindowReader 接口一致, 数据已经在内存中所以只做切片
+        """
+        return self.slice(start, end)
+
+    def next_time_after(self, after=None):
+        """
+        返回晚于 after 的第一个时间戳, 没有则返回 None
+        """
+        i = 0 if after is None else int(np.searchsorted(self.group_time, after, side='right'))
+        return int(self.group_time[i]) if i < len(self.group_time) else None
+
+    def last_time(self):
+        return int(self.group_time[-1]) if len(self.group_time) else None
+
+    def count_between(self, start, end):
+        """
+        [start, end] 内的行数
+        """
+        return int(np.searchsorted(self.time, end, side='right') - np.searchsorted(self.time, start, side='left'))
+
+    def records(self, lo, hi):
+        """
+        返回 [lo, hi) 行的惰性 view
+        """
+        return RecordView(self, int(lo), int(hi))
+
+    def record(self, i):
+        raise NotImplementedError("Should implement record()")
+
+    def receive_time_of(self, i):
+        return None if self.receive_time is None else int(self.receive_time[i])
+
+
+def with_receive_time(arrays, df, columns, n):
+    """
+    columns 比 store 需要的 n 列多出一列时, 多出的一列为接收时间, 加入 arrays['receive_time']
+    """
+    if len(columns) > n:
+        arrays['receive_time'] = df[columns[n]].to_numpy(dtype=np.int64)
+    return arrays
+
+
+def encode_maker(values):
+    """
+    maker 列统一编码为 bool ('BUY' 为 True), 字符串列在 pandas/arrow 中向量化比较
+    """
+    if values.dtype == bool:
+        return values.to_numpy(dtype=bool)
+    return values.eq('BUY').to_numpy(dtype=bool)
+
+
+class TradeStore(ColumnStore):
+    """
+    trade 数据: time, price, qty, is_buyer_maker
+    """
+    fields = ('price', 'qty', 'is_buyer_maker')
+    field_dtypes = (np.float64, np.float64, np.bool_)
+    row_nbytes = 8 + 8 + 8 + 1 + 16    # time, price, qty, maker 以及最坏情况下的时间分组
+    default_columns = TRADE_COLUMNS
+
+    @classmethod
+    def raw_columns(cls, df, columns):
+        """
+        maker 列统一编码为 bool
+        """
+        time_col, price_col, qty_col, maker_col = columns[:4]
+        return df[time_col].to_numpy(), with_receive_time({
+            'price': df[price_col].to_numpy(dtype=np.float64),
+            'qty': df[qty_col].to_numpy(dtype=np.float64),
+            'is_buyer_maker': encode_maker(df[maker_col])}, df, columns, 4)
+
+    def record(self, i):
+        return Trade(symbol=self.symbol, price=float(self.price[i]), qty=float(self.qty[i]),
+                     is_buyer_maker=bool(self.is_buyer_maker[i]), timestamp=int(self.time[i]),
+                     receive_time=self.receive_time_of(i))
+
+
+class LOBStore(ColumnStore):
+    """
+    LOB 数据 (仅保存 bid1&ask1): time, bid1, bidqty1, ask1, askqty1
+    同一个时间戳只保留最后一次出现的样本
+    """
+    fields = ('bid1', 'bidqty1', 'ask1', 'askqty1')
+    field_dtypes = (np.float64, np.float64, np.float64, np.float64)
+    row_nbytes = 8 + 8*4 + 16          # time, bid1, bidqty1, ask1, askqty1 以及最坏情况下的时间分组
+    default_columns = LOB_COLUMNS
+
+    def __init__(self, symbol, time, **columns):
+        super().__init__(symbol, time, **columns)
+        self._drop_duplicated_time()
+
+    def _drop_duplicated_time(self):
+        """
+        因为 Sys 把 timestep 作为数据的 key 推送， 必须删除其中重复的
+        我们仅保留最后一次出现的样本
+        """
+        if len(self.group_time) == len(self.time):
+            return
+        last = self.group_start[1:] - 1
+        self.time = self.time[last]
+        for name in self.fields:
+            setattr(self, name, getattr(self, name)[last])
+        if self.receive_time is not None:
+            self.receive_time = self.receive_time[last]
+        self._build_time_groups()
+
+    @classmethod
+    def raw_columns(cls, df, columns):
+        time_col, bid_col, bidqty_col, ask_col, askqty_col = columns[:5]
+        return df[time_col].to_numpy(), with_receive_time({
+            'bid1': df[bid_col].to_numpy(dtype=np.float64),
+            'bidqty1': df[bidqty_col].to_numpy(dtype=np.float64),
+            'ask1': df[ask_col].to_numpy(dtype=np.float64),
+            'askqty1': df[askqty_col].to_numpy(dtype=np.float64)}, df, columns, 5)
+
+    def record(self, i):
+        return Orderbook(symbol=self.symbol, bid1=float(self.bid1[i]), bidqty1=float(self.bidqty1[i]),
+                         ask1=float(self.ask1[i]), askqty1=float(self.askqty1[i]),
+                         timestamp=int(self.time[i]), receive_time=self.receive_time_of(i))
+
+
+def read_columns(path, columns, is_csv=True):
+    """
+    读取 csv/parquet 文件中需要的列
+    """
+    if is_csv:
+        return pd.read_csv(path, usecols=columns)
+    return pd.read_parquet(path, columns=columns)
+
+
+def source_path(symbol, file_dir, kind, is_csv=True):
+    return os.path.join(file_dir, '%s_%s.%s' % (symbol, kind, 'csv' if is_csv else 'parquet'))
+
+
+def load_store(store_cls, symbol, file_dir, kind, columns, is_csv=True, clean=None):
+    """
+    读取 'symbol_exchange_{kind}.csv/parquet' 文件, 生成对应的 store
+    每个文件在一次回测中只需要读取一次
+    clean 为 'drop'/'flag' 时经过 DataCleaning 清洗, 报告保存在 store.quality_report
+    """
+    df = read_columns(source_path(symbol, file_dir, kind, is_csv), columns, is_csv)
+    if clean is None:
+        return store_cls.from_frame(symbol, df, columns=columns)
+    # 避免循环 import
+    from DataHandler.DataCleaning import clean_frame
+    store, store.quality_report = clean_frame(store_cls, symbol, df, columns, clean, kind)
+    return store
+
+
+def open_source(store_cls, symbol, file_dir, kind, columns, is_csv=True, read_mode='full', cache_dir=None, clean=None):
+    """
+    打开一个数据源, 返回的对象都支持 read_window(start, end) 以及 next_time_after(after)
+        read_mode='full':   整个文件读取一次, 之后在内存中切片
+        read_mode='window': 仅支持 parquet, 每个窗口只读取需要的 row group 和列
+        read_mode='mmap':   第一次使用时转换为内存映射的二进制缓存 (默认在 file_dir/.cache), 之后直接映射打开
+        read_mode='recorded': file_dir 为 FeedRecorder 的录制目录, 按稀疏索引读取每个窗口 (is_csv 和 columns 被忽略)
+    clean: None 不清洗; 'drop'/'flag' 见 DataCleaning ('recorded' 的数据录制时已经是推送的数据, 不再清洗)
+    """
+    if read_mode == 'full':
+        return load_store(store_cls, symbol, file_dir, kind, columns, is_csv, clean)
+    if read_mode == 'mmap':
+        # 避免循环 import
+        from DataHandler.MarketDataCache import load_cached_store
+        return load_cached_store(store_cls, symbol, file_dir, kind, columns, is_csv, cache_dir, clean)
+    if read_mode == 'window':
+        if is_csv:
+            raise ValueError("read_mode='window' only supports parquet files")
+        return ParquetWindowReader(store_cls, symbol, source_path(symbol, file_dir, kind, is_csv), columns, clean, kind)
+    if read_mode == 'recorded':
+        from DataHandler.FeedRecorder import RecordedFeedReader
+        return RecordedFeedReader(store_cls, symbol, file_dir)
+    raise ValueError('unknown read_mode: %s' % read_mode)
+
+
+class ParquetWindowReader(object):
+    """
+    按时间窗口读取 parquet 文件
+    1. 根据每个 row group 中 time 列的 min/max 统计信息, 只读取与窗口有交集的 row group
+       不在窗口内的 row group 不会被解压
+    2. 只读取需要的列 (column projection)
+    3. 在 pyarrow 层面过滤 time, 之后再转换为 store
+    这样内存占用和每个窗口的读取耗时只取决于窗口的大小, 而不是整天数据的大小
+    clean 不为 None 时每个窗口分别清洗, quality_report 为所有已读取窗口的累计
+    (在 WindowReaderPool 的子进程中读取时, 报告留在子进程中)
+    """
+
+    def __init__(self, store_cls, symbol, path, columns, clean=None, kind=None):
+        self.store_cls = store_cls
+        self.symbol = symbol
+        self.path = path
+        self.columns = list(columns)
+        self.time_column = self.columns[0]
+        self.clean = clean
+        self.quality_report = None
+        if clean is not None:
+            from DataHandler.DataCleaning import QualityReport
+            self.quality_report = QualityReport(symbol, kind, clean)
+        self.parquet_file = pq.ParquetFile(path)
+        self._read_row_group_stats()
+
+    def _read_row_group_stats(self):
+        """
+        读取每个 row group 中 time 列的 min/max
+        如果文件没有写入统计信息, 该 row group 视为覆盖所有时间 (row_group_has_stats 为 False),
+        需要时由 _fill_row_group_stats 读取 time 列补上
+        """
+        meta = self.parquet_file.metadata
+        col = self.parquet_file.schema_arrow.get_field_index(self.time_column)
+        n = meta.num_row_groups
+        self.row_group_min = np.full(n, np.iinfo(np.int64).min, dtype=np.int64)
+        self.row_group_max = np.full(n, np.iinfo(np.int64).max, dtype=np.int64)
+        self.row_group_rows = np.zeros(n, dtype=np.int64)
+        self.row_group_has_stats = np.zeros(n, dtype=bool)
+        for i in range(n):
+            row_group = meta.row_group(i)
+            self.row_group_rows[i] = row_group.num_rows
+            stats = row_group.column(col).statistics
+            if stats is not None and stats.has_min_max:
+                self.row_group_min[i] = stats.min
+                self.row_group_max[i] = stats.max
+                self.row_group_has_stats[i] = True
+
+    def _fill_row_group_stats(self, row_groups):
+        """
+        没有统计信息的 row group 读取 time 列, 用实际的 min/max 代替占位的 int64 极值
+        每个 row group 只读取一次; 空的 row group 没有数据, 保持原样
+        """
+        for i in row_groups:
+            if self.row_group_has_stats[i] or not self.row_group_rows[i]:
+                continue
+            time = self.parquet_file.read_row_group(i, columns=[self.time_column]).column(self.time_column).to_numpy()
+            self.row_group_min[i] = time.min()
+            self.row_group_max[i] = time.max()
+            self.row_group_has_stats[i] = True
+
+    def __getstate__(self):
+        # 传给子进程时不传递打开的文件, 在子进程中重新打开
+        state = self.__dict__.copy()
+        del state['parquet_file']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.parquet_file = pq.ParquetFile(self.path)
+
+    def _row_groups_between(self, start, end):
+        return np.flatnonzero((self.row_group_max >= start) & (self.row_group_min <= end)).tolist()
+
+    def read_window(self, start, end):
+        """
+        读取 [start, end] 内的数据, 返回对应的 store
+        """
+        row_groups = self._row_groups_between(start, end)
+        table = self.parquet_file.read_row_groups(row_groups, columns=self.columns)
+        time = table.column(self.time_column)
+        table = table.filter(pc.and_(pc.greater_equal(time, start), pc.less_equal(time, end)))
+        if self.clean is None:
+            return self.store_cls.from_frame(self.symbol, table.to_pandas(), columns=self.columns)
+        from DataHandler.DataCleaning import clean_frame
+        store, _ = clean_frame(self.store_cls, self.symbol, table.to_pandas(), self.columns, self.clean,
+                               report=self.quality_report)
+        return store
+
+    def next_time_after(self, after=None):
+        """
+        返回晚于 after 的第一个时间戳, 没有则返回 None
+        完全晚于 after 的 row group 只需要看统计信息, 只有跨过 after 的 row group 才读取 time 列
+        """
+        if after is None:
+            after = np.iinfo(np.int64).min
+        candidates = []
+        later = self.row_group_min > after
+        if later.any():
+            candidates.append(int(self.row_group_min[later].min()))
+        for i in np.flatnonzero((self.row_group_min <= after) & (self.row_group_max > after)).tolist():
+            time = self.parquet_file.read_row_group(i, columns=[self.time_column]).column(self.time_column).to_numpy()
+            time = time[time > after]
+            if len(time):
+                candidates.append(int(time.min()))
+        return min(candidates) if candidates else None
+
+    @property
+    def row_nbytes(self):
+        return self.store_cls.row_nbytes
+
+    def last_time(self):
+        self._fill_row_group_stats(range(len(self.row_group_rows)))
+        known = self.row_group_has_stats
+        return int(self.row_group_max[known].max()) if known.any() else None
+
+    def count_between(self, start, end):
+        """
+        根据 row group 的统计信息估计 [start, end] 内的行数 (假设 row group 内的数据在时间上均匀分布)
+        有统计信息时不需要读取任何数据, 没有统计信息的 row group 先补上统计信息
+        """
+        self._fill_row_group_stats(self._row_groups_between(start, end))
+        known = self.row_group_has_stats
+        row_group_min, row_group_max = self.row_group_min[known], self.row_group_max[known]
+        lo = np.maximum(row_group_min, start).astype(np.float64)
+        hi = np.minimum(row_group_max, end).astype(np.float64)
+        span = (row_group_max - row_group_min).astype(np.float64) + 1
+        overlap = np.clip(hi - lo + 1, 0, None) / span
+        return int(np.ceil((overlap * self.row_group_rows[known]).sum()))
+
+
+def next_window(sources, after=None, window=60*60*1000, max_rows=None, bucket=None):
+    """
+    生成下一次 load 数据的时间窗口 [start, end]
+    start 为所有数据源中晚于 after 的第一个时间戳
+        max_rows=None: 窗口覆盖 window 毫秒的数据
+        否则根据行数选择 end: 在所有数据源的行数之和不超过 max_rows 的前提下让窗口尽量长
+        (行情冷清时窗口自动变长, 行情剧烈时自动变短; 同一个时间戳的数据不会被拆开)
+    bucket 不为 None 时 end 向后对齐到 bucket 毫秒的边界, 同一个 bucket 的数据不会被拆到两个窗口
+    """
+    outcome = _next_window(sources, after, window, max_rows)
+    if outcome is not None and bucket:
+        outcome[1] = bucket_end(outcome[1], bucket)
+    return outcome
+
+
+def bucket_end(t, bucket):
+    """
+    t 所在的 bucket (长度为 bucket 毫秒, 从 0 开始对齐) 的最后一毫秒
+    """
+    return (t // bucket + 1) * bucket - 1
+
+
+def _next_window(sources, after, window, max_rows):
+    sources = list(sources)
+    starts = [t for t in (source.next_time_after(after) for source in sources) if t is not None]
+    if not starts:
+        return None
+    start = min(starts)
+    if max_rows is None:
+        return [start, start + window]
+
+    def count(end):
+        return sum(source.count_between(start, end) for source in sources)
+
+    # 二分查找满足 count(end) <= max_rows 的最大 end
+    last = max(t for t in (source.last_time() for source in sources) if t is not None)
+    if count(last) <= max_rows:
+        return [start, last]
+    lo, hi = start, last
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count(mid) <= max_rows:
+            lo = mid
+        else:
+            hi = mid - 1
+    return [start, lo]
+
+
+def window_rows_from_budget(sources, memory_budget, n_windows=1):
+    """
+    根据内存预算 (bytes) 计算每个窗口最多包含的行数
+    n_windows 为同时保存在内存中的窗口数量 (当前窗口以及预读取的窗口)
+    """
+    row_nbytes = max(source.row_nbytes for source in sources)
+    return max(1, int(memory_budget // (row_nbytes * n_windows)))
+
+
+class RecordView(object):
+    """
+    ColumnStore 中 [lo, hi) 行的只读 view
+    行为与原来的 List[Trade]/List[Orderbook] 一致 (索引, 切片, 迭代, 与 list 相加)
+    Trade/Orderbook object 只在第一次被访问时生成并缓存
+    """
+
+    def __init__(self, store, lo, hi):
+        self.store = store
+        self.lo = lo
+        self.hi = hi
+        self._cache = None
+
+    def __len__(self):
+        return self.hi - self.lo
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        n = self.hi - self.lo
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError('RecordView index out of range')
+        if self._cache is None:
+            self._cache = [None] * n
+        rec = self._cache[i]
+        if rec is None:
+            rec = self._cache[i] = self.store.record(self.lo + i)
+        return rec
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def __radd__(self, other):
+        return list(other) + list(self)
+
+    def __eq__(self, other):
+        try:
+            return list(self) == list(other)
+        except TypeError:
+            return NotImplemented
+
+    def __hash__(self):
+        # 与 __eq__ 一致: 相等的 view 包含相同的 Trade/Orderbook object (object 按 id 比较和 hash)
+        return hash(tuple(self))
+
+    def __repr__(self):
+        return list(self).__repr__()
+
+
+class LatestRecordMap(Mapping):
+    """
+    symbol_exchange -> 该 symbol 最新的一条数据 (Trade/Orderbook) 的只读映射
+    views 由 datahandler 在推送时维护 (symbol_exchange -> RecordView), 这里不复制
+    只有被访问的 symbol 才会生成 object
+    """
+
+    def __init__(self, views):
+        self._views = views
+
+    def __getitem__(self, s):
+        return self._views[s][-1]
+
+    def __iter__(self):
+        return iter(self._views)
+
+    def __len__(self):
+        return len(self._views)
@@ -3,6 +3,7 @@
 """
 定义 行情数据类
 定义行情数据基类，便于我们在其它的文件中约束数据格式
+所有行情数据类使用 __slots__ (没有 __dict__), 回放中按需生成的 Trade/Orderbook 更小, 创建更快
 
 author: AbsoluteX
 email: xilinliu@link.cuhk.edu.cn
@@ -13,15 +14,27 @@ import copy
 
 class MarketData(object):
     """行情数据类"""
+    __slots__ = ()
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
 
     def __repr__(self):
-        return self.__dict__.__repr__()
+        return self.to_dict().__repr__()
 
     def copy(self):
-        return copy.deepcopy(self)
+        """
+        字段都是标量 (不可变), 复制每个字段即可, 不需要 deepcopy
+        """
+        new = object.__new__(type(self))
+        for name in self.__slots__:
+            setattr(new, name, getattr(self, name))
+        return new
 
 
 class Orderbook(MarketData):
+    __slots__ = ('symbol', 'bid1', 'bidqty1', 'ask1', 'askqty1', 'timestamp', 'receive_time')
+
     def __init__(self, symbol=None, bid1=None, bidqty1=None, 
                  ask1=None, askqty1=None, timestamp:int=None, 
                  receive_time=None):
@@ -35,6 +48,8 @@ class Orderbook(MarketData):
 
 
 class Trade(MarketData):
+    __slots__ = ('symbol', 'price', 'qty', 'is_buyer_maker', 'timestamp', 'receive_time')
+
     def __init__(self, symbol=None, price=None, qty=None, 
                  is_buyer_maker=None, timestamp:int=None, 
                  receive_time=None):
@@ -47,9 +62,17 @@ class Trade(MarketData):
 
 
 class Bar(MarketData):
+    """
+    由 trade 聚合的 bar (见 BarBuilder)
+    bar_type: 'time'/'tick'/'volume', td: bar 的大小 (毫秒/成交笔数/成交量), ts: bar 的开始时间
+    """
+    __slots__ = ('symbol', 'bar_type', 'td', 'ts', 'open', 'high', 'low', 'close',
+                 'volume', 'amount', 'vwap', 'ticks', 'timestamp', 'receive_time')
+
     def __init__(self, symbol=None, bar_type=None, td=None, 
                  ts=None, open=None, high=None, low=None, 
-                 close=None, timestamp:int=None, receive_time=None):
+                 close=None, volume=None, amount=None, vwap=None, 
+                 ticks=None, timestamp:int=None, receive_time=None):
         self.symbol = symbol
         self.bar_type = bar_type
         self.td = td
@@ -58,14 +81,32 @@ class Bar(MarketData):
         self.high = high
         self.low = low
         self.close = close
-        self.volume = None   # TODO: vol, amt, vwap, ticks
-        self.amount = None
-        self.vwap = None
-        self.ticks = None
+        self.volume = volume    # 成交量 sum(qty)
+        self.amount = amount    # 成交额 sum(price * qty)
+        self.vwap = vwap        # amount / volume
+        self.ticks = ticks      # 成交笔数
         self.timestamp = timestamp         # timestamp of last_price which close the bar, ie. new bar's open tick
         self.receive_time = receive_time   # receive_time of last_price which close the bar, ie. new bar's open tick
 
 
 class Snapshot(MarketData):
-    pass
+    """
+    L2 订单簿快照, 每一档按价格优先排列 (bid 从高到低, ask 从低到高)
+    bid_px/bid_qty/ask_px/ask_qty 为 numpy 数组
+    """
+    __slots__ = ('symbol', 'bid_px', 'bid_qty', 'ask_px', 'ask_qty', 'timestamp', 'receive_time')
+
+    def __init__(self, symbol=None, bid_px=None, bid_qty=None, 
+                 ask_px=None, ask_qty=None, timestamp:int=None, 
+                 receive_time=None):
+        self.symbol = symbol
+        self.bid_px = bid_px
+        self.bid_qty = bid_qty
+        self.ask_px = ask_px
+        self.ask_qty = ask_qty
+        self.timestamp = timestamp
+        self.receive_time = receive_time
 
+    def copy(self):
+        # numpy 数组需要复制
+        return copy.deepcopy(self)
@@ -0,0 +1,104 @@
+# MarketState.py
+
+"""
+所有 symbol 最新行情的共享状态, 由 datahandler 在推送时更新, executor/portfolio/strategy 直接读取
+
+1. 每个字段是一个按 symbol 序号排列的 numpy 数组 (symbol 序号与 symbol_exchange_list 一致)
+2. 读取某个 symbol 的数据为 O(1), 不需要每次生成包含所有 symbol 的 dict
+3. 还没有数据的 symbol 价格为 nan, 时间为 -1
+4. version 在每次推送时加一, mid_prices() 等需要计算的结果在同一个 version 内只计算一次
+"""
+
+import numpy as np
+
+
+class MarketState(object):
+    """
+    symbol_exchange_list: 与 datahandler 相同的 symbol 列表
+    """
+
+    def __init__(self, symbol_exchange_list):
+        self.symbol_exchange_list = list(symbol_exchange_list)
+        self.index = {s: i for i, s in enumerate(self.symbol_exchange_list)}
+        n = len(self.symbol_exchange_list)
+        # trade
+        self.last_price = np.full(n, np.nan)
+        self.last_qty = np.full(n, np.nan)
+        self.trade_time = np.full(n, -1, dtype=np.int64)
+        # LOB (bid1&ask1)
+        self.bid1 = np.full(n, np.nan)
+        self.bidqty1 = np.full(n, np.nan)
+        self.ask1 = np.full(n, np.nan)
+        self.askqty1 = np.full(n, np.nan)
+        self.LOB_time = np.full(n, -1, dtype=np.int64)
+        # 推送的版本号以及按版本缓存的计算结果
+        self.version = 0
+        self.now = None
+        self._mid_prices = np.full(n, np.nan)
+        self._mid_version = -1
+
+    def advance(self, now):
+        """
+        开始新的一次推送
+        """
+        self.version += 1
+        self.now = now
+
+    def update_trade(self, i, store, row):
+        """
+        用 TradeStore 的第 row 行更新第 i 个 symbol 的最新成交
+        """
+        self.last_price[i] = store.price[row]
+        self.last_qty[i] = store.qty[row]
+        self.trade_time[i] = store.time[row]
+
+    def update_LOB(self, i, store, row):
+        """
+        用 LOBStore 的第 row 行更新第 i 个 symbol 的 bid1/ask1
+        """
+        self.bid1[i] = store.bid1[row]
+        self.bidqty1[i] = store.bidqty1[row]
+        self.ask1[i] = store.ask1[row]
+        self.askqty1[i] = store.askqty1[row]
+        self.LOB_time[i] = store.time[row]
+
+    ########## O(1) per-symbol accessors ##########
+
+    def last_price_of(self, s):
+        """
+        最新成交价, 还没有成交时返回 None
+        """
+        price = self.last_price.item(self.index[s])
+        return None if price != price else price
+
+    def best_bid_ask(self, s):
+        """
+        (bid1, ask1), 还没有 LOB 数据时为 nan
+        """
+        i = self.index[s]
+        return self.bid1.item(i), self.ask1.item(i)
+
+    def mid_price_of(self, s):
+        i = self.index[s]
+        return (self.bid1.item(i) + self.ask1.item(i)) / 2
+
+    ########## vectorized views ##########
+
+    def mid_prices(self):
+        """
+        所有 symbol 的 (bid1+ask1)/2, 同一次推送内只计算一次
+        返回的数组在下一次推送时会被覆盖
+        """
+        if self._mid_version != self.version:
+            np.add(self.bid1, self.ask1, out=self._mid_prices)
+            self._mid_prices *= 0.5
+            self._mid_version = self.version
+        return self._mid_prices
+
+    def last_prices(self):
+        """
+        所有 symbol 最新成交价的只读 view
+        """
+        view = self.last_price.view()
+        view.flags.writeable = False
+        return view
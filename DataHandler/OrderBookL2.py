@@ -0,0 +1,333 @@
+# OrderBookL2.py
+
+"""
+多档 (L2) 订单簿
+
+1. OrderBookL2: 每个 symbol 一个, bid/ask 各自是固定长度 (depth) 的 numpy 数组, 内存不随更新次数增长
+   支持整体快照 (snapshot) 以及逐档增量 (diff) 两种回放方式, 累计深度/按数量成交均价的查询为 O(档数)
+2. L2SnapshotStore: 多档快照数据的列存储, 每一档价格/数量保存为 (行数, depth) 的二维数组
+   同时提供 bid1/bidqty1/ask1/askqty1, 与 LOBStore 兼容 (推送的仍然是 Orderbook, 即第一档)
+3. L2DiffStore: 逐档增量数据的列存储 (time, side, price, qty), qty 为 0 表示删除该档
+4. L2DiffReplay: 按窗口回放增量, 生成窗口内每个增量时间戳之后前 depth 档的 L2SnapshotStore,
+   handler 中 l2_diff=True 时用它代替快照文件 (之后的推送与快照文件完全相同)
+
+快照文件的列名: time, bid1..bidN, bid1_qty..bidN_qty, ask1..askN, ask1_qty..askN_qty (与 LOB 文件的第一档一致)
+增量文件 ('symbol_exchange_L2diff.csv/parquet') 的列名: time, side (bid/ask 或者 0/1), price, qty
+"""
+
+import numpy as np
+
+from DataHandler.MarketDataStore import ColumnStore, LOBStore, with_receive_time
+from DataHandler.MarketDataStructure import Orderbook, Snapshot
+
+
+BID = 0
+ASK = 1
+L2_DIFF_COLUMNS = ['time', 'side', 'price', 'qty']
+
+
+def l2_columns(depth):
+    """
+    depth 档快照文件需要的列名
+    """
+    levels = range(1, depth + 1)
+    return (['time'] + ['bid%d' % i for i in levels] + ['bid%d_qty' % i for i in levels]
+            + ['ask%d' % i for i in levels] + ['ask%d_qty' % i for i in levels])
+
+
+class L2SnapshotStore(LOBStore):
+    """
+    多档快照数据: time, bid_px, bid_qty, ask_px, ask_qty (后四列为 (行数, depth) 的二维数组)
+    同一个时间戳只保留最后一次出现的快照
+    """
+    fields = ('bid_px', 'bid_qty', 'ask_px', 'ask_qty')
+    field_dtypes = (np.float64, np.float64, np.float64, np.float64)
+    row_nbytes = 8 + 8*4*20 + 16       # 按 20 档估计
+
+    @classmethod
+    def raw_columns(cls, df, columns):
+        time_col = columns[0]
+        depth = (len(columns) - 1) // 4
+        blocks = [df[columns[1 + k*depth:1 + (k+1)*depth]].to_numpy(dtype=np.float64) for k in range(4)]
+        return df[time_col].to_numpy(), with_receive_time({
+            'bid_px': blocks[0], 'bid_qty': blocks[1], 'ask_px': blocks[2], 'ask_qty': blocks[3]},
+            df, columns, 1 + 4*depth)
+
+    # 第一档, 与 LOBStore 兼容
+    @property
+    def bid1(self):
+        return self.bid_px[:, 0]
+
+    @property
+    def bidqty1(self):
+        return self.bid_qty[:, 0]
+
+    @property
+    def ask1(self):
+        return self.ask_px[:, 0]
+
+    @property
+    def askqty1(self):
+        return self.ask_qty[:, 0]
+
+    @property
+    def depth(self):
+        return self.bid_px.shape[1]
+
+    def record(self, i):
+        return Orderbook(symbol=self.symbol, bid1=float(self.bid_px[i, 0]), bidqty1=float(self.bid_qty[i, 0]),
+                         ask1=float(self.ask_px[i, 0]), askqty1=float(self.ask_qty[i, 0]),
+                         timestamp=int(self.time[i]), receive_time=self.receive_time_of(i))
+
+    def snapshot(self, i):
+        return Snapshot(symbol=self.symbol, bid_px=self.bid_px[i], bid_qty=self.bid_qty[i],
+                        ask_px=self.ask_px[i], ask_qty=self.ask_qty[i], timestamp=int(self.time[i]),
+                        receive_time=self.receive_time_of(i))
+
+
+class L2DiffStore(ColumnStore):
+    """
+    逐档增量数据: time, side (0 bid / 1 ask), price, qty
+    同一个时间戳的多行为同一批更新, 按文件中的顺序回放
+    """
+    fields = ('side', 'price', 'qty')
+    field_dtypes = (np.int8, np.float64, np.float64)
+    row_nbytes = 8 + 1 + 8 + 8 + 16
+    default_columns = L2_DIFF_COLUMNS
+
+    @classmethod
+    def raw_columns(cls, df, columns):
+        time_col, side_col, price_col, qty_col = columns[:4]
+        side = df[side_col].to_numpy()
+        if side.dtype.kind in 'OUS':
+            side = np.char.lower(side.astype(str)) == 'ask'
+        return df[time_col].to_numpy(), with_receive_time({
+            'side': side.astype(np.int8),
+            'price': df[price_col].to_numpy(dtype=np.float64),
+            'qty': df[qty_col].to_numpy(dtype=np.float64)}, df, columns, 4)
+
+    def record(self, i):
+        return (int(self.side[i]), float(self.price[i]), float(self.qty[i]), int(self.time[i]))
+
+
+class OrderBookL2(object):
+    """
+    固定档数的订单簿
+    px[:n] 为有效的档位, bid 从高到低, ask 从低到高; 之后的档位价格为 nan, 数量为 0
+    """
+
+    def __init__(self, depth, symbol=None):
+        self.depth = depth
+        self.symbol = symbol
+        self.px = (np.full(depth, np.nan), np.full(depth, np.nan))     # (bid, ask)
+        self.qty = (np.zeros(depth), np.zeros(depth))
+        self.n = [0, 0]
+        self.timestamp = None
+
+    ########## 回放 ##########
+
+    def _load_side(self, side, new_px, new_qty):
+        px, qty = self.px[side], self.qty[side]
+        n = min(len(new_px), self.depth)
+        px[:n] = new_px[:n]
+        qty[:n] = new_qty[:n]
+        # 快照中不足 depth 档时, 缺失的档位为 nan 或者数量为 0
+        valid = (qty[:n] > 0) & (px[:n] == px[:n])
+        k = n
+        if not valid.all():
+            k = int(valid.sum())
+            px[:k] = px[:n][valid]
+            qty[:k] = qty[:n][valid]
+        px[k:] = np.nan
+        qty[k:] = 0
+        self.n[side] = k
+
+    def apply_snapshot(self, bid_px, bid_qty, ask_px, ask_qty, timestamp=None):
+        """
+        用整体快照替换订单簿, 超过 depth 的档位被忽略
+        """
+        self._load_side(BID, bid_px, bid_qty)
+        self._load_side(ASK, ask_px, ask_qty)
+        self.timestamp = timestamp
+
+    def apply_snapshot_row(self, store, row):
+        """
+        用 L2SnapshotStore 的第 row 行替换订单簿
+        """
+        self.apply_snapshot(store.bid_px[row], store.bid_qty[row], store.ask_px[row], store.ask_qty[row],
+                            int(store.time[row]))
+
+    def _level_index(self, side, price):
+        """
+        返回 (该价格所在或者应该插入的档位, 是否已经存在)
+        """
+        n = self.n[side]
+        px = self.px[side]
+        if side == BID:
+            # bid 从高到低排列, 在反向 (从低到高) 的 view 上二分
+            i = n - int(np.searchsorted(px[n - 1::-1] if n else px[:0], price, side='right'))
+        else:
+            i = int(np.searchsorted(px[:n], price, side='left'))
+        return i, i < n and px[i] == price
+
+    def apply_diff(self, side, price, qty, timestamp=None):
+        """
+        更新一档: qty > 0 为新增或者修改数量, qty <= 0 为删除
+        插入/删除只移动该档之后的档位, 超出 depth 的档位被丢弃
+        """
+        px, q = self.px[side], self.qty[side]
+        n = self.n[side]
+        i, exists = self._level_index(side, price)
+        if exists:
+            if qty > 0:
+                q[i] = qty
+            else:
+                px[i:n - 1] = px[i + 1:n]
+                q[i:n - 1] = q[i + 1:n]
+                px[n - 1] = np.nan
+                q[n - 1] = 0
+                self.n[side] = n - 1
+        elif qty > 0 and i < self.depth:
+            end = min(n, self.depth - 1)
+            px[i + 1:end + 1] = px[i:end]
+            q[i + 1:end + 1] = q[i:end]
+            px[i] = price
+            q[i] = qty
+            self.n[side] = end + 1
+        if timestamp is not None:
+            self.timestamp = timestamp
+
+    def apply_diff_rows(self, store, lo, hi):
+        """
+        按顺序回放 L2DiffStore 中 [lo, hi) 行的增量
+        """
+        side, price, qty = store.side, store.price, store.qty
+        for r in range(lo, hi):
+            self.apply_diff(int(side[r]), price[r], qty[r])
+        if hi > lo:
+            self.timestamp = int(store.time[hi - 1])
+
+    ########## 查询 ##########
+
+    def best_bid(self):
+        return self.px[BID][0] if self.n[BID] else np.nan
+
+    def best_ask(self):
+        return self.px[ASK][0] if self.n[ASK] else np.nan
+
+    def levels(self, side):
+        """
+        有效档位的 (价格, 数量) view
+        """
+        n = self.n[side]
+        return self.px[side][:n], self.qty[side][:n]
+
+    def cum_qty(self, side, levels=None):
+        """
+        前 levels 档的累计数量 (数组)
+        """
+        n = self.n[side] if levels is None else min(levels, self.n[side])
+        return np.cumsum(self.qty[side][:n])
+
+    def qty_within(self, side, price):
+        """
+        价格优于或等于 price 的档位的总数量
+        """
+        px, n = self.px[side], self.n[side]
+        if side == BID:
+            k = n - int(np.searchsorted(px[n - 1::-1] if n else px[:0], price, side='left'))
+        else:
+            k = int(np.searchsorted(px[:n], price, side='right'))
+        return float(self.qty[side][:k].sum())
+
+    def fill_price(self, direction, quantity, limit_price=None):
+        """
+        按档位吃单 quantity 的成交均价, BUY 吃 ask, SELL 吃 bid
+        limit_price 为 None 时 (市价单) 深度不足的部分按最后一档的价格成交
+        给出 limit_price 时只使用价格优于或等于 limit_price 的档位, 深度不足时返回 nan
+        """
+        side = ASK if direction == 'BUY' else BID
+        px, q = self.levels(side)
+        if limit_price is not None:
+            k = (px <= limit_price).sum() if side == ASK else (px >= limit_price).sum()
+            px, q = px[:k], q[:k]
+        if len(px) == 0:
+            return np.nan
+        cum = np.cumsum(q)
+        k = int(np.searchsorted(cum, quantity, side='left'))
+        if k >= len(px):
+            if limit_price is not None:
+                return np.nan
+            return float((np.dot(px, q) + (quantity - cum[-1]) * px[-1]) / quantity)
+        filled = cum[k - 1] if k else 0.0
+        return float((np.dot(px[:k], q[:k]) + (quantity - filled) * px[k]) / quantity)
+
+
+# 回放增量的订单簿在 depth 之外多保留的档数, 前 depth 档中的某一档被删除时由之后的档位补上
+L2_DIFF_MARGIN = 20
+
+
+class L2DiffReplay(object):
+    """
+    由逐档增量数据源按窗口重建的 depth 档快照数据源, 接口与 ParquetWindowReader 一致
+    diffs 为打开的增量数据源 (L2DiffStore/ParquetWindowReader/MultiDaySource), 窗口的范围以及行数的估计直接使用 diffs,
+    因此与其它数据源一样受 read_mode='window'/window_rows/memory_budget/date_range 的限制
+    read_window 只读取该窗口的增量, 在跨窗口保留的订单簿 (depth + margin 档) 上按顺序回放,
+    为窗口内的每个增量时间戳生成一行快照; receive_time 为每个时间戳最后一行增量的接收时间
+    窗口需要按时间顺序读取 (handler 的窗口是连续的); 超出 depth + margin 的档位被丢弃,
+    之后前 depth 档连续删除超过 margin 档而没有新的档位时, 快照中缺少的档位为 nan
+    """
+
+    def __init__(self, diffs, depth, margin=L2_DIFF_MARGIN):
+        self.diffs = diffs
+        self.symbol = diffs.symbol
+        self.depth = depth
+        self.book = OrderBookL2(depth + margin, self.symbol)
+        self.end = None       # 已经回放的最后一个窗口的结束时间
+
+    @property
+    def quality_report(self):
+        return self.diffs.quality_report
+
+    @property
+    def row_nbytes(self):
+        return max(self.diffs.row_nbytes, 8 + 8*4*self.depth + 16)
+
+    def next_time_after(self, after=None):
+        return self.diffs.next_time_after(after)
+
+    def last_time(self):
+        return self.diffs.last_time()
+
+    def count_between(self, start, end):
+        """
+        每个增量时间戳一行快照, 增量的行数为上限
+        """
+        return self.diffs.count_between(start, end)
+
+    def read_window(self, start, end):
+        return self.replay_window(self.diffs.read_window(start, end), start, end)
+
+    def replay_window(self, diffs, start, end):
+        """
+        回放 diffs (diffs.read_window(start, end) 的结果), 返回窗口内的 L2SnapshotStore
+        WindowReaderPool 在子进程中读取 diffs, 在父进程中调用这里
+        """
+        if self.end is not None and start <= self.end:
+            raise ValueError('L2DiffReplay windows must be read in time order: [%d, %d] after %d' % (start, end, self.end))
+        self.end = end
+        book, depth = self.book, self.depth
+        n = len(diffs.group_time)
+        columns = {'bid_px': np.full((n, depth), np.nan), 'bid_qty': np.zeros((n, depth)),
+                   'ask_px': np.full((n, depth), np.nan), 'ask_qty': np.zeros((n, depth))}
+        group_start = diffs.group_start
+        for g in range(n):
+            book.apply_diff_rows(diffs, int(group_start[g]), int(group_start[g + 1]))
+            columns['bid_px'][g] = book.px[BID][:depth]
+            columns['bid_qty'][g] = book.qty[BID][:depth]
+            columns['ask_px'][g] = book.px[ASK][:depth]
+            columns['ask_qty'][g] = book.qty[ASK][:depth]
+        if diffs.receive_time is not None:
+            columns['receive_time'] = np.ascontiguousarray(diffs.receive_time[group_start[1:] - 1])
+        time = np.array(diffs.group_time, dtype=np.int64)
+        return L2SnapshotStore.from_arrays(self.symbol, time, columns, time, np.arange(n + 1, dtype=np.int64))
@@ -0,0 +1,128 @@
+# ParallelLoader.py
+
+"""
+多进程并行读取/解码每个 symbol 的 trade 和 LOB 文件
+
+1. 每个文件是一个独立的任务, 在进程池中并行解码, 父进程按任务顺序取回结果, 与串行读取的结果完全一致
+2. 子进程只返回紧凑的 numpy 数组 (store), 不返回逐行的 object
+3. read_mode='mmap' 时子进程只负责生成缓存, 父进程直接内存映射打开, 数据不经过进程间通信
+4. read_mode='window' 时每个窗口内各个数据源的读取也可以放到进程池中 (WindowReaderPool)
+5. enable_source_cache() 之后同一个进程中的 handler 共用已经打开的数据源 (参数扫描时每次回测都新建 handler)
+   preload_sources() 在父进程中按 handler 的参数预先读取, 不留下后台线程/进程池, 之后可以安全地 fork
+"""
+
+import contextlib
+import os
+import queue
+from concurrent.futures import ProcessPoolExecutor
+
+from DataHandler.MarketDataStore import open_source
+from DataHandler.MarketDataCache import load_cached_store
+
+
+def _open_source_task(task):
+    store_cls, symbol, file_dir, kind, columns, is_csv, read_mode, cache_dir, clean = task
+    if read_mode == 'mmap':
+        load_cached_store(store_cls, symbol, file_dir, kind, columns, is_csv, cache_dir, clean)
+        return None
+    return open_source(*task)
+
+
+# 进程内的数据源缓存 {task key: source}, None 为关闭
+_source_cache = None
+# 可以缓存的 read_mode: store 打开之后只读 (read_window 返回新的切片), 可以被多个 handler 共用
+_CACHED_READ_MODES = ('full', 'mmap')
+
+
+def enable_source_cache():
+    """
+    打开进程内的数据源缓存, 之后 open_sources 打开的 'full'/'mmap' 数据源按参数保存,
+    同一个进程中之后的 handler 直接使用已经读取的 store, 不再解析文件
+    fork 出的子进程继承父进程的缓存 (copy-on-write, numpy 数组不会被复制)
+    """
+    global _source_cache
+    if _source_cache is None:
+        _source_cache = {}
+    return _source_cache
+
+
+def disable_source_cache():
+    global _source_cache
+    _source_cache = None
+
+
+def preload_sources(handler_cls, file_dir, symbol_list, exchange_list, **handler_params):
+    """
+    打开数据源缓存并按 handler 的参数读取所有数据源 (读取/清洗与 handler 完全一致), 返回打开的数据源
+    handler_cls 为 handler 的类 (或者参数相同的工厂函数), 由调用者给出
+    只用来读取: 不预读取窗口 (prefetch=0), 读取完之后立即 close(), 不会有线程或者进程池留在进程中
+    """
+    enable_source_cache()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        handler = handler_cls(queue.Queue(), symbol_list=symbol_list, exchange_list=exchange_list,
+                              file_dir=file_dir, **dict(handler_params, prefetch=0))
+    handler.close()
+    return handler._get_opened_sources()
+
+
+def _task_key(task):
+    store_cls, symbol, file_dir, kind, columns, is_csv, read_mode, cache_dir, clean = task
+    return (store_cls, symbol, os.path.abspath(file_dir), kind, tuple(columns), is_csv, read_mode, cache_dir, clean)
+
+
+def open_sources(tasks, n_workers=1):
+    """
+    tasks 为 open_source 的参数列表, 按 tasks 的顺序返回打开的数据源
+    read_mode='window' 时打开数据源只需要读取 parquet 的统计信息, 不需要进程池
+    打开了数据源缓存时只打开缓存中没有的数据源
+    """
+    cache = _source_cache
+    if cache is None:
+        return _open_sources(tasks, n_workers)
+    keys = [_task_key(task) if task[6] in _CACHED_READ_MODES else None for task in tasks]
+    missing = [i for i, key in enumerate(keys) if key is None or key not in cache]
+    opened = dict(zip(missing, _open_sources([tasks[i] for i in missing], n_workers)))
+    for i, source in opened.items():
+        if keys[i] is not None:
+            cache[keys[i]] = source
+    return [opened[i] if i in opened else cache[key] for i, key in enumerate(keys)]
+
+
+def _open_sources(tasks, n_workers=1):
+    parallel = [i for i, task in enumerate(tasks) if task[6] != 'window']
+    if n_workers <= 1 or len(parallel) <= 1:
+        return [open_source(*task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=min(n_workers, len(parallel))) as pool:
+        results = dict(zip(parallel, pool.map(_open_source_task, [tasks[i] for i in parallel])))
+    sources = []
+    for i, task in enumerate(tasks):
+        source = results.get(i)
+        # window 模式以及 mmap 模式 (缓存已经生成) 在父进程中打开
+        sources.append(open_source(*task) if source is None else source)
+    return sources
+
+
+def _read_window_task(args):
+    source, start, end = args
+    return source.read_window(start, end)
+
+
+class WindowReaderPool(object):
+    """
+    read_mode='window' 时在进程池中并行读取每个数据源的窗口
+    """
+
+    def __init__(self, n_workers):
+        self.pool = ProcessPoolExecutor(max_workers=n_workers)
+
+    def read_window(self, sources, start, end):
+        """
+        有状态的数据源 (OrderBookL2.L2DiffReplay) 在子进程中只读取原始的增量, 在父进程中按窗口顺序回放
+        """
+        raw = [getattr(source, 'diffs', source) for source in sources]
+        stores = self.pool.map(_read_window_task, [(source, start, end) for source in raw])
+        return [store if raw_source is source else source.replay_window(store, start, end)
+                for source, raw_source, store in zip(sources, raw, stores)]
+
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,110 @@
+# ReplayFeedServer.py
+
+"""
+本地的行情推送服务器, 用于测试 LiveTradeLOBDataHandler
+读取本地的 trade/LOB 文件, 按时间顺序以 TCP 推送, 模拟交易所的行情接口
+
+消息格式 (每行一个 json, 以换行符分隔):
+    {"type": "trade", "symbol": "btc_usdt_bybit", "time": 1704042025312, "price": 42611.99, "qty": 0.02789, "is_buyer_maker": false}
+    {"type": "LOB", "symbol": "btc_usdt_bybit", "time": 1704042025312, "bid1": 42611.99, "bidqty1": 1.1, "ask1": 42612.0, "askqty1": 0.5}
+
+使用 writer.drain() 推送, 客户端读取变慢时服务器也会等待 (TCP 背压)
+
+usage:
+    python DataHandler/ReplayFeedServer.py data_sample/20240101 btc_usdt_bybit btc_usdt_okex --port 8765 --speed 10
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+sys.path.append("..")
+
+from DataHandler.MarketDataStore import TradeStore, LOBStore, TRADE_COLUMNS, LOB_COLUMNS, open_source
+from DataHandler.TimelineMerger import TimelineMerger
+
+
+def _trade_message(store, i):
+    return {'type': 'trade', 'symbol': store.symbol, 'time': int(store.time[i]), 'price': float(store.price[i]),
+            'qty': float(store.qty[i]), 'is_buyer_maker': bool(store.is_buyer_maker[i])}
+
+
+def _LOB_message(store, i):
+    return {'type': 'LOB', 'symbol': store.symbol, 'time': int(store.time[i]),
+            'bid1': float(store.bid1[i]), 'bidqty1': float(store.bidqty1[i]),
+            'ask1': float(store.ask1[i]), 'askqty1': float(store.askqty1[i])}
+
+
+class ReplayFeedServer(object):
+    """
+    symbol_exchange_list 中每个 symbol 的 trade/LOB 文件按时间归并后推送给每一个连接的客户端
+    speed: 回放速度 (1 为实时, 10 为 10 倍速), None 为不等待, 尽可能快地推送
+    """
+
+    def __init__(self, symbol_exchange_list, file_dir, is_csv=False, host='127.0.0.1', port=8765, speed=None):
+        self.symbol_exchange_list = symbol_exchange_list
+        self.file_dir = file_dir
+        self.is_csv = is_csv
+        self.host = host
+        self.port = port
+        self.speed = speed
+        self.server = None
+
+    def _open_stores(self):
+        stores = []
+        for s in self.symbol_exchange_list:
+            stores.append(open_source(TradeStore, s, self.file_dir, 'trade', TRADE_COLUMNS, self.is_csv))
+            stores.append(open_source(LOBStore, s, self.file_dir, 'LOB', LOB_COLUMNS, self.is_csv))
+        return stores
+
+    async def _handle_client(self, reader, writer):
+        merger = TimelineMerger(self._open_stores())
+        loop = asyncio.get_running_loop()
+        start_time, start_clock = merger.peek_time(), loop.time()
+        try:
+            while merger:
+                timestamp, updates = merger.pop()
+                if self.speed:
+                    delay = start_clock + (timestamp - start_time) / 1000 / self.speed - loop.time()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                lines = []
+                for i, records in updates:
+                    message = _LOB_message if i & 1 else _trade_message
+                    for r in range(records.lo, records.hi):
+                        lines.append(json.dumps(message(records.store, r)))
+                writer.write(('\n'.join(lines) + '\n').encode())
+                await writer.drain()
+        except (ConnectionResetError, BrokenPipeError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle_client, self.host, self.port)
+        # port=0 时由系统分配端口
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.server
+
+    async def serve_forever(self):
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='replay local trade/LOB files as a TCP market data feed')
+    parser.add_argument('file_dir')
+    parser.add_argument('symbols', nargs='+', help='symbol_exchange, e.g. btc_usdt_bybit')
+    parser.add_argument('--csv', action='store_true')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--speed', type=float, default=None)
+    args = parser.parse_args()
+    server = ReplayFeedServer(args.symbols, args.file_dir, args.csv, args.host, args.port, args.speed)
+    asyncio.run(server.serve_forever())
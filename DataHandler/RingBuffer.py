@@ -0,0 +1,88 @@
+# RingBuffer.py
+
+"""
+固定容量的环形缓冲区, 用于保存每个 symbol 最近的 trade/LOB 历史
+
+1. 每一列是一个连续的 numpy 数组, 追加数据为 O(1) (均摊)
+2. 数组长度为 2 * capacity, 写满之后把最近的数据整体搬到数组开头,
+   所以最近 N 条数据总是连续的, 可以直接返回 numpy view, 不需要复制
+"""
+
+import numpy as np
+
+
+class RingBuffer(object):
+    """
+    多列的环形缓冲区
+    columns: [(列名, dtype), ...]
+    """
+
+    def __init__(self, capacity, columns):
+        if capacity < 1:
+            raise ValueError('RingBuffer capacity should be >= 1')
+        self.capacity = capacity
+        self.columns = {name: np.empty(2 * capacity, dtype=dtype) for name, dtype in columns}
+        self.end = 0        # 下一条数据写入的位置
+        self.count = 0      # 缓冲区中有效数据的数量, 不超过 capacity
+
+    def __len__(self):
+        return self.count
+
+    def _make_room(self, n):
+        """
+        保证数组末尾还有 n 个位置, 空间不够的时候把需要保留的数据搬到数组开头
+        """
+        if self.end + n <= 2 * self.capacity:
+            return
+        keep = min(self.count, self.capacity - n)
+        if keep > 0:
+            for arr in self.columns.values():
+                arr[:keep] = arr[self.end - keep:self.end]
+        self.end = keep
+        self.count = keep
+
+    def extend(self, source, lo, hi):
+        """
+        追加 source 中 [lo, hi) 行的数据, source 需要有与列名相同的数组属性 (如 ColumnStore)
+        超过 capacity 的部分只保留最后 capacity 行
+        """
+        n = hi - lo
+        if n <= 0:
+            return
+        if n > self.capacity:
+            lo = hi - self.capacity
+            n = self.capacity
+        self._make_room(n)
+        e = self.end
+        if n == 1:
+            for name, arr in self.columns.items():
+                arr[e] = getattr(source, name)[lo]
+        else:
+            for name, arr in self.columns.items():
+                arr[e:e + n] = getattr(source, name)[lo:hi]
+        self.end = e + n
+        self.count = min(self.count + n, self.capacity)
+
+    def append(self, row):
+        """
+        追加一行数据, row 为 {列名: 标量}
+        """
+        self._make_room(1)
+        e = self.end
+        for name, arr in self.columns.items():
+            arr[e] = row[name]
+        self.end = e + 1
+        self.count = min(self.count + 1, self.capacity)
+
+    def latest(self, N=None):
+        """
+        返回最近 N 条数据 {列名: 只读的 numpy view}, 数据不足时返回全部
+        view 会在之后的更新中被覆盖, 如果需要长期保存请 copy
+        """
+        n = self.count if N is None else max(0, min(N, self.count))
+        outcomes = {}
+        for name, arr in self.columns.items():
+            view = arr[self.end - n:self.end]
+            view.flags.writeable = False
+            outcomes[name] = view
+        return outcomes
@@ -0,0 +1,164 @@
+# SharedMarketData.py
+
+"""
+多个回测进程共用的行情数据 (multiprocessing.shared_memory)
+
+1. 父进程: SharedMarketData.load(handler_cls, ...) 按 handler 的参数打开所有数据源 (读取/清洗与 handler 完全一致),
+   每个 store 的所有列复制到一个共享内存段中, 之后父进程中的 store 也指向共享内存 (只保留一份)
+2. worker: attach(manifest) 按名字打开共享内存段, 直接在共享内存上构造只读的 numpy 数组 (不复制),
+   并放入进程内的数据源缓存 (ParallelLoader.enable_source_cache); handler 给出 shared_data=manifest 时自动 attach,
+   之后按相同参数创建的 handler 直接从共享内存回放
+3. manifest 只包含共享内存段的名字以及每一列的 offset/dtype/shape, 可以 pickle 传给 worker
+4. 增加 worker 时每个 worker 只多出 handler/策略本身的状态, 行情数据的内存不随 worker 数量增长
+5. 父进程用完之后调用 close() (或者使用 with 语句) 释放共享内存
+
+只支持 read_mode='full'/'mmap' (整个文件在内存中的 store); 'window'/'recorded' 每个窗口单独读取, 不能共享
+"""
+
+import contextlib
+import sys
+from multiprocessing import shared_memory
+import numpy as np
+sys.path.append("..")
+
+from DataHandler.MarketDataStore import ColumnStore
+from DataHandler.MarketDataCache import _array_names, _OPTIONAL_ARRAYS
+from DataHandler.ParallelLoader import enable_source_cache, preload_sources
+
+
+# 每一列在共享内存段中按 64 bytes 对齐
+_ALIGN = 64
+
+# 当前进程 attach 的共享内存段, 保持引用直到进程结束 (store 的数组直接使用共享内存)
+_attached = {}
+
+
+def _layout(store):
+    """
+    store 的每一列在共享内存段中的位置 {列名: (offset, dtype, shape)} 以及段的大小
+    """
+    layout = {}
+    offset = 0
+    for name in _array_names(type(store)) + _OPTIONAL_ARRAYS:
+        array = getattr(store, name, None)
+        if array is None:
+            continue
+        if array.dtype.hasobject:
+            raise ValueError('%s.%s has dtype object and cannot be shared' % (store.symbol, name))
+        layout[name] = (offset, array.dtype.str, array.shape)
+        offset += -(-array.nbytes // _ALIGN) * _ALIGN
+    return layout, offset
+
+
+def _store_from_buffer(entry, buf):
+    """
+    在共享内存上构造只读的 store, 不复制数据
+    """
+    arrays = {}
+    for name, (offset, dtype, shape) in entry['layout'].items():
+        array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=buf, offset=offset)
+        array.flags.writeable = False
+        arrays[name] = array
+    store = entry['store_cls'].from_arrays(entry['symbol'], arrays['time'], arrays,
+                                           arrays['group_time'], arrays['group_start'])
+    if entry['quality_report'] is not None:
+        store.quality_report = entry['quality_report']
+    return store
+
+
+def _open_segment(name):
+    try:
+        # python >= 3.13: attach 的进程不需要 resource tracker 管理 (由创建的进程释放)
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+def attach(manifest):
+    """
+    worker: 打开 manifest 中的共享内存段并放入进程内的数据源缓存, 返回 {task key: store}
+    已经 attach 过的段 (或者 fork 时从父进程继承的) 不会重复打开
+    """
+    cache = enable_source_cache()
+    stores = {}
+    for entry in manifest:
+        key = entry['key']
+        if entry['segment'] not in _attached or key not in cache:
+            shm = _attached.get(entry['segment']) or _open_segment(entry['segment'])
+            _attached[entry['segment']] = shm
+            cache[key] = _store_from_buffer(entry, shm.buf)
+        stores[key] = cache[key]
+    return stores
+
+
+class SharedMarketData(object):
+    """
+    父进程中的共享行情数据
+    manifest:  传给 worker 的描述 (list of dict), 见 attach
+    segments:  创建的 SharedMemory, close() 时释放
+    """
+
+    def __init__(self, manifest, segments):
+        self.manifest = manifest
+        self.segments = segments
+
+    @classmethod
+    def load(cls, handler_cls, file_dir, symbol_list, exchange_list, **handler_params):
+        """
+        用 handler 的参数打开所有数据源并复制到共享内存, handler_cls 见 ParallelLoader.preload_sources
+        worker 中的 handler 需要使用相同的 file_dir/symbol/exchange 以及读取相关的参数 (is_csv/read_mode/clean/l2_depth 等)
+        """
+        sources = preload_sources(handler_cls, file_dir, symbol_list, exchange_list, **handler_params)
+        cache = enable_source_cache()
+        keys = {id(source): key for key, source in cache.items()}
+        manifest, segments = [], []
+        try:
+            for source in sources:
+                if not isinstance(source, ColumnStore) or id(source) not in keys:
+                    raise ValueError("shared market data needs read_mode 'full' or 'mmap', got %s"
+                                     % type(source).__name__)
+                layout, size = _layout(source)
+                shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+                segments.append(shm)
+                for name, (offset, dtype, shape) in layout.items():
+                    target = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+                    target[...] = getattr(source, name)
+                    del target
+                entry = {'key': keys[id(source)], 'segment': shm.name, 'store_cls': type(source),
+                         'symbol': source.symbol, 'layout': layout, 'quality_report': source.quality_report}
+                manifest.append(entry)
+                # 父进程之后的 handler 也使用共享内存中的数据, 原来读取的数组被释放
+                _attached[shm.name] = shm
+                cache[entry['key']] = _store_from_buffer(entry, shm.buf)
+        except BaseException:
+            cls(manifest, segments).close()
+            raise
+        return cls(manifest, segments)
+
+    @property
+    def nbytes(self):
+        return sum(shm.size for shm in self.segments)
+
+    def close(self):
+        """
+        释放共享内存: 从数据源缓存中移除, 关闭并 unlink 所有的段
+        仍然被引用的 store (例如还没有释放的 handler) 所在的段只 unlink, 在引用释放之后由操作系统回收
+        """
+        cache = enable_source_cache()
+        for entry in self.manifest:
+            cache.pop(entry['key'], None)
+        for shm in self.segments:
+            _attached.pop(shm.name, None)
+            try:
+                shm.close()
+            except BufferError:
+                pass
+            with contextlib.suppress(FileNotFoundError):
+                shm.unlink()
+        self.manifest, self.segments = [], []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
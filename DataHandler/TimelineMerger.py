@@ -0,0 +1,79 @@
+# TimelineMerger.py
+
+"""
+对多个已经按时间排序的数据流做 k 路归并 (k-way merge)
+替代原来把所有时间戳放进一个 list 再 set + sort 的全局 time index
+
+1. 堆中每个数据流只保存一个 (下一个时间戳, 数据流序号), index 的内存为 O(数据流数量)
+2. 数据流序号即推送的优先级: 同一时间戳下先按 symbol 顺序, 同一 symbol 中 trade 优先于 LOB
+3. pop_until(end) 一次取出 end 之前的所有数据, 每个数据流的多个时间戳合并为一个连续的 RecordView (按时间分桶推送)
+"""
+
+import heapq
+import numpy as np
+
+
+class TimelineMerger(object):
+    """
+    对一组 ColumnStore 按时间戳做归并
+    stores 的顺序决定同一时间戳下的推送顺序
+    """
+
+    def __init__(self, stores):
+        self.stores = stores
+        self.heap = [(int(store.group_time[store.cursor]), i)
+                     for i, store in enumerate(stores)
+                     if store is not None and store.cursor < len(store.group_time)]
+        heapq.heapify(self.heap)
+
+    def __len__(self):
+        return len(self.heap)
+
+    def peek_time(self):
+        """
+        下一个要推送的时间戳, 没有数据时返回 None
+        """
+        return self.heap[0][0] if self.heap else None
+
+    def pop(self):
+        """
+        取出下一个时间戳的所有数据
+        return: (timestamp, [(数据流序号, RecordView), ...]), 列表按数据流序号排序
+        """
+        heap = self.heap
+        timestamp = heap[0][0]
+        updates = []
+        while heap and heap[0][0] == timestamp:
+            i = heap[0][1]
+            store = self.stores[i]
+            c = store.cursor
+            updates.append((i, store.records(store.group_start[c], store.group_start[c + 1])))
+            store.cursor = c + 1
+            if c + 1 < len(store.group_time):
+                heapq.heapreplace(heap, (int(store.group_time[c + 1]), i))
+            else:
+                heapq.heappop(heap)
+        return timestamp, updates
+
+    def pop_until(self, end):
+        """
+        取出时间 <= end 的所有数据, 每个数据流只返回一个 RecordView (覆盖多个时间戳)
+        return: (最后一个时间戳, [(数据流序号, RecordView), ...]), 列表按数据流序号排序
+        """
+        heap = self.heap
+        timestamp = heap[0][0]
+        updates = []
+        while heap and heap[0][0] <= end:
+            i = heap[0][1]
+            store = self.stores[i]
+            c = store.cursor
+            c_end = int(np.searchsorted(store.group_time, end, side='right'))
+            updates.append((i, store.records(store.group_start[c], store.group_start[c_end])))
+            timestamp = max(timestamp, int(store.group_time[c_end - 1]))
+            store.cursor = c_end
+            if c_end < len(store.group_time):
+                heapq.heapreplace(heap, (int(store.group_time[c_end]), i))
+            else:
+                heapq.heappop(heap)
+        updates.sort(key=lambda x: x[0])
+        return timestamp, updates
@@ -0,0 +1,215 @@
+# TradeLOBDataMixin.py
+
+"""
+同时推送 trade 以及 LOB (bid1&ask1) 的 DataHandler 共用的数据结构和查询接口
+HistoricTradeLOBHourlyDataHandler (回测) 与 LiveTradeLOBDataHandler (实盘) 都继承这个 mixin,
+策略/portfolio/executor 在两者之间切换时看到的是同一套接口
+
+子类负责读取数据并推送, 推送时维护这里的数据结构:
+    - latest_symbol_exchange_{trade,LOB}_data: dict{symbol: List[Trade]/List[Orderbook]} 最新推送的数据
+      (回测中为 MarketDataStore.RecordView, 用法与 list 一致)
+    - latest_symbol_exchange_{trade,LOB}_data_time: dict{symbol: int} 更新到的时间
+    - _trade_history/_LOB_history: 每个 symbol 最近 history_depth 条数据 (RingBuffer)
+    - _latest_trade_views/_latest_LOB_views: 有数据的 symbol -> 最新推送的数据 (最后一条为最新的 Trade/Orderbook)
+    - _latest_trade_prices: 有数据的 symbol -> 最新成交价
+    - _updated_{trade,LOB}_symbols, _updated_bar_symbols: 本次推送中发生更新的 symbol
+    - _bar_builders: symbol -> [BarBuilder, ...] (与 bars 的顺序一致)
+"""
+
+from types import MappingProxyType
+from typing import List, Tuple
+import sys
+sys.path.append("..")
+
+from object import DataHandlerError
+from DataHandler.MarketDataStore import TradeStore, LOBStore, LatestRecordMap
+from DataHandler.RingBuffer import RingBuffer
+from DataHandler.BarBuilder import BarBuilder
+
+
+class TradeLOBDataMixin(object):
+    """
+    trade + LOB 的数据结构以及 get_latest_* 查询接口, 见模块说明
+    子类在初始化时调用 _init_trade_LOB_data, 之后对每个 symbol 调用 _register_symbol (需要 self.history_depth)
+    """
+
+    def _init_trade_LOB_data(self, bars:List[Tuple[str, float]] = None):
+        self.bars = [(bar_type, size) for bar_type, size in bars] if bars else []
+        # trade 数据
+        self.latest_symbol_exchange_trade_data = {}     # 最新推送的数据
+        self.latest_symbol_exchange_trade_data_time = {}    # 更新到的时间表
+        self._trade_history = {}                        # 最近 history_depth 条 trade (RingBuffer)
+        # LOB 数据 (最高频的LOB 仅保存bid1&ask1)
+        self.latest_symbol_exchange_LOB_data = {}
+        self.latest_symbol_exchange_LOB_data_time = {}
+        self._LOB_history = {}                          # 最近 history_depth 条 LOB (RingBuffer)
+        self._pending_history = {}                      # 还没有写入的历史: RingBuffer -> [store, lo, hi], 读取或推送时写入
+        self._bar_builders = {}
+        self._updated_bar_symbols = {}                  # bar -> 本次推送中完成了新 bar 的 symbol
+        # 推送时维护的状态, 查询的开销只与发生更新的 symbol 数量有关, 与 symbol 总数无关
+        self._updated_trade_symbols = []
+        self._updated_LOB_symbols = []
+        self._latest_trade_views = {}
+        self._latest_LOB_views = {}
+        self._latest_trade_prices = {}
+        self._latest_trades = LatestRecordMap(self._latest_trade_views)
+        self._latest_LOBs = LatestRecordMap(self._latest_LOB_views)
+        self._latest_prices = MappingProxyType(self._latest_trade_prices)
+
+    def _register_symbol(self, s):
+        """
+        初始化一个 symbol 的数据结构
+        """
+        self.latest_symbol_exchange_trade_data[s] = []
+        self.latest_symbol_exchange_trade_data_time[s] = None
+        self.latest_symbol_exchange_LOB_data[s] = []
+        self.latest_symbol_exchange_LOB_data_time[s] = None
+        self._trade_history[s] = RingBuffer(self.history_depth, TradeStore.column_dtypes())
+        self._LOB_history[s] = RingBuffer(self.history_depth, LOBStore.column_dtypes())
+        self._bar_builders[s] = [BarBuilder(s, bar_type, size, self.history_depth) for bar_type, size in self.bars]
+
+    def _flush_history(self, history):
+        pending = self._pending_history.pop(history, None)
+        if pending is not None:
+            history.extend(*pending)
+
+    ###########################################
+    ########## func for request data ##########
+    ###########################################
+
+    def _get_symbol_exchange(self, symbol, exchange=None):
+        symbol_exchange = symbol if exchange is None else str(symbol) + '_' + str(exchange)
+        if symbol_exchange not in self._trade_history:
+            raise DataHandlerError(' %s 不在 symbol_exchange_list 中' % symbol_exchange)
+        return symbol_exchange
+
+    def get_latest_ticks(self, symbol, exchange=None, N=1):
+        """
+        获取某个 symbol 最近 N 条 trade (不足 N 条时返回全部), 最多保存 history_depth 条
+        symbol/exchange 可以分开给出, 也可以直接给出 symbol_exchange (此时 exchange=None)
+        返回只读的 numpy view, 不复制数据; view 会在之后的推送中被覆盖, 如果需要长期保存请 copy
+
+        return sample:
+            {'time': array([1704042025312, 1704042025507]), 'price': array([42611.99, 42612.  ]),
+             'qty': array([0.02789, 0.00687]), 'is_buyer_maker': array([False,  True])}
+        """
+        s = self._get_symbol_exchange(symbol, exchange)
+        history = self._trade_history[s]
+        self._flush_history(history)
+        return history.latest(N)
+
+    def get_latest_LOB_ticks(self, symbol, exchange=None, N=1):
+        """
+        获取某个 symbol 最近 N 条 LOB (bid1/ask1), 用法同 get_latest_ticks
+
+        return sample:
+            {'time': array([...]), 'bid1': array([...]), 'bidqty1': array([...]),
+             'ask1': array([...]), 'askqty1': array([...])}
+        """
+        s = self._get_symbol_exchange(symbol, exchange)
+        history = self._LOB_history[s]
+        self._flush_history(history)
+        return history.latest(N)
+
+    def _get_bar_builder(self, s, bar=None):
+        if not self.bars:
+            raise DataHandlerError(' 没有设置 bars, 请在初始化时给出需要的 bar')
+        if bar is None:
+            return self._bar_builders[s][0]
+        if tuple(bar) not in self.bars:
+            raise DataHandlerError(' %s 不在 bars 中' % str(bar))
+        return self._bar_builders[s][self.bars.index(tuple(bar))]
+
+    def get_latest_bars(self, symbol, exchange=None, bar=None, N=1):
+        """
+        获取某个 symbol 最近 N 根完成的 bar, bar 为 bars 中的一项 (例如 ('time', 1000)), None 为 bars 中的第一项
+        返回只读的 numpy view, 用法同 get_latest_ticks
+
+        return sample:
+            {'time': array([1704042026003]), 'start': array([1704042025000]), 'open': array([42611.99]),
+             'high': array([42612.]), 'low': array([42611.99]), 'close': array([42612.]), 'volume': array([0.03476]),
+             'amount': array([1481.19]), 'vwap': array([42611.99]), 'ticks': array([2])}
+        """
+        s = self._get_symbol_exchange(symbol, exchange)
+        return self._get_bar_builder(s, bar).latest(N)
+
+    def get_latest_bar(self, symbol, exchange=None, bar=None):
+        """
+        获取某个 symbol 最近一根完成的 bar (Bar), 还没有时返回 None
+        """
+        s = self._get_symbol_exchange(symbol, exchange)
+        return self._get_bar_builder(s, bar).last_bar()
+
+    def get_updated_bar_symbols(self, bar=None) -> List:
+        """
+        本次推送中完成了新 bar 的 symbol (按 symbol_exchange_list 的顺序)
+        list 在推送时生成, 请不要修改
+        """
+        if bar is None and self.bars:
+            bar = self.bars[0]
+        return self._updated_bar_symbols.get(tuple(bar) if bar else None, [])
+
+    # def get_latest_trades(self, force_now=False) -> Dict[str:Trade]:
+    def get_latest_trades(self, force_now=False):
+        """
+        获取所有 symbols 最新的trade数据
+        force_now 强制只推送时间等同于回测系统时间的数据
+        如果还没有数据的symbols不推送
+        返回的是推送时维护的只读映射 (不会每次重新生成 dict), 会随着回测的推进而更新
+        force_now=True 时只遍历本次发生更新的 symbols
+
+        return sample:
+        {'btc_usdt_binance':
+            {'symbol': 'btc_usdt_binance', 'price': 42612.0, 'qty': 0.00687, 'is_buyer_maker': True, 'timestamp': 1704042025507, 'receive_time': None},
+         'btc_usdt_bybit':
+            {'symbol': 'btc_usdt_bybit', 'price': 42611.99, 'qty': 0.02789, 'is_buyer_maker': False, 'timestamp': 1704042025312, 'receive_time': None}}
+        """
+        if force_now:
+            return {s: self.latest_symbol_exchange_trade_data[s][-1] for s in self._updated_trade_symbols}
+        return self._latest_trades
+
+    # def get_latest_LOBs(self, force_now=False) -> Dict[str:Orderbook]:
+    def get_latest_LOBs(self, force_now=False):
+        """
+        获取所有 symbols 最新的LOB数据
+        force_now 强制只推送时间等同于回测系统时间的数据
+        如果还没有数据的symbols不推送
+        返回值同 get_latest_trades, 为只读映射
+
+        return sample:
+        {'btc_usdt_binance':
+            {'symbol': 'btc_usdt_binance', 'bid1': 42611.99, 'bidqty1': 3.13322, 'ask1': 42612.0, 'askqty1': 2.67936, 'timestamp': 1704042025824, 'receive_time': None},
+         'btc_usdt_bybit':
+            {'symbol': 'btc_usdt_bybit', 'bid1': 42611.99, 'bidqty1': 1.139443, 'ask1': 42612.0, 'askqty1': 0.494114, 'timestamp': 1704042025783, 'receive_time': None}}
+        """
+        if force_now:
+            return {s: self.latest_symbol_exchange_LOB_data[s][-1] for s in self._updated_LOB_symbols}
+        return self._latest_LOBs
+
+    # def get_latest_prices(self) -> Dict[str:float]:
+    def get_latest_prices(self):
+        """
+        获取最新的价格 (最新的成交价)
+        还没有成交的symbols不推送
+        返回推送时维护的只读映射, 不会每次重新生成 dict
+
+        return sample:
+            {'btc_usdt_binance': 42612.0, 'btc_usdt_bybit': 42611.99}
+        """
+        return self._latest_prices
+
+    def get_updated_trade_symbols(self) -> List:
+        """
+        trade数据
+        获取哪些symbol发生了更新 (按 symbol_exchange_list 的顺序)
+        list 在推送时生成, 请不要修改
+        """
+        return self._updated_trade_symbols
+
+    def get_updated_LOB_symbols(self) -> List:
+        """
+        LOB数据
+        获取哪些symbol发生了更新 (按 symbol_exchange_list 的顺序)
+        list 在推送时生成, 请不要修改
+        """
+        return self._updated_LOB_symbols
@@ -12,6 +12,7 @@ LOBDataHandler 的改版
 
 import datetime
 import os, os.path
+import numpy as np
 import pandas as pd
 import queue
 from typing import List, Tuple, Dict
@@ -19,12 +20,15 @@ from abc import ABCMeta, abstractmethod
 import sys
 sys.path.append("..")
 
-from event import MarketEvent
-from object import DataHandler, DataHandlerError
+from object import DataHandlerError
 from DataHandler.MarketDataStructure import Orderbook, Trade
+from DataHandler.MarketDataStore import TradeStore, LOBStore, TRADE_COLUMNS, LOB_COLUMNS
+from DataHandler.HistoricHourlyDataHandler import HistoricHourlyDataHandler
+from DataHandler.TradeLOBDataMixin import TradeLOBDataMixin
+from DataHandler.OrderBookL2 import OrderBookL2, L2SnapshotStore, L2DiffStore, L2_DIFF_COLUMNS, l2_columns, L2DiffReplay
 
 
-class HistoricTradeLOBHourlyDataHandler(DataHandler):
+class HistoricTradeLOBHourlyDataHandler(TradeLOBDataMixin, HistoricHourlyDataHandler):
     """
     从本地文件中读取历史数据生成 DataHandler, 读取的数据主要为 LOB
     读取程序兼容 parquet 以及 csv 文件
@@ -33,7 +37,8 @@ class HistoricTradeLOBHourlyDataHandler(DataHandler):
     The reading program is compatible with both Parquet and CSV files.
     """
     def __init__(self, events:queue.Queue, symbol_list:List[str], exchange_list:List[str], 
-                 file_dir: str, is_csv:bool = True) -> None:
+                 file_dir: str, is_csv:bool = True, l2_depth:int = None, 
+                 l2_diff:bool = False, bars:List[Tuple[str, float]] = None, **kwargs) -> None:
         """
         初始化历史数据处理程序
         请求CSV文件的位置和符号列表。假设所有文件的格式都是 'symbol_exchange_trade.csv'/'symbol_exchange_LOB.csv'，其中 symbol/exchange 是列表中的str。
@@ -45,301 +50,211 @@ class HistoricTradeLOBHourlyDataHandler(DataHandler):
         csv_dir - Absolute directory path to the CSV files.
         symbol_list - A list of symbol strings.
         exchange_list - A list of symbol exchange corresponding to the symbol_list
+        l2_depth - 给出时 LOB 文件按 l2_depth 档快照读取 (列名见 OrderBookL2.l2_columns), 每个 symbol 维护一个 OrderBookL2,
+                   通过 get_order_book 获取; 推送的 Orderbook 以及 MarketState 仍然为第一档
+        l2_diff - 与 l2_depth 一起使用, True 时 LOB 数据流为逐档增量文件 'symbol_exchange_L2diff.csv/parquet'
+                  (列名 time, side, price, qty, 见 OrderBookL2.L2DiffStore) 重建的订单簿: 每个窗口读取时在跨窗口保留的
+                  订单簿上按顺序回放该窗口的增量 (OrderBookL2.L2DiffReplay), 每个增量时间戳生成一行前 l2_depth 档的快照,
+                  之后与快照文件完全相同地推送 (同一个时间戳 trade 优先)
+        bars - 由 trade 增量聚合的 bar, 例如 [('time', 1000), ('tick', 100), ('volume', 10.0)], 见 BarBuilder;
+               每个 symbol 保存最近 history_depth 根, 通过 get_latest_bars/get_latest_bar 获取
+        kwargs - 读取/窗口/回放的参数 (read_mode, cache_dir, prefetch, n_workers, window_rows, memory_budget,
+                 history_depth, date_range, bucket_ms, feed_latency, clean, shared_data), 见 HistoricHourlyDataHandler
         """ 
+        super().__init__(events, symbol_list, exchange_list, file_dir, is_csv, **kwargs)
+        self.l2_depth = l2_depth
+        self.l2_diff = l2_diff
+        if l2_diff and not l2_depth:
+            raise DataHandlerError(' l2_diff 需要同时给出 l2_depth')
+        # trade/LOB 的数据结构以及查询接口见 TradeLOBDataMixin
+        self._init_trade_LOB_data(bars)
+        self.__order_books = {}                               # l2_depth 不为 None 时每个 symbol 的 L2 订单簿
+        self.__time_bar_builders = []                         # 所有 time bar 的 (bar 序号, symbol 序号, BarBuilder), 每次推送时检查是否完成
+        self.__watched_streams = (None, None)     # fast_forward: ((trade_symbols, LOB_symbols), 关心的数据流序号)
 
-        self.events = events
-        self.file_dir = file_dir
-        self.is_csv = is_csv
-        self.symbol_exchange_list = self._agg_symbol_exchange_list(symbol_list, exchange_list)
-        print('backtest on: ', self.symbol_exchange_list)
+        # 打开每个 symbol 的数据源, 准备需要迭代的窗口
+        self._initialize_data()
 
-        # 为了时间效率我们这里暂时不处理trade数据
+    def _stream_specs(self):
         """
-        关于行情数据可以访问的两个数据结构：
-        以LOB为例, trade 数据同理：
-            - latest_symbol_exchange_LOB_data
-              dict{symbol:List[], symbol:List[],.....}
-            - latest_symbol_exchange_LOB_data_time
-              dict{symbol:int, symbol:int,.....}
+        每个 symbol 两个数据流, trade 优先于 LOB: 数据流序号 i, symbol 为 symbol_exchange_list[i // 2], i % 2 == 0 为 trade
         """
-        # trade 数据
-        self.__symbol_exchange_trade_data = {}                # 从csv读取的表单
-        self.latest_symbol_exchange_trade_data = {}     # 最新的以及历史的数据
-        self.latest_symbol_exchange_trade_data_time = {}    # 更新到的时间表
-        # LOB 数据 (最高频的LOB 仅保存bid1&ask1)
-        self.__symbol_exchange_LOB_data = {}                  # 从csv读取的表单
-        self.latest_symbol_exchange_LOB_data = {}       # 最新的以及历史的数据
-        self.latest_symbol_exchange_LOB_data_time = {}      # 更新到的时间表
-        # 时间相关的指标
-        self.start_time = None
-        self.__comb_time_index = None
-        self.comb_time_index_iter = None
-        self.backtest_now = None
-        self.continue_backtest = True
-        self.hourly_start = -1
-        self.hourly_end = -1
+        if self.l2_diff:
+            return [(TradeStore, 'trade', TRADE_COLUMNS), (L2DiffStore, 'L2diff', L2_DIFF_COLUMNS)]
+        if self.l2_depth:
+            LOB_store, LOB_columns = L2SnapshotStore, l2_columns(self.l2_depth)
+        else:
+            LOB_store, LOB_columns = LOBStore, LOB_COLUMNS
+        return [(TradeStore, 'trade', TRADE_COLUMNS), (LOB_store, 'LOB', LOB_columns)]
 
-        # 需要处理的数据队列
-        self.market_data_q = queue.Queue()    # MarketData队列（带数据）     
-
-        print('/*----- start initialize the DataHandler -----*/')
-        # 浏览一遍全数据获取要回测的 time id
-        self._get_backtest_time_index()
-        # 获取需要迭代的
-        self._get_hourly_load_list()
-        print('/*----- DataHandler initialization ends -----*/')
-
-    def _agg_symbol_exchange_list(self, symbol_list, exchange_list):
-        """
-        用于聚合 symbol_exchange_list 的工具函数
-        """
-        symbol_exchange_list_temp  = []
-        if len(symbol_list) != len(exchange_list):
-            raise DataHandlerError(' symbol_list 和 exchange_list 长度不同, 请检查您的输入')
-        for i in range(len(symbol_list)):
-            symbol_exchange = str(symbol_list[i]) + '_' + str(exchange_list[i])
-            if symbol_exchange in symbol_exchange_list_temp:
-                raise DataHandlerError(' symbol_list 和 exchange_list 聚合后不能形成数据的 key, 请检查您的输入')
-            symbol_exchange_list_temp.append(symbol_exchange)
-        
-        return symbol_exchange_list_temp
-    
-    def _process_duplicated_time(self, df):
+    def _prepare_sources(self, sources):
         """
-        因为 Sys 把 timestep 作为数据的 key 推送， 必须删除其中重复的
-        我们仅保留最后一次出现的样本
+        l2_diff=True 时由每个 symbol 的增量数据按窗口重建订单簿快照, 作为该 symbol 的 LOB 数据流
+        每个 handler 有自己的 L2DiffReplay (回放中的订单簿), 数据源缓存中的增量数据不变
         """
-        df = df.drop_duplicates(subset=['time'],keep='last').reset_index(drop=True)
-        return df
-    
-    def _get_backtest_time_index(self):
-        """
-        获取回测的time_index
-        """
-        ## trade
-        comb_time_index = None
-        for s in self.symbol_exchange_list:
-            # 读取 csv/parquet 数据
-            if self.is_csv:
-                history_data_trade = pd.read_csv(
-                    os.path.join(self.file_dir, '%s_trade.csv' % s)
-                    )
-                history_data_LOB = pd.read_csv(
-                    os.path.join(self.file_dir, '%s_LOB.csv' % s)
-                    )
-            if not self.is_csv:
-                history_data_trade = pd.read_parquet(
-                    os.path.join(self.file_dir, '%s_trade.parquet' % s)
-                    )
-                history_data_LOB = pd.read_parquet(
-                    os.path.join(self.file_dir, '%s_LOB.parquet' % s)
-                    )
+        if not self.l2_diff:
+            return sources
+        sources = list(sources)
+        for i in range(1, len(sources), 2):
+            sources[i] = L2DiffReplay(sources[i], self.l2_depth)
+        return sources
 
-            # 约束存在的列
-            history_data_trade = history_data_trade[['time','price','qty','maker']]
-            history_data_LOB = history_data_LOB[['time','bid1','bid1_qty','ask1','ask1_qty']]
-            history_data_LOB = self._process_duplicated_time(history_data_LOB)  #删除重复的时间
+    def _register_sources(self, sources):
+        for i, s in enumerate(self.symbol_exchange_list):
+            self._register_symbol(s)
+            if self.l2_depth:
+                self.__order_books[s] = OrderBookL2(self.l2_depth, s)
+            self.__time_bar_builders += [(k, i, b) for k, b in enumerate(self._bar_builders[s]) if b.bar_type == 'time']
 
-            # 初始化 latest 和 registered
-            self.latest_symbol_exchange_LOB_data[s] = []
-            self.latest_symbol_exchange_LOB_data_time[s] = None
-            self.latest_symbol_exchange_trade_data[s] = []
-            self.latest_symbol_exchange_trade_data_time[s] = None
-
-            # 集合时间的index
-            if comb_time_index is None:
-                comb_time_index = history_data_trade.time.to_list() + history_data_LOB.time.to_list()
+    def _get_new_data(self, updates):
+        """
+        updates 为 TimelineMerger.pop() 给出的该时间戳下有数据的数据流
+        数据流序号 i: symbol 为 symbol_exchange_list[i // 2], i % 2 == 0 为 trade, 1 为 LOB
+        每次推送生成新的 updated list, 之前返回给调用者的 list 不会被修改
+        """
+        updated_trade_symbols = []
+        updated_LOB_symbols = []
+        pending_history = self._pending_history
+        self.market_state.advance(self.backtest_now)
+        for i, records in updates:
+            s = self.symbol_exchange_list[i >> 1]
+            if i & 1:
+                self.latest_symbol_exchange_LOB_data[s] = records
+                self.latest_symbol_exchange_LOB_data_time[s] = self.backtest_now
+                history = self._LOB_history[s]
+                if pending_history:
+                    self._flush_history(history)
+                history.extend(records.store, records.lo, records.hi)
+                self._latest_LOB_views[s] = records
+                self.market_state.update_LOB(i >> 1, records.store, records.hi - 1)
+                if self.l2_depth:
+                    self.__order_books[s].apply_snapshot_row(records.store, records.hi - 1)
+                updated_LOB_symbols.append(s)
             else:
-                comb_time_index += (history_data_trade.time.to_list() + history_data_LOB.time.to_list())
-
-        comb_time_index = list(set(comb_time_index))
-        comb_time_index.sort()
-        self.start_time = comb_time_index[0]
-        self.__comb_time_index = comb_time_index
-        self.comb_time_index_iter = iter(comb_time_index)
+                self.latest_symbol_exchange_trade_data[s] = records
+                self.latest_symbol_exchange_trade_data_time[s] = self.backtest_now
+                history = self._trade_history[s]
+                if pending_history:
+                    self._flush_history(history)
+                history.extend(records.store, records.lo, records.hi)
+                self._latest_trade_views[s] = records
+                self._latest_trade_prices[s] = float(records.store.price[records.hi - 1])
+                self.market_state.update_trade(i >> 1, records.store, records.hi - 1)
+                updated_trade_symbols.append(s)
+        self._updated_trade_symbols = updated_trade_symbols
+        self._updated_LOB_symbols = updated_LOB_symbols
+        if self.bars:
+            self._update_bars(updates)
 
-    def _get_hourly_load_list(self):
+    def _update_bars(self, updates):
         """
-        用来生成我们每一个小时load一次数据的
-        注意，这段代码的冗余性可能并不好
+        用本次推送的 trade 更新每个 symbol 的 bar, 之后检查 time bar 是否因为时间推进而完成
         """
-        start = self.__comb_time_index[0]
-        last = self.__comb_time_index[1]
-        self.hourly_load_list = []
-        for i in self.__comb_time_index:
-            if i - start > (60*60*1000): # 一小时
-                self.hourly_load_list.append([start,last])
-                start = i
-            last = i
-        self.hourly_load_list.append([start,last])
-        self.hourly_load_list = iter(self.hourly_load_list)
-        # print(self.hourly_load_list)
+        updated = set()
+        for i, records in updates:
+            if i & 1:
+                continue
+            for k, builder in enumerate(self._bar_builders[self.symbol_exchange_list[i >> 1]]):
+                if builder.update(records.store, records.lo, records.hi):
+                    updated.add((k, i >> 1))
+        for k, i, builder in self.__time_bar_builders:
+            if builder.advance(self.backtest_now):
+                updated.add((k, i))
+        self._updated_bar_symbols = {bar: [] for bar in self.bars}
+        for k, i in sorted(updated, key=lambda x: x[1]):
+            self._updated_bar_symbols[self.bars[k]].append(self.symbol_exchange_list[i])
 
-    def _load_hourly_data_from_csv_file(self):
+    def fast_forward(self, trade_symbols, LOB_symbols, until=None):
         """
-        获取回测的time_index
+        没有组件关心的数据批量推进, 不推送 MarketEvent
+        trade_symbols/LOB_symbols: 需要逐个时间点推送的 symbol (组件关心的数据)
+        until: 下一个 timer 的时间, 时间 >= until 的数据照常推送
+        当前窗口中早于下一个关心的时间点 (以及 until) 的所有时间点直接对 store 切片,
+        与逐个推送相同地更新历史/MarketState/订单簿/bar, 返回跳过的行数
+        bucket_ms 以及 time bar (每个推送时间都需要检查是否完成) 时不跳过
         """
-        for s in self.symbol_exchange_list:
-            # 读取 csv/parquet 数据
-            if self.is_csv:
-                history_data_trade = pd.read_csv(
-                    os.path.join(self.file_dir, '%s_trade.csv' % s)
-                    )
-                history_data_LOB = pd.read_csv(
-                    os.path.join(self.file_dir, '%s_LOB.csv' % s)
-                    )
-            if not self.is_csv:
-                history_data_trade = pd.read_parquet(
-                    os.path.join(self.file_dir, '%s_trade.parquet' % s)
-                    )
-                history_data_LOB = pd.read_parquet(
-                    os.path.join(self.file_dir, '%s_LOB.parquet' % s)
-                    )
+        merger = self._merger
+        if not merger or self.bucket_ms or self.__time_bar_builders:
+            return 0
+        # 数据流序号, 调用者传入同一组 symbol 时使用上一次的结果
+        if self.__watched_streams[0] != (trade_symbols, LOB_symbols):
+            index = self.market_state.index
+            watched = {2*index[s] for s in trade_symbols}
+            watched.update(2*index[s] + 1 for s in LOB_symbols)
+            self.__watched_streams = ((trade_symbols, LOB_symbols), watched)
+        watched = self.__watched_streams[1]
+        heap = merger.heap
+        # 最早的数据就是关心的数据 (大部分推送), 不需要查找
+        if heap[0][1] in watched or (until is not None and heap[0][0] >= until):
+            return 0
+        stop = until
+        for t, i in heap:
+            if i in watched and (stop is None or t < stop):
+                stop = t
+        if stop is not None and heap[0][0] >= stop:
+            return 0
+        end = np.iinfo(np.int64).max if stop is None else stop - 1
+        self.backtest_now, updates = merger.pop_until(end)
+        self._skip_data(updates)
+        return sum(records.hi - records.lo for _, records in updates)
 
-            # 约束存在的列
-            history_data_trade = history_data_trade[['time','price','qty','maker']]
-            history_data_trade = history_data_trade.loc[(history_data_trade.time>=self.hourly_start)&
-                                                    (history_data_trade.time<=self.hourly_end),].reset_index(drop=True)
-            history_data_LOB = history_data_LOB[['time','bid1','bid1_qty','ask1','ask1_qty']]
-            history_data_LOB = self._process_duplicated_time(history_data_LOB)  #删除重复的时间
-            history_data_LOB = history_data_LOB.loc[(history_data_LOB.time>=self.hourly_start)&
-                                                    (history_data_LOB.time<=self.hourly_end),].reset_index(drop=True)
-            
-            # 记录trade数据 目前很花时间
-            self.__symbol_exchange_trade_data[s] = {i:[] for i in history_data_trade.time.unique()}
-            for i in range(len(history_data_trade.time)):
-                market_event = Trade(symbol=s, price=history_data_trade['price'][i], qty=history_data_trade['qty'][i], 
-                                     is_buyer_maker=history_data_trade['maker'][i]=="BUY", timestamp=history_data_trade['time'][i])
-                self.__symbol_exchange_trade_data[s][market_event.timestamp] += [market_event]
-            
-            # 记录LOB数据 目前很花时间
-            self.__symbol_exchange_LOB_data[s] = {i:[] for i in history_data_LOB.time.unique()}
-            for i in range(len(history_data_LOB.time)):
-                market_event = Orderbook(symbol=s, bid1=history_data_LOB['bid1'][i], bidqty1=history_data_LOB['bid1_qty'][i], 
-                                         ask1=history_data_LOB['ask1'][i], askqty1=history_data_LOB['ask1_qty'][i], 
-                                         timestamp=history_data_LOB['time'][i])
-                self.__symbol_exchange_LOB_data[s][market_event.timestamp] += [market_event]
-
-    def _get_new_data(self):
-        for s in self.symbol_exchange_list:
-            try:
-                self.latest_symbol_exchange_trade_data[s] = self.__symbol_exchange_trade_data[s][self.backtest_now]
-                self.latest_symbol_exchange_trade_data_time[s] = self.backtest_now
-            except: pass
-            try:
-                self.latest_symbol_exchange_LOB_data[s] = self.__symbol_exchange_LOB_data[s][self.backtest_now]
-                self.latest_symbol_exchange_LOB_data_time[s] = self.backtest_now
-            except: pass
+    def _skip_data(self, updates):
+        """
+        fast_forward 取出的数据: 每个数据流的 RecordView 覆盖多个时间点
+        latest_symbol_exchange_*_data(_time) 为每个数据流最后一个时间点的数据, 与逐个推送的结果一致
+        """
+        self.market_state.advance(self.backtest_now)
+        for i, records in updates:
+            s = self.symbol_exchange_list[i >> 1]
+            store, lo, hi = records.store, records.lo, records.hi
+            # 最后一个时间点的数据 (只跳过了一个时间点时就是 records)
+            c = store.cursor - 1
+            start = int(store.group_start[c])
+            last = records if start == lo else store.records(start, hi)
+            last_time = int(store.group_time[c])
+            if i & 1:
+                self.latest_symbol_exchange_LOB_data[s] = last
+                self.latest_symbol_exchange_LOB_data_time[s] = last_time
+                self._defer_history(self._LOB_history[s], store, lo, hi)
+                self._latest_LOB_views[s] = last
+                self.market_state.update_LOB(i >> 1, store, hi - 1)
+                if self.l2_depth:
+                    self.__order_books[s].apply_snapshot_row(store, hi - 1)
+            else:
+                self.latest_symbol_exchange_trade_data[s] = last
+                self.latest_symbol_exchange_trade_data_time[s] = last_time
+                self._defer_history(self._trade_history[s], store, lo, hi)
+                self._latest_trade_views[s] = last
+                self._latest_trade_prices[s] = float(store.price[hi - 1])
+                self.market_state.update_trade(i >> 1, store, hi - 1)
+                if self.bars:
+                    for builder in self._bar_builders[s]:
+                        builder.update(store, lo, hi)
+        self._updated_trade_symbols = []
+        self._updated_LOB_symbols = []
+        self._updated_bar_symbols = {}
 
-    def update_TradeLOB(self):
+    def _defer_history(self, history, store, lo, hi):
         """
-        Pushes the latest trade/LOB info in that time
+        fast_forward 跳过的数据先不写入历史缓冲区, 同一个数据流连续跳过的数据合并为一个 [lo, hi)
+        之后推送该数据流或者读取历史时再写入 (只需要复制最后 history_depth 行)
         """
-        try: # 获取现在迭代的时间戳
-            self.backtest_now = self.comb_time_index_iter.__next__()
-            # 检查是否需要load新的历史数据
-            if self.backtest_now > self.hourly_end:
-                # print('\n===== reload data from new hour =====')
-                [self.hourly_start, self.hourly_end] = self.hourly_load_list.__next__()
-                self._load_hourly_data_from_csv_file()
-            # 开始推送新的行情数据
-            # print('\n===== processing market event in ',self.backtest_now,' =====')
-            self._get_new_data()
-            self.events.put(MarketEvent())
-            # print('get new market events and push to queue')
-        except StopIteration:
-            self.continue_backtest = False
+        pending = self._pending_history.get(history)
+        if pending is not None:
+            if pending[0] is store and pending[2] == lo:
+                pending[2] = hi
+                return
+            history.extend(*pending)
+        self._pending_history[history] = [store, lo, hi]
 
     ###########################################
     ########## func for request data ##########
     ###########################################
 
-    # def get_latest_trades(self, force_now=False) -> Dict[str:Trade]:
-    def get_latest_trades(self, force_now=False):
-        """
-        获取所有 symbols 最新的trade数据
-        force_now 强制只推送时间等同于回测系统时间的数据
-        如果还没有数据的symbols不推送
-
-        return sample:
-        {'btc_usdt_binance': 
-            {'symbol': 'btc_usdt_binance', 'price': 42612.0, 'qty': 0.00687, 'is_buyer_maker': True, 'timestamp': 1704042025507, 'receive_time': None},
-         'btc_usdt_bybit': 
-            {'symbol': 'btc_usdt_bybit', 'price': 42611.99, 'qty': 0.02789, 'is_buyer_maker': False, 'timestamp': 1704042025312, 'receive_time': None}}
-        """
-        outcomes = dict()
-        for s in self.symbol_exchange_list:
-            latest_time = self.latest_symbol_exchange_trade_data_time[s]
-            if latest_time is not None:
-                if force_now:
-                    if latest_time != self.backtest_now: continue
-                outcomes[s] = self.latest_symbol_exchange_trade_data[s][-1]
-        return outcomes
-    
-    # def get_latest_LOBs(self, force_now=False) -> Dict[str:Orderbook]:
-    def get_latest_LOBs(self, force_now=False):
-        """
-        获取所有 symbols 最新的LOB数据
-        force_now 强制只推送时间等同于回测系统时间的数据
-        如果还没有数据的symbols不推送
-
-        return sample:
-        {'btc_usdt_binance': 
-            {'symbol': 'btc_usdt_binance', 'bid1': 42611.99, 'bidqty1': 3.13322, 'ask1': 42612.0, 'askqty1': 2.67936, 'timestamp': 1704042025824, 'receive_time': None},
-         'btc_usdt_bybit': 
-            {'symbol': 'btc_usdt_bybit', 'bid1': 42611.99, 'bidqty1': 1.139443, 'ask1': 42612.0, 'askqty1': 0.494114, 'timestamp': 1704042025783, 'receive_time': None}}
-        """
-        outcomes = dict()
-        for s in self.symbol_exchange_list:
-            latest_time = self.latest_symbol_exchange_LOB_data_time[s]
-            if latest_time is not None:
-                if force_now:
-                    if latest_time != self.backtest_now: continue
-                outcomes[s] = self.latest_symbol_exchange_LOB_data[s][-1]
-        return outcomes
-    
-    
-    # def get_latest_prices(self) -> Dict[str:float]:
-    def get_latest_prices(self):
-        """
-        获取最新的价格
-        会先寻找成交信息
-        没有的话用LOB信息取代
-        
-        return sample:
-            {'btc_usdt_binance': 42612.0, 'btc_usdt_bybit': 42611.99}
-        """
-        outcomes = dict()
-        try:
-            tmp = self.get_latest_trades()
-            for i in tmp.keys():
-                outcomes[i] = tmp[i].price
-        except:
-            tmp = self.get_latest_LOBs()
-            for i in tmp.keys():
-                outcomes[i] = (tmp[i].bid1+tmp[i].ask1)/2
-        return outcomes         
-
-    def get_updated_trade_symbols(self) -> List:
-        """
-        trade数据
-        获取哪些symbol发生了更新
-        """
-        outcome = []
-        for s in self.symbol_exchange_list:
-            if s in self.latest_symbol_exchange_trade_data_time:
-                if self.latest_symbol_exchange_trade_data_time[s] == self.backtest_now:
-                    outcome.append(s)
-        return outcome
-    
-    def get_updated_LOB_symbols(self) -> List:
+    def get_order_book(self, symbol, exchange=None):
         """
-        LOB数据
-        获取哪些symbol发生了更新
+        获取某个 symbol 的 L2 订单簿 (OrderBookL2), 没有开启 l2_depth 时返回 None
+        返回的是 handler 持续更新的对象, 不是复制
         """
-        outcome = []
-        for s in self.symbol_exchange_list:
-            if s in self.latest_symbol_exchange_LOB_data_time:
-                if self.latest_symbol_exchange_LOB_data_time[s] == self.backtest_now:
-                    outcome.append(s)
-        return outcome
+        s = self._get_symbol_exchange(symbol, exchange)
+        return self.__order_books.get(s)
@@ -0,0 +1,88 @@
+# WindowPrefetcher.py
+
+"""
+后台预读取数据窗口
+当前窗口 N 在主线程中推送的时候, 后台线程已经在读取并解码窗口 N+1, N+2 ...
+主线程在窗口切换的时候只需要从队列中取出已经准备好的数据, 不会因为 I/O 阻塞
+
+读取 parquet (pyarrow) 以及 numpy 的切片/排序都会释放 GIL, 所以这里使用线程即可
+"""
+
+import queue
+import threading
+
+
+class _PrefetchError(object):
+    def __init__(self, error):
+        self.error = error
+
+
+_DONE = object()
+
+
+class WindowPrefetcher(object):
+    """
+    按顺序读取 windows 中的每一个窗口, 返回 (window, load(window))
+    depth 为最多提前准备好的窗口数量, 队列满的时候后台线程会等待, 内存占用有上限
+    """
+
+    def __init__(self, windows, load, depth=1):
+        if depth < 1:
+            raise ValueError('prefetch depth should be >= 1')
+        self.queue = queue.Queue(maxsize=depth)
+        self.finished = False
+        self._stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=(windows, load), daemon=True)
+        self.thread.start()
+
+    def _run(self, windows, load):
+        try:
+            for window in windows:
+                item = (window, load(window))
+                if not self._put(item):
+                    return
+        except BaseException as e:
+            self._put(_PrefetchError(e))
+            return
+        self._put(_DONE)
+
+    def _put(self, item):
+        # 定时检查是否已经被 close, 避免主线程退出后后台线程一直阻塞
+        while not self._stop.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.finished:
+            raise StopIteration
+        item = self.queue.get()
+        if item is _DONE:
+            self.finished = True
+            raise StopIteration
+        if isinstance(item, _PrefetchError):
+            self.finished = True
+            raise item.error
+        return item
+
+    def close(self):
+        """
+        停止后台线程并等待其退出 (正在读取的窗口读取完之后退出), 可以重复调用
+        关闭之后不会再有线程留在进程中 (例如之后 fork 出子进程)
+        """
+        self._stop.set()
+        self.finished = True
+        if self.thread.is_alive() and self.thread is not threading.current_thread():
+            self.thread.join()
+        # 释放已经读取但没有推送的窗口
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                break
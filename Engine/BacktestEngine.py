@@ -0,0 +1,343 @@
+# BacktestEngine.py
+
+"""
+回测引擎, 负责原来 try.ipynb 中的主循环
+
+1. EventQueue: 单线程回测用的 deque, 没有锁; 提供 put/get/empty, 组件仍然调用 self.events.put(event)
+2. dispatch table: 每个 event.type 一个 handler 元组, 组件在回测开始前 register (默认顺序与 notebook 一致),
+   增加组件 (例如风控/记录 FILL) 只需要 register, 不需要修改主循环; 分发的耗时与 if/elif 相当, 不是为了速度
+3. Scheduler: 按时间排序的 timer (heapq), 组件通过 self.events.schedule_at(ts, callback, *args) 注册
+   (订单生效, 超时撤单/平仓等), 不需要每次行情轮询; 没有到期的 timer 时每次推送只比较一次堆顶
+   组件通过 getattr(events, 'schedule_at', None) 判断, 没有 scheduler 的队列 (例如 notebook/实盘的 queue.Queue)
+   仍然在每次行情中检查订单的生效时间以及超时, BacktestEngine 本身只接受 EventQueue
+4. run(): data_handler.update_TradeLOB() 推送一次数据, 触发 ts <= backtest_now 的 timer, 然后处理完队列中所有的
+   event (包括处理中新产生的 event), 直到 data_handler.continue_backtest 为 False; 回放期间使用 replay_gc()
+5. interest 路由 (routing=True): 组件通过 market_interest() 给出当前关心的 symbol/数据类型 (event.Interest),
+   MarketEvent 只交给关心本次更新的组件; 所有组件都不关心的时间点由 data_handler.fast_forward() 批量推进,
+   不推送 MarketEvent (组件的 interest 随状态变化: 例如策略空仓时只关心配对的 trade, 有仓位/挂单时关心所有数据)
+   回测的 symbol 多于组件关心的 symbol 时才有收益, 默认关闭, 结果与关闭时完全一致
+6. 命令行入口 (headless), file_dir 中需要有每个 symbol 的 *_trade 以及 *_LOB 文件:
+    python -m Engine.BacktestEngine --file_dir DIR --symbols btc_usdt,btc_usdt --exchanges binance,bybit
+"""
+
+import argparse
+import heapq
+import importlib
+import itertools
+import json
+import queue
+import sys
+import time
+from collections import deque
+from contextlib import nullcontext
+sys.path.append("..")
+
+from event import replay_gc
+
+
+EVENT_TYPES = ('MARKET', 'ORDER', 'FILL')
+
+
+class Timer(object):
+    """
+    schedule_at 返回的 timer, cancel() 之后不再触发
+    """
+    __slots__ = ('time', 'callback', 'args', 'cancelled')
+
+    def __init__(self, ts, callback, args):
+        self.time = ts
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class Scheduler(object):
+    """
+    按时间排序的 timer, 同一时间按注册的顺序触发
+    取消的 timer 留在堆中, 到期时丢弃
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.counter = itertools.count()
+
+    def __len__(self):
+        return len(self.heap)
+
+    def schedule_at(self, ts, callback, *args):
+        """
+        回测时间 (backtest_now) 到达 ts 时调用 callback(*args), 返回 Timer
+        """
+        timer = Timer(ts, callback, args)
+        heapq.heappush(self.heap, (ts, next(self.counter), timer))
+        return timer
+
+    def next_time(self):
+        """
+        下一个没有取消的 timer 的时间, 没有时返回 None
+        """
+        heap = self.heap
+        while heap and heap[0][2].cancelled:
+            heapq.heappop(heap)
+        return heap[0][0] if heap else None
+
+    def run_until(self, now):
+        """
+        依次触发所有 ts <= now 的 timer (包括触发过程中新注册的), 返回触发的数量
+        """
+        heap = self.heap
+        n = 0
+        while heap and heap[0][0] <= now:
+            timer = heapq.heappop(heap)[2]
+            if not timer.cancelled:
+                timer.cancelled = True
+                timer.callback(*timer.args)
+                n += 1
+        return n
+
+
+class EventQueue(deque):
+    """
+    单线程回测的 event 队列, 与 queue.Queue 的接口兼容 (put/get/empty/qsize), 没有锁的开销
+    队列同时持有回测的 Scheduler, 组件通过 self.events.schedule_at 注册 timer, timer 由 BacktestEngine.run() 触发
+    多线程推送 (实盘) 或者自己写主循环时使用 queue.Queue, 此时没有 scheduler, 组件退回到每次行情检查时间
+    """
+
+    def __init__(self, iterable=(), maxlen=None):
+        super().__init__(iterable, maxlen)
+        self.scheduler = Scheduler()
+
+    def schedule_at(self, ts, callback, *args):
+        return self.scheduler.schedule_at(ts, callback, *args)
+
+    def put(self, event, block=True, timeout=None):
+        self.append(event)
+
+    def put_nowait(self, event):
+        self.append(event)
+
+    def get(self, block=False, timeout=None):
+        try:
+            return self.popleft()
+        except IndexError:
+            raise queue.Empty from None
+
+    def get_nowait(self):
+        return self.get(False)
+
+    def empty(self):
+        return not self
+
+    def qsize(self):
+        return len(self)
+
+
+class BacktestEngine(object):
+    """
+    events:       组件共用的 EventQueue
+    data_handler: 提供 update_TradeLOB() 以及 continue_backtest 的 DataHandler
+    gc_control:   回放期间是否使用 replay_gc()
+    routing:      是否按组件的 interest 路由 MarketEvent 并 fast_forward, False 时所有组件收到所有 MarketEvent
+    """
+
+    def __init__(self, events, data_handler, gc_control=True, routing=False):
+        if not isinstance(events, deque):
+            raise TypeError('BacktestEngine needs an EventQueue, got %s' % type(events).__name__)
+        self.events = events
+        self.data_handler = data_handler
+        self.gc_control = gc_control
+        self.routing = routing
+        self.handlers = {event_type: [] for event_type in EVENT_TYPES}
+        self.interests = {event_type: [] for event_type in EVENT_TYPES}   # 与 handlers 对应, 没有 interest 时为 None
+        self.strategy = None
+        self.portfolio = None
+        self.executor = None
+        # 统计
+        self.n_events = 0
+        self.n_updates = 0
+        self.n_skipped = 0          # fast_forward 跳过 (没有推送 MarketEvent) 的数据行数
+        self.elapsed = 0.0
+
+    def schedule_at(self, ts, callback, *args):
+        return self.events.schedule_at(ts, callback, *args)
+
+    def register(self, event_type, *handlers, interest=None):
+        """
+        event_type 的 event 依次交给 handlers 处理, 按照注册的顺序调用
+        interest: 返回 event.Interest 的函数 (MARKET), 为 None 时 handler 收到所有 MarketEvent
+        """
+        self.handlers.setdefault(event_type, []).extend(handlers)
+        self.interests.setdefault(event_type, []).extend([interest] * len(handlers))
+        return self
+
+    def register_components(self, strategy, portfolio, executor):
+        """
+        按照原来 notebook 中的顺序注册 strategy, portfolio, executor:
+            MARKET: strategy -> portfolio -> executor
+            ORDER:  executor
+            FILL:   executor -> portfolio -> strategy
+        """
+        self.strategy, self.portfolio, self.executor = strategy, portfolio, executor
+        for component in (strategy, portfolio, executor):
+            self.register('MARKET', component.on_market_event, interest=getattr(component, 'market_interest', None))
+        self.register('ORDER', executor.on_order_event)
+        self.register('FILL', executor.on_fill_event, portfolio.on_fill_event, strategy.on_fill_event)
+        return self
+
+    def dispatch_table(self):
+        """
+        {event.type: (handler, ...)}, run() 开始时生成一次
+        """
+        return {event_type: tuple(handlers) for event_type, handlers in self.handlers.items() if handlers}
+
+    def run(self, max_updates=None):
+        """
+        运行回测直到数据推送结束 (或者推送了 max_updates 次), 返回处理的 event 数量
+        """
+        data_handler = self.data_handler
+        update = data_handler.update_TradeLOB
+        events = self.events
+        popleft = events.popleft
+        table = self.dispatch_table()
+        no_handler = ()
+        scheduler = events.scheduler
+        timers = scheduler.heap
+        market_handlers = tuple(zip(self.handlers['MARKET'], self.interests['MARKET']))
+        interest_fns = tuple(fn for _, fn in market_handlers if fn is not None)
+        routing = self.routing and bool(interest_fns) and hasattr(data_handler, 'get_updated_trade_symbols')
+        if routing:
+            table.pop('MARKET', None)
+        # 有组件没有 interest 时它需要所有的 MarketEvent, 不能跳过
+        can_skip = routing and len(interest_fns) == len(market_handlers)
+        fast_forward = getattr(data_handler, 'fast_forward', None) if can_skip else None
+        get_trade_symbols = getattr(data_handler, 'get_updated_trade_symbols', None)
+        get_LOB_symbols = getattr(data_handler, 'get_updated_LOB_symbols', None)
+        # 组件的 interest 没有变化 (返回同一组 Interest 对象, 按 identity 比较) 时使用上一次的并集
+        last_interests, watched = None, None
+        n_events = n_updates = n_skipped = 0
+        t0 = time.perf_counter()
+        with replay_gc() if self.gc_control else nullcontext():
+            while data_handler.continue_backtest:
+                if max_updates is not None and n_updates >= max_updates:
+                    break
+                if fast_forward is not None:
+                    interests = tuple([fn() for fn in interest_fns])
+                    if interests != last_interests:
+                        last_interests, watched = interests, self.watched_symbols(interests)
+                    if watched is not None:
+                        n_skipped += fast_forward(watched[0], watched[1], scheduler.next_time())
+                update()
+                n_updates += 1
+                # 到期的 timer 在该时间的 event 之前触发, 产生的 event 排在 MARKET 之后
+                if timers and timers[0][0] <= data_handler.backtest_now:
+                    scheduler.run_until(data_handler.backtest_now)
+                while events:
+                    event = popleft()
+                    if event is None:
+                        continue
+                    n_events += 1
+                    if routing and event.type == 'MARKET':
+                        trade_symbols = get_trade_symbols()
+                        LOB_symbols = get_LOB_symbols()
+                        for handler, interest in market_handlers:
+                            if interest is not None:
+                                interest = interest()
+                                if not (interest.all or interest.matches(trade_symbols, LOB_symbols)):
+                                    continue
+                            handler(event)
+                        continue
+                    for handler in table.get(event.type, no_handler):
+                        handler(event)
+        self.elapsed += time.perf_counter() - t0
+        self.n_events += n_events
+        self.n_updates += n_updates
+        self.n_skipped += n_skipped
+        return n_events
+
+    def watched_symbols(self, interests):
+        """
+        interests 的并集, 返回 (trade symbols, LOB symbols); 有组件需要所有数据时返回 None (不能跳过)
+        """
+        all_symbols = self.data_handler.symbol_exchange_list
+        trade_symbols, LOB_symbols = set(), set()
+        for interest in interests:
+            if interest.all:
+                return None
+            symbols = all_symbols if interest.symbols is None else interest.symbols
+            if interest.trade:
+                trade_symbols.update(symbols)
+            if interest.LOB:
+                LOB_symbols.update(symbols)
+        return trade_symbols, LOB_symbols
+
+    def events_per_sec(self):
+        return self.n_events / self.elapsed if self.elapsed else 0.0
+
+
+def _import_object(path):
+    """
+    'Strategy.LeadLagArbitrageStrategy.LeadLagArbitrageStrategy' -> class
+    """
+    module, _, name = path.rpartition('.')
+    return getattr(importlib.import_module(module), name)
+
+
+def build_backtest(file_dir, symbol_list, exchange_list,
+                   strategy_cls='Strategy.LeadLagArbitrageStrategy.LeadLagArbitrageStrategy', strategy_params=None,
+                   handler_cls='DataHandler.TradeLOBHourlyDataHandler.HistoricTradeLOBHourlyDataHandler',
+                   handler_params=None, portfolio_params=None, gc_control=True, routing=False):
+    """
+    按照 notebook 的方式组装 data_handler, portfolio, executor, strategy, 返回 BacktestEngine
+    strategy_cls/handler_cls 可以是类或者 'module.Class' 字符串
+    """
+    from Portfolio.LogPlotPortfolio import LogPlotPortfolio
+    from Execution.execution import SimulatedExecutionHandler
+
+    if isinstance(strategy_cls, str):
+        strategy_cls = _import_object(strategy_cls)
+    if isinstance(handler_cls, str):
+        handler_cls = _import_object(handler_cls)
+    events = EventQueue()
+    data_handler = handler_cls(events, symbol_list=symbol_list, exchange_list=exchange_list,
+                               file_dir=file_dir, **(handler_params or {}))
+    portfolio = LogPlotPortfolio(events, data_handler, **(portfolio_params or {}))
+    executor = SimulatedExecutionHandler(events, data_handler)
+    strategy = strategy_cls(events, data_handler, portfolio, executor, **(strategy_params or {}))
+    engine = BacktestEngine(events, data_handler, gc_control=gc_control, routing=routing)
+    return engine.register_components(strategy, portfolio, executor)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='run a backtest without the notebook')
+    parser.add_argument('--file_dir', required=True)
+    parser.add_argument('--symbols', required=True, help='comma separated, e.g. btc_usdt,btc_usdt')
+    parser.add_argument('--exchanges', required=True, help='comma separated, e.g. binance,bybit')
+    parser.add_argument('--csv', action='store_true', help='data files are csv instead of parquet')
+    parser.add_argument('--strategy', default='Strategy.LeadLagArbitrageStrategy.LeadLagArbitrageStrategy')
+    parser.add_argument('--params', default='{}', help='strategy parameters as json')
+    parser.add_argument('--handler_params', default='{}', help='extra data handler parameters as json')
+    parser.add_argument('--output', default=None, help='save strategy_history to this csv file')
+    parser.add_argument('--routing', action='store_true', help='route market events by component interest')
+    args = parser.parse_args(argv)
+
+    handler_params = dict(is_csv=args.csv, **json.loads(args.handler_params))
+    engine = build_backtest(args.file_dir, args.symbols.split(','), args.exchanges.split(','),
+                            strategy_cls=args.strategy, strategy_params=json.loads(args.params),
+                            handler_params=handler_params, routing=args.routing)
+    engine.run()
+    print('events %d  updates %d  fast-forwarded rows %d  %.2fs  %.0f events/s'
+          % (engine.n_events, engine.n_updates, engine.n_skipped, engine.elapsed, engine.events_per_sec()))
+    history = getattr(engine.strategy, 'strategy_history', None)
+    if history is not None:
+        print('strategy_history: %d records' % len(history))
+        if args.output:
+            import pandas as pd
+            pd.DataFrame(history).to_csv(args.output, index=False)
+    return engine
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,346 @@
+# ParameterSweep.py
+
+"""
+多进程参数扫描 (例如 LeadLagArbitrageStrategy 的 k1, k2, k3, order_live_time, dynamic_stop_hedge, stop_loss_threshold)
+
+1. 参数点: grid_points(grid) 为网格的笛卡尔积, random_points(space, n, seed) 为随机搜索
+2. 数据只读取一次: 父进程打开数据源缓存并预先读取所有数据 (ParallelLoader.preload_sources, 不留下预读取线程),
+   每次回测 fork 一个子进程, 子进程继承已经读取的 store (copy-on-write), 不再解析 Parquet
+   不支持 fork 的平台上 (或者 shared_memory=True 时) 父进程把数据放入共享内存 (SharedMarketData), 子进程只读地 attach
+   (handler 的 read_mode 需要为 'full' 或者 'mmap')
+3. 每次回测是一个独立的子进程, 最多同时运行 n_workers 个; 超过 timeout 秒的回测被终止并记录为 timeout
+4. 结果逐条追加到 jsonl 文件 (每次回测结束后立即写入), 中断后用同一个文件重新运行时跳过已经完成的参数点
+5. load_results(path) 把所有回测的参数以及 strategy_history 的汇总合并为一张 DataFrame
+6. 命令行入口:
+    python -m Engine.ParameterSweep --file_dir DIR --symbols btc_usdt,btc_usdt --exchanges binance,bybit
+        --grid '{"k1": [0.3e-4, 0.5e-4], "order_live_time": [5000, 25000]}' --results sweep.jsonl --workers 8 --timeout 600
+"""
+
+import argparse
+import contextlib
+import hashlib
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import random
+import sys
+import time
+import traceback
+from collections import deque
+from multiprocessing.connection import wait
+sys.path.append("..")
+
+from Engine.BacktestEngine import build_backtest, _import_object
+from DataHandler.ParallelLoader import preload_sources
+from DataHandler.SharedMarketData import SharedMarketData
+
+
+STATUS_OK = 'ok'
+STATUS_ERROR = 'error'
+STATUS_TIMEOUT = 'timeout'
+
+
+def grid_points(grid):
+    """
+    {参数: [取值, ...]} 的笛卡尔积, 按 grid 中参数的顺序展开
+    """
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def random_points(space, n, seed=None):
+    """
+    随机搜索的 n 个参数点, space 为 {参数: 取值}:
+        list/tuple:                          从中随机选择
+        {'low': a, 'high': b}:               [a, b] 内均匀分布, a/b 都是 int 时为整数
+        {'low': a, 'high': b, 'log': True}:  对数均匀分布 (a, b > 0)
+        其它:                                 固定值
+    """
+    rng = random.Random(seed)
+    return [{name: _sample(rng, spec) for name, spec in space.items()} for _ in range(n)]
+
+
+def _sample(rng, spec):
+    if isinstance(spec, (list, tuple)):
+        return rng.choice(spec)
+    if isinstance(spec, dict):
+        low, high = spec['low'], spec['high']
+        if spec.get('log'):
+            return math.exp(rng.uniform(math.log(low), math.log(high)))
+        if isinstance(low, int) and isinstance(high, int):
+            return rng.randint(low, high)
+        return rng.uniform(low, high)
+    return spec
+
+
+def run_id(params):
+    """
+    参数点的 id (参数 json 的 md5), 用于断点续跑; 相同的参数点只运行一次
+    """
+    return hashlib.md5(json.dumps(params, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def summarize_history(strategy_history):
+    """
+    strategy_history 的汇总, 指标与 try.ipynb 一致
+    每笔交易的 profit 为扣除手续费后的收益: (卖出价格*(1-fee) - 买入价格*(1+fee)) * 数量
+    time_cost 为 leader 成交到 hedge 成交的时间 (ms), 按 hedge 是否为 maker 分别平均
+    """
+    summary = {'n_trades': len(strategy_history), 'total_profit': 0.0, 'mean_profit': None, 'win_rate': None,
+               'maker_rate': None, 'force_rate': None, 'maker_time_cost': None, 'taker_time_cost': None}
+    if not strategy_history:
+        return summary
+    profits, maker_time_cost, taker_time_cost = [], [], []
+    n_force = 0
+    for trade in strategy_history:
+        leader = trade['leader_price'], trade['leader_fee']
+        hedge = trade['hedge_price'], trade['hedge_fee']
+        (buy_price, buy_fee), (sell_price, sell_fee) = (leader, hedge) if trade['leader_direction'] == 'BUY' else (hedge, leader)
+        profits.append((sell_price*(1 - sell_fee) - buy_price*(1 + buy_fee)) * trade['leader_order_qty'])
+        time_cost = trade['hedge_t'] - trade['leader_t']
+        (maker_time_cost if trade['hedge_traded_is_Maker'] else taker_time_cost).append(time_cost)
+        n_force += bool(trade.get('has_start_force'))
+    n = len(profits)
+    summary.update(total_profit=sum(profits), mean_profit=sum(profits) / n,
+                   win_rate=sum(profit > 0 for profit in profits) / n,
+                   maker_rate=len(maker_time_cost) / n, force_rate=n_force / n,
+                   maker_time_cost=sum(maker_time_cost) / len(maker_time_cost) if maker_time_cost else None,
+                   taker_time_cost=sum(taker_time_cost) / len(taker_time_cost) if taker_time_cost else None)
+    return summary
+
+
+def read_results(path):
+    """
+    结果文件中的记录 {run_id: record}, 同一个 run_id 以最后一条为准
+    中断时没有写完的最后一行被忽略
+    """
+    records = {}
+    if not os.path.exists(path):
+        return records
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            records[record['run_id']] = record
+    return records
+
+
+def load_results(path):
+    """
+    所有回测的结果表: run_id, status, 参数, strategy_history 的汇总, 回测的 event 数量以及耗时
+    """
+    import pandas as pd
+    rows = []
+    for record in read_results(path).values():
+        row = {'run_id': record['run_id'], 'status': record['status']}
+        row.update(record['params'])
+        row.update(record.get('summary') or {})
+        row.update(n_events=record.get('n_events'), run_time=record.get('run_time'), error=record.get('error'))
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def _run_point(conn, config, params):
+    """
+    子进程: 运行一个参数点, 通过 conn 返回结果
+    """
+    try:
+        # 组件的 print 输出不保存
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            engine = build_backtest(config['file_dir'], config['symbol_list'], config['exchange_list'],
+                                    strategy_cls=config['strategy_cls'],
+                                    strategy_params=dict(config['fixed_params'], **params),
+                                    handler_cls=config['handler_cls'], handler_params=config['handler_params'],
+                                    portfolio_params=config['portfolio_params'], routing=config['routing'])
+            engine.run()
+        result = {'status': STATUS_OK, 'summary': summarize_history(engine.strategy.strategy_history),
+                  'n_events': engine.n_events}
+    except Exception:
+        result = {'status': STATUS_ERROR, 'error': traceback.format_exc(limit=5)}
+    conn.send(result)
+    conn.close()
+
+
+class ParameterSweep(object):
+    """
+    file_dir/symbol_list/exchange_list/strategy_cls/handler_cls/handler_params/portfolio_params/routing:
+                    同 BacktestEngine.build_backtest
+    results_path:   结果的 jsonl 文件, 已经存在时跳过其中已经完成的参数点
+    fixed_params:   所有参数点共用的策略参数, 参数点中的值优先
+    n_workers:      同时运行的回测数量, 默认为 cpu 数量
+    timeout:        每次回测的最长时间 (秒), None 为不限制
+    retry_failed:   续跑时是否重新运行之前出错/超时的参数点
+    shared_memory:  子进程是否从共享内存读取数据, None 时只在不支持 fork 的平台上使用
+    """
+
+    def __init__(self, file_dir, symbol_list, exchange_list, results_path,
+                 strategy_cls='Strategy.LeadLagArbitrageStrategy.LeadLagArbitrageStrategy', fixed_params=None,
+                 handler_cls='DataHandler.TradeLOBHourlyDataHandler.HistoricTradeLOBHourlyDataHandler',
+                 handler_params=None, portfolio_params=None, routing=False,
+                 n_workers=None, timeout=None, retry_failed=False, shared_memory=None):
+        self.results_path = results_path
+        self.n_workers = n_workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self.retry_failed = retry_failed
+        self.config = dict(file_dir=file_dir, symbol_list=list(symbol_list), exchange_list=list(exchange_list),
+                           strategy_cls=strategy_cls, fixed_params=dict(fixed_params or {}),
+                           handler_cls=handler_cls, handler_params=dict(handler_params or {}),
+                           portfolio_params=portfolio_params, routing=routing)
+        # fork 时子进程继承父进程已经读取的数据
+        methods = multiprocessing.get_all_start_methods()
+        self.context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+        self.shared_memory = self.context.get_start_method() != 'fork' if shared_memory is None else shared_memory
+        self.n_done = 0
+
+    def completed(self):
+        """
+        结果文件中已经完成的 run_id (retry_failed 时不包括出错/超时的)
+        """
+        return {rid for rid, record in read_results(self.results_path).items()
+                if record['status'] == STATUS_OK or not self.retry_failed}
+
+    def preload(self):
+        """
+        在父进程中读取所有数据源, 返回子进程使用的 config 以及需要在结束时释放的 SharedMarketData
+        """
+        config = self.config
+        handler_cls = config['handler_cls']
+        if isinstance(handler_cls, str):
+            handler_cls = _import_object(handler_cls)
+        if self.shared_memory:
+            shared = SharedMarketData.load(handler_cls, config['file_dir'], config['symbol_list'], config['exchange_list'],
+                                           **config['handler_params'])
+            handler_params = dict(config['handler_params'], shared_data=shared.manifest)
+            return dict(config, handler_params=handler_params), shared
+        if self.context.get_start_method() != 'fork':
+            return config, None
+        # fork 的子进程继承父进程的数据源缓存; 预读取的 handler 不留下线程 (fork 时不会复制正在运行的线程的锁)
+        preload_sources(handler_cls, config['file_dir'], config['symbol_list'], config['exchange_list'],
+                        **config['handler_params'])
+        return config, None
+
+    def run(self, points):
+        """
+        运行 points 中还没有完成的参数点, 每个回测结束后立即写入结果文件, 返回本次运行的记录
+        """
+        completed = self.completed()
+        todo = {}
+        for params in points:
+            rid = run_id(params)
+            if rid not in completed:
+                todo.setdefault(rid, params)
+        print('sweep: %d points, %d already done, %d to run on %d workers'
+              % (len(points), len(points) - len(todo), len(todo), self.n_workers))
+        if not todo:
+            return []
+        config, shared = self.preload()
+        pending = deque(todo.items())
+        running = {}        # conn -> (run_id, params, process, start)
+        records = []
+        self.n_done = 0
+        with open(self.results_path, 'a') as results_file:
+            try:
+                while pending or running:
+                    while pending and len(running) < self.n_workers:
+                        rid, params = pending.popleft()
+                        conn, child_conn = self.context.Pipe(duplex=False)
+                        process = self.context.Process(target=_run_point, args=(child_conn, config, params),
+                                                       daemon=True)
+                        process.start()
+                        child_conn.close()
+                        running[conn] = (rid, params, process, time.monotonic())
+                    for conn in wait(list(running), self._wait_timeout(running)):
+                        rid, params, process, start = running.pop(conn)
+                        try:
+                            result = conn.recv()
+                        except EOFError:
+                            process.join()
+                            result = {'status': STATUS_ERROR, 'error': 'worker exited with code %s' % process.exitcode}
+                        conn.close()
+                        process.join()
+                        records.append(self._record(results_file, rid, params, result, time.monotonic() - start))
+                    self._kill_expired(running, results_file, records)
+            finally:
+                for conn, (rid, params, process, start) in running.items():
+                    process.terminate()
+                    conn.close()
+                if shared is not None:
+                    shared.close()
+        return records
+
+    def _wait_timeout(self, running):
+        if self.timeout is None:
+            return None
+        now = time.monotonic()
+        return max(0.0, min(start for _, _, _, start in running.values()) + self.timeout - now)
+
+    def _kill_expired(self, running, results_file, records):
+        if self.timeout is None:
+            return
+        now = time.monotonic()
+        for conn, (rid, params, process, start) in list(running.items()):
+            if now - start >= self.timeout:
+                process.terminate()
+                process.join()
+                conn.close()
+                del running[conn]
+                result = {'status': STATUS_TIMEOUT, 'error': 'timeout after %ss' % self.timeout}
+                records.append(self._record(results_file, rid, params, result, now - start))
+
+    def _record(self, results_file, rid, params, result, run_time):
+        record = dict(run_id=rid, params=params, run_time=round(run_time, 3), **result)
+        results_file.write(json.dumps(record) + '\n')
+        results_file.flush()
+        self.n_done += 1
+        print('[%d] %s %s %.1fs %s' % (self.n_done, rid, record['status'], run_time, json.dumps(params)))
+        return record
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='run a multiprocess parameter sweep')
+    parser.add_argument('--file_dir', required=True)
+    parser.add_argument('--symbols', required=True, help='comma separated, e.g. btc_usdt,btc_usdt')
+    parser.add_argument('--exchanges', required=True, help='comma separated, e.g. binance,bybit')
+    parser.add_argument('--csv', action='store_true', help='data files are csv instead of parquet')
+    parser.add_argument('--strategy', default='Strategy.LeadLagArbitrageStrategy.LeadLagArbitrageStrategy')
+    parser.add_argument('--grid', default=None, help='parameter grid as json, {"k1": [...], ...}')
+    parser.add_argument('--random', default=None, help='random search space as json, see random_points')
+    parser.add_argument('--n', type=int, default=100, help='number of random points')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--params', default='{}', help='fixed strategy parameters as json')
+    parser.add_argument('--handler_params', default='{}', help='extra data handler parameters as json')
+    parser.add_argument('--results', required=True, help='jsonl results file, reused to resume the sweep')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--timeout', type=float, default=None, help='seconds per backtest')
+    parser.add_argument('--retry_failed', action='store_true', help='rerun points that failed or timed out')
+    parser.add_argument('--routing', action='store_true', help='route market events by component interest')
+    parser.add_argument('--shared_memory', action='store_true', help='workers read market data from shared memory')
+    parser.add_argument('--output', default=None, help='save the results table to this csv file')
+    args = parser.parse_args(argv)
+
+    if (args.grid is None) == (args.random is None):
+        parser.error('give exactly one of --grid and --random')
+    if args.grid is not None:
+        points = grid_points(json.loads(args.grid))
+    else:
+        points = random_points(json.loads(args.random), args.n, args.seed)
+    sweep = ParameterSweep(args.file_dir, args.symbols.split(','), args.exchanges.split(','), args.results,
+                           strategy_cls=args.strategy, fixed_params=json.loads(args.params),
+                           handler_params=dict(is_csv=args.csv, **json.loads(args.handler_params)),
+                           routing=args.routing, n_workers=args.workers, timeout=args.timeout,
+                           retry_failed=args.retry_failed, shared_memory=args.shared_memory or None)
+    sweep.run(points)
+    results = load_results(args.results)
+    if args.output:
+        results.to_csv(args.output, index=False)
+    if 'total_profit' in results:
+        print(results.sort_values('total_profit', ascending=False, na_position='last').head(10).to_string(index=False))
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -1,17 +1,26 @@
-import copy
-
-
 class OrderData(object):
-    """行情数据类"""
+    """订单数据类, 使用 __slots__"""
+    __slots__ = ()
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
 
     def __repr__(self):
-        return self.__dict__.__repr__()
+        return self.to_dict().__repr__()
 
     def copy(self):
-        return copy.deepcopy(self)
+        """
+        字段都是标量, 复制每个字段即可, 不需要 deepcopy
+        """
+        new = object.__new__(type(self))
+        for name in self.__slots__:
+            setattr(new, name, getattr(self, name))
+        return new
 
 
 class LiveOrder(OrderData):
+    __slots__ = ('timestamp', 'symbol', 'order_id', 'order_type', 'direction', 'quantity', 'price', 'help_state')
+
     def __init__(self, timestamp, symbol, order_id, 
                  order_type, direction, quantity, price=None):
         # timestamp 指的是订单达到交易所的时间，也就是生效时间
@@ -23,6 +32,3 @@ class LiveOrder(OrderData):
         self.quantity = quantity
         self.price = price
         self.help_state = 0
-
-
-
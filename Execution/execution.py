@@ -14,7 +14,7 @@ import sys
 sys.path.append("..")
 import numpy as np
 
-from event import FillEvent, OrderEvent
+from event import FillEvent, OrderEvent, ALL_MARKET, NO_MARKET
 from object import ExecutionHandler
 from Execution.OrderDataStructure import LiveOrder
 
@@ -36,15 +36,20 @@ class SimulatedExecutionHandler(ExecutionHandler):
         up internally.
 
         Parameters:
-        events - The Queue of Event objects.
+        events - The Queue of Event objects. 回测的 EventQueue 提供 schedule_at (订单在生效时间由 scheduler 加入),
+                 没有 scheduler 的队列 (例如 queue.Queue) 在每次行情中检查还没有生效的订单
         """
         self.events = events
+        self.schedule_at = getattr(events, 'schedule_at', None)
         self.datahandler = datahandler
         self.symbol_exchange_list = self.datahandler.symbol_exchange_list
-        # 每一个symbol存在的挂单
+        # 所有 symbol 最新行情的共享状态, 按 symbol O(1) 读取 bid1/ask1
+        self.market_state = self.datahandler.market_state
+        # 每一个symbol已经生效的挂单
         self.live_orders_on_exchange = dict( (k,v) for k, v in [(s, []) for s in self.symbol_exchange_list] )
-        # 每一个symbol存在的挂单中，最小的生效时间（为了考虑挂单延迟生成的辅助属性
-        self.live_orders_on_exchange_min_time = dict( (k,v) for k, v in [(s, None) for s in self.symbol_exchange_list] )
+        # 考虑挂单延迟, 还没有生效的挂单 {order_id: timer}, 由 scheduler 在订单的生效时间加入 live_orders_on_exchange
+        # 没有 scheduler 时为 {order_id: order}, 由 on_market_event 加入
+        self.pending_orders = {}
         
         # 我们这个虚假交易所是否需要帮助优化 POST_ONLY 挂单
         self.change_post_only = True
@@ -54,34 +59,45 @@ class SimulatedExecutionHandler(ExecutionHandler):
         取消所有订单
         暂时不返回 fill event
         """
+        if self.schedule_at is not None:
+            for timer in self.pending_orders.values():
+                timer.cancel()
+        self.pending_orders = {}
         self.live_orders_on_exchange = dict( (k,v) for k, v in [(s, []) for s in self.symbol_exchange_list] )
-        self.live_orders_on_exchange_min_time = dict( (k,v) for k, v in [(s, None) for s in self.symbol_exchange_list] )
 
-    def _cal_live_orders_on_exchange_min_time(self):
+    def _activate_order(self, order):
         """
-        用于计算每个 symbol 最小有效时间的订单
-        在每次策略挂单发生变动的时候调用
-        能够有效地检查当 MarketEvent 频繁到达而导致的重复检查浪费时间问题
+        订单到达生效时间, 由 scheduler 调用; 之后的行情中参与撮合
         """
-        for s in self.symbol_exchange_list:
-            if len(self.live_orders_on_exchange[s])==0:
-                self.live_orders_on_exchange_min_time[s] = None
-            else:
-                tmp = min([i.timestamp for i in self.live_orders_on_exchange[s]])
-                self.live_orders_on_exchange_min_time[s] = tmp
+        del self.pending_orders[order.order_id]
+        self.live_orders_on_exchange[order.symbol].append(order)
+
+    def _activate_due_orders(self):
+        """
+        没有 scheduler 时, 按生效时间的顺序加入所有已经到达生效时间的订单
+        """
+        time_now = self.datahandler.backtest_now
+        due = [order for order in self.pending_orders.values() if order.timestamp <= time_now]
+        for order in sorted(due, key=lambda order: order.timestamp):
+            self._activate_order(order)
 
     def on_order_event(self, event):
         """
         接收新的下单信息 把新的订单加入到live_orders_on_exchange中
+        生效时间在之后的订单在生效时间由 scheduler 加入 (没有 scheduler 时在之后的行情中加入)
         """
         if event.type == 'ORDER':
             order = LiveOrder(timestamp = event.timestamp, symbol= event.symbol,
                               order_id= event.order_id, order_type= event.order_type, 
                               direction= event.direction, quantity= event.quantity, 
                               price= event.price)
-            self.live_orders_on_exchange[order.symbol].append(order)
-            # 更新 live_orders_on_exchange_min_time
-            self._cal_live_orders_on_exchange_min_time()
+            if order.timestamp > self.datahandler.backtest_now:
+                if self.schedule_at is not None:
+                    self.pending_orders[order.order_id] = self.schedule_at(order.timestamp, self._activate_order, order)
+                else:
+                    self.pending_orders[order.order_id] = order
+            else:
+                self.live_orders_on_exchange[order.symbol].append(order)
 
             # 调用尝试撮合函数
             self.on_market_event(event)
@@ -91,23 +107,33 @@ class SimulatedExecutionHandler(ExecutionHandler):
         接受订单Fill信息
         成交/取消订单
         1.从 live_orders_on_exchange 中删除
-        2.重新计算 live_orders_on_exchange_min_time
+        2.还没有生效的订单取消 scheduler 中的 timer
         """
         if event.type == 'FILL':
+            timer = self.pending_orders.pop(event.order_id, None)
+            if timer is not None and self.schedule_at is not None:
+                timer.cancel()
             new_orders = [i for i in self.live_orders_on_exchange[event.symbol] if i.order_id != event.order_id]
             self.live_orders_on_exchange[event.symbol] = new_orders
-            # 更新 live_orders_on_exchange_min_time
-            self._cal_live_orders_on_exchange_min_time()
+
+    def market_interest(self):
+        """
+        只有存在已经生效的挂单时才需要行情 (撮合检查)
+        """
+        for orders in self.live_orders_on_exchange.values():
+            if orders:
+                return ALL_MARKET
+        return NO_MARKET
 
     def on_market_event(self, event):
         """
         市场行情信息发生了更新，我们检查是否有 live_orders_on_exchange 发生撮合
         """
-        time_now = self.datahandler.backtest_now
+        if self.pending_orders and self.schedule_at is None:
+            self._activate_due_orders()
         for s in self.symbol_exchange_list:
-            # 如果没有订单或者订单的生效时间在之后，我们都不对其进行撮合检查
-            if self.live_orders_on_exchange_min_time[s] is None: continue
-            if self.live_orders_on_exchange_min_time[s] > time_now: continue
+            # 如果没有已经生效的订单，我们不对其进行撮合检查
+            if len(self.live_orders_on_exchange[s])==0: continue
             # 检查撮合
             self.try_excute_order(s)
 
@@ -115,12 +141,10 @@ class SimulatedExecutionHandler(ExecutionHandler):
         """
         检查 s 的订单是否发生撮合
         """
-        time_now = self.datahandler.backtest_now
         if len(self.live_orders_on_exchange[s])==0: return  # 再做一次冗余性检查
 
         for i in range(len(self.live_orders_on_exchange[s])):
             order_tobe_execute = self.live_orders_on_exchange[s][i]
-            if order_tobe_execute.timestamp > time_now: continue
 
             # 市价单
             if order_tobe_execute.order_type == "MARKET":
@@ -156,32 +180,32 @@ class SimulatedExecutionHandler(ExecutionHandler):
         
         # 获取最新的LOB数据
         ### 这里可能出现 订单簿的更显时间与回测系统的 backtest_now 不一致的情况。默认订单簿没有发生改变
-        live_LOB = self.datahandler.get_latest_LOBs()[order.symbol]
+        bid1, ask1 = self.market_state.best_bid_ask(order.symbol)
 
         # 检查是否能够成交
         traded_type = False
         traded_prc = np.nan
         
         if order.direction == 'BUY':
-            if order.price >= live_LOB.ask1:
+            if order.price >= ask1:
                 traded_type = True
-                traded_prc = live_LOB.ask1
-                # print(order,'\n',live_LOB,'\n',traded_prc)
+                traded_prc = ask1
+                # print(order,'\n',bid1,ask1,'\n',traded_prc)
         
         if order.direction == 'SELL':
-            if order.price <= live_LOB.bid1:
+            if order.price <= bid1:
                 traded_type = True
-                traded_prc = live_LOB.bid1
-                # print(order,'\n',live_LOB,'\n',traded_prc)
+                traded_prc = bid1
+                # print(order,'\n',bid1,ask1,'\n',traded_prc)
         
         # 检查对于一个限价订单挂过来，是不是会立刻作为 Taker 成交
         # 本来这个功能可以在 on_order_event 中实现，但是1.需要考虑订单的挂单延迟，2.一开始没有提前做好规划
         if order.help_state==0:
             if traded_type:
                 if order.direction == 'BUY':
-                    order.price = live_LOB.bid1
+                    order.price = bid1
                 if order.direction == 'SELL':
-                    order.price = live_LOB.ask1
+                    order.price = ask1
                 traded_type = False
         if order.help_state==1:
             # sys.exit()
@@ -210,23 +234,23 @@ class SimulatedExecutionHandler(ExecutionHandler):
         
         # 获取最新的LOB数据
         ### 这里可能出现 订单簿的更显时间与回测系统的 backtest_now 不一致的情况。默认订单簿没有发生改变
-        live_LOB = self.datahandler.get_latest_LOBs()[order.symbol]
+        bid1, ask1 = self.market_state.best_bid_ask(order.symbol)
 
         # 检查是否能够成交
         traded_type = False
         traded_prc = np.nan
         
         if order.direction == 'BUY':
-            if order.price >= live_LOB.ask1:
+            if order.price >= ask1:
                 traded_type = True
-                traded_prc = live_LOB.ask1
-                # print(order,'\n',live_LOB,'\n',traded_prc)
+                traded_prc = ask1
+                # print(order,'\n',bid1,ask1,'\n',traded_prc)
         
         if order.direction == 'SELL':
-            if order.price <= live_LOB.bid1:
+            if order.price <= bid1:
                 traded_type = True
-                traded_prc = live_LOB.bid1
-                # print(order,'\n',live_LOB,'\n',traded_prc)
+                traded_prc = bid1
+                # print(order,'\n',bid1,ask1,'\n',traded_prc)
         
         # 检查对于一个限价订单挂过来，是不是会立刻作为 Taker 成交
         # 本来这个功能可以在 on_order_event 中实现，但是1.需要考虑订单的挂单延迟，2.一开始没有提前做好规划
@@ -264,7 +288,7 @@ class SimulatedExecutionHandler(ExecutionHandler):
         
         # 获取最新的LOB数据
         ### 这里可能出现 订单簿的更显时间与回测系统的 backtest_now 不一致的情况。默认订单簿没有发生改变
-        live_LOB = self.datahandler.get_latest_LOBs()[order.symbol]
+        bid1, ask1 = self.market_state.best_bid_ask(order.symbol)
         
         # 检查是否能够成交
         traded_type = False
@@ -272,18 +296,25 @@ class SimulatedExecutionHandler(ExecutionHandler):
         fill_flag = "CANCELED"
         
         if order.direction == 'BUY':
-            if order.price >= live_LOB.ask1:
+            if order.price >= ask1:
                 traded_type = True
-                traded_prc = live_LOB.ask1
+                traded_prc = ask1
                 fill_flag = "ALL"
-                # print(order,'\n',live_LOB,'\n',traded_prc)
+                # print(order,'\n',bid1,ask1,'\n',traded_prc)
         
         if order.direction == 'SELL':
-            if order.price <= live_LOB.bid1:
+            if order.price <= bid1:
                 traded_type = True
-                traded_prc = live_LOB.bid1
+                traded_prc = bid1
                 fill_flag = "ALL"
-                # print(order,'\n',live_LOB,'\n',traded_prc)
+                # print(order,'\n',bid1,ask1,'\n',traded_prc)
+        
+        # 有 L2 订单簿时按档位吃单: 限价以内的深度足够才成交, 成交价为吃单的均价
+        book = self.datahandler.get_order_book(order.symbol)
+        if book is not None:
+            traded_prc = book.fill_price(order.direction, order.quantity, order.price)
+            traded_type = traded_prc == traded_prc
+            fill_flag = "ALL" if traded_type else "CANCELED"
         
         # 向 event_queue put fill event
         fill_event = FillEvent(timestamp=self.datahandler.backtest_now, 
@@ -309,14 +340,18 @@ class SimulatedExecutionHandler(ExecutionHandler):
         
         # 获取最新的LOB数据
         ### 这里可能出现 订单簿的更显时间与回测系统的 backtest_now 不一致的情况。默认订单簿没有发生改变
-        live_LOB = self.datahandler.get_latest_LOBs()[order.symbol]
+        bid1, ask1 = self.market_state.best_bid_ask(order.symbol)
 
         # 生成成交价格
         ### 系统忽略交易量这个概念，如果订单下单量超过订单簿的量会生成警告
         if order.direction == 'BUY':
-            traded_prc = live_LOB.ask1
+            traded_prc = ask1
         if order.direction == 'SELL':
-            traded_prc = live_LOB.bid1
+            traded_prc = bid1
+        # 有 L2 订单簿时按档位吃单, 成交价为吃单的均价 (深度不足的部分按最后一档成交)
+        book = self.datahandler.get_order_book(order.symbol)
+        if book is not None:
+            traded_prc = book.fill_price(order.direction, order.quantity)
          
         # 向 event_queue put fill event
         fill_event = FillEvent(timestamp=self.datahandler.backtest_now, 
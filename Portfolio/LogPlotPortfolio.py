@@ -17,7 +17,7 @@ from math import floor
 import sys
 sys.path.append("..")
 
-from event import FillEvent, OrderEvent
+from event import FillEvent, OrderEvent, Interest, ALL_MARKET, NO_MARKET
 from object import Portfolio
 from Portfolio.Performance import *
 
@@ -43,12 +43,16 @@ class LogPlotPortfolio(Portfolio):
         self.datahandler = datahandler
         self.events = events
         self.symbol_exchange_list = self.datahandler.symbol_exchange_list
+        self.market_state = self.datahandler.market_state
         self.start_time = self.datahandler.start_time
         self.initial_capital = initial_capital
         self.log_interval = log_interval
         self.last_log_time = None
         
         self.construct_positions_holdings()
+        # 只有持仓的 symbol 成交价变动时净值才会变化; 成交之后的第一次推送需要重新计算所有 symbol
+        self.position_interest = NO_MARKET
+        self.holdings_changed = False
 
     def construct_positions_holdings(self):
         """
@@ -71,8 +75,14 @@ class LogPlotPortfolio(Portfolio):
         self.current_holdings['commission'] = None
         self.current_holdings['net_value'] = 0
 
+    def market_interest(self):
+        if self.log_interval is not None or self.holdings_changed:
+            return ALL_MARKET
+        return self.position_interest
+
     def on_market_event(self,event):
         self.update_holdings_from_market()
+        self.holdings_changed = False
 
     def update_holdings_from_market(self):
         """
@@ -87,21 +97,22 @@ class LogPlotPortfolio(Portfolio):
             else: return
 
         # 开始更新记录
-        trades = self.datahandler.get_latest_prices()
+        # 直接从 market_state 按 symbol 读取最新成交价, 不生成 dict
+        last_price = self.market_state.last_price
         net_value = 0
-        if trades is not None:
-            for s in self.symbol_exchange_list:
-                if s not in trades: continue
-                # 记录之前的值观察是否出现变动
-                current_value_s = trades[s] * self.current_positions[s]
-                if current_value_s != self.current_holdings[s]:
-                    self.current_holdings[s] = current_value_s
-                    self.all_holdings[s][self.datahandler.backtest_now] = self.current_holdings[s]
-                net_value += self.current_holdings[s]
-            # 记录总值
-            if net_value!= self.current_holdings['net_value']:
-                self.current_holdings['net_value'] = net_value
-                self.all_holdings['net_value'][self.datahandler.backtest_now] = net_value
+        for i, s in enumerate(self.symbol_exchange_list):
+            price = last_price.item(i)
+            if price != price: continue     # 还没有成交 (nan)
+            # 记录之前的值观察是否出现变动
+            current_value_s = price * self.current_positions[s]
+            if current_value_s != self.current_holdings[s]:
+                self.current_holdings[s] = current_value_s
+                self.all_holdings[s][self.datahandler.backtest_now] = self.current_holdings[s]
+            net_value += self.current_holdings[s]
+        # 记录总值
+        if net_value!= self.current_holdings['net_value']:
+            self.current_holdings['net_value'] = net_value
+            self.all_holdings['net_value'][self.datahandler.backtest_now] = net_value
 
     def on_fill_event(self,event):
         if event.type == "FILL":
@@ -132,6 +143,10 @@ class LogPlotPortfolio(Portfolio):
             self.current_holdings['net_value'] += change_of_holdings
             self.all_holdings['net_value'][self.datahandler.backtest_now] = self.current_holdings['net_value']
 
+            self.holdings_changed = True
+            self.position_interest = Interest(symbols=[s for s in self.symbol_exchange_list if self.current_positions[s] != 0],
+                                              LOB=False)
+
     def create_equity_curve_dataframe(self):
         """
         生成净值曲线
@@ -83,7 +83,7 @@ class BuyAndHoldStrategy(Strategy):
                 # 如果我们还没有进行第一次建仓
                 if self.bought[s] is None:
                     if self.datahandler.latest_symbol_exchange_LOB_data_time[s] is None: continue
-                    orderbook_info = self.datahandler.registered_symbol_exchange_LOB_data[s][self.datahandler.latest_symbol_exchange_LOB_data_time[s]][0]
+                    orderbook_info = self.datahandler.latest_symbol_exchange_LOB_data[s][0]
                     # 生成order信息
                     # 这里 timestamp=(time_now + 2*self.order_latency) 指的是 order 到达交易所的时间，即挂在orderbook上的时间
                     order = OrderEvent(timestamp=time_now+2*self.order_latency, symbol=s, order_id = self._get_order_id(),
@@ -97,7 +97,7 @@ class BuyAndHoldStrategy(Strategy):
                     last_trade_time = self.bought[s].signal_timestamp
                     if time_now - last_trade_time <  (1000*60*20):  # 20min调仓一次
                         now_value = self.portfolio.current_holdings[s]
-                        orderbook_info = self.datahandler.registered_symbol_exchange_LOB_data[s][self.datahandler.latest_symbol_exchange_LOB_data_time[s]][0]
+                        orderbook_info = self.datahandler.latest_symbol_exchange_LOB_data[s][0]
                         # rebalance
                         if now_value<1000:
                             order = OrderEvent(timestamp=time_now+2*self.order_latency, symbol=s, order_id = self._get_order_id(),
@@ -12,7 +12,7 @@ sys.path.append("..")
 
 from abc import ABCMeta, abstractmethod
 
-from event import OrderEvent, FillEvent
+from event import OrderEvent, FillEvent, Interest, ALL_MARKET
 from object import Strategy
 from Strategy.strategy import StrategyData, Strategy_Info
 
@@ -39,7 +39,10 @@ class LeadLagArbitrageStrategy(Strategy):
         """
         self.datahandler = datahandler
         self.symbol_exchange_list = self.datahandler.symbol_exchange_list
+        self.market_state = self.datahandler.market_state
         self.events = events
+        # 回测的 EventQueue 提供 scheduler; 没有 scheduler 的队列 (例如 queue.Queue) 在每次行情中检查是否超时
+        self.schedule_at = getattr(events, 'schedule_at', None)
         self.portfolio = portfolio
         self.executor = executor
         self.order_latency = order_latency
@@ -56,13 +59,20 @@ class LeadLagArbitrageStrategy(Strategy):
         # arguments used in this strategy
         # Store useful infomation for order generate and stop loss
         self._gen_pair_list()
+        # 空仓时只需要 pair 中两个 symbol 的 trade 更新 (计算信号), 持仓时每次推送都需要检查止损
+        self.flat_interest = Interest(symbols=self.pair_list, LOB=False)
+        # pair 中每个 symbol 之前推送的最后一笔成交价, 作为本次推送第一笔成交的比较基准
+        # (不从 datahandler 的历史中读取: 一次推送的成交多于 history_depth 时历史中已经没有这一笔)
+        self.last_trade_price = dict((s, None) for s in self.pair_list)
         # self.signal_time = dict( (k,v) for k, v in [(s, None) for s in self.symbol_exchange_list] )
-        self.last_trade = dict( (k,v) for k, v in [(s, None) for s in self.symbol_exchange_list] )
         
         # 记录历史开仓数据
         self.strategy_history = []
         # 记录目前交易的详情
         self.trade_state = {'leader_t':None}
+        # 超时强行平仓的 timer (由 scheduler 在 stop_time 之后触发), 以及最近一次强行平仓的时间
+        self.stop_timer = None
+        self.force_time = None
 
     def _gen_pair_list(self):
         self.pair_list = {self.symbol_exchange_list[0]:self.symbol_exchange_list[1],
@@ -82,29 +92,23 @@ class LeadLagArbitrageStrategy(Strategy):
     def on_order_fill(self,event):
         pass
     
-    def update_last_trade_s(self, s):
-        """
-        更新上一次交易历史的记录
-        """
-        self.last_trade[s] = self.datahandler.get_latest_trades()[s]
-
     def calculate_signals(self, s):
         """
         如果一个资产没有被交易，我们生成信号并持有，如果已经有仓位，我们则忽略
         这也就意味着我们的 position_limit 为 1
         """
-        # 生成交易记录的list
-        traded_info = self.datahandler.latest_symbol_exchange_trade_data[s]
-        if self.last_trade[s] is not None:
-            traded_info = [self.last_trade[s]] + traded_info
+        # 之前的最后一笔成交以及本次推送的全部成交 (不受 history_depth 的限制)
+        prices = [trade.price for trade in self.datahandler.latest_symbol_exchange_trade_data[s]]
+        if self.last_trade_price[s] is not None:
+            prices.insert(0, self.last_trade_price[s])
         
-        for i in range(1, len(traded_info)):
-            if (traded_info[i].price/traded_info[i-1].price - 1) > self.k1:
+        for i in range(1, len(prices)):
+            if (prices[i]/prices[i-1] - 1) > self.k1:
                 ## 下订单
                 signal_time = self.datahandler.backtest_now
                 IOC_symbol = self.pair_list[s]
-                IOC_price = traded_info[i-1].price*(1-self.k2)
-                # IOC_price = traded_info[i].price*(1-(self.k2+self.k1))
+                IOC_price = prices[i-1]*(1-self.k2)
+                # IOC_price = prices[i]*(1-(self.k2+self.k1))
                 order = OrderEvent(timestamp=signal_time+2*self.order_latency, 
                                    symbol=IOC_symbol, 
                                    order_id = self._get_order_id(),
@@ -114,6 +118,9 @@ class LeadLagArbitrageStrategy(Strategy):
                                    quantity=(10000/IOC_price))
                 self.events.put(order)
 
+    def market_interest(self):
+        return self.flat_interest if self.trade_state['leader_t'] is None else ALL_MARKET
+
     def on_market_event(self, event):
         """
         Market Event 到达之后需要更新的信息
@@ -124,67 +131,101 @@ class LeadLagArbitrageStrategy(Strategy):
         # 计算信号
         updated_trade_symbols = self.datahandler.get_updated_trade_symbols()
         for s in updated_trade_symbols:
+            # 只交易 pair_list 中的 symbol, 其它的 symbol 忽略
+            if s not in self.pair_list:
+                continue
             if self.trade_state['leader_t'] is None:
                 self.calculate_signals(s)
-            self.update_last_trade_s(s)
+            self.last_trade_price[s] = self.market_state.last_price_of(s)
 
-        # 检查是否仓位暴露过久需要强行平仓
-        # 调用活跃订单监控函数
-        if self.trade_state['leader_t'] is not None:
+        # 检查止损 (依赖最新价格, 每次行情都检查); 超时强行平仓由 scheduler 触发, 没有 scheduler 时每次行情检查
+        # 每个时间点最多强行平仓一次
+        time_now = self.datahandler.backtest_now
+        if self.trade_state['leader_t'] is not None and self.force_time != time_now:
             self.monitor_stop_loss()
-            self.monitor_live_order()
+            if self.schedule_at is None and self.force_time != time_now and time_now > self.trade_state['stop_time']:
+                self.force_hedge()
 
     def monitor_stop_loss(self):
-        price = self.datahandler.get_latest_prices()[self.trade_state['hedge_symbol']]
+        price = self.market_state.last_price_of(self.trade_state['hedge_symbol'])
         if self.trade_state['leader_direction'] == "BUY":
             if (price - self.trade_state['leader_price'])/self.trade_state['leader_price'] < - self.stop_loss_threshold:
                 self.trade_state['stop_time'] = self.datahandler.backtest_now -1
+                self.force_hedge()
         if self.trade_state['leader_direction'] == "SELL":
             if (price - self.trade_state['leader_price'])/self.trade_state['leader_price'] > self.stop_loss_threshold:
                 self.trade_state['stop_time'] = self.datahandler.backtest_now -1
+                self.force_hedge()
 
-    def monitor_live_order(self):
+    def _schedule_stop(self):
         """
-        监控活跃的订单
-        比如说超过一段时间我们要强行平仓等等
+        backtest_now > stop_time 时触发 on_stop_time (没有 scheduler 时由 on_market_event 检查)
         """
-        if self.datahandler.backtest_now > self.trade_state['stop_time']:
-            # print('===== start force hedge =====')     
-            # 取消上一次订单
-            fill_event = FillEvent(timestamp=self.datahandler.backtest_now, 
-                                    symbol=self.trade_state['hedge_symbol'],
-                                    exchange=self.trade_state['hedge_symbol'].split("_")[-1], 
-                                    order_id=self.trade_state['hedge_order_id'],
-                                    direction=self.trade_state['hedge_direction'], 
-                                    quantity=self.trade_state['hedge_qty'], 
-                                    price=self.trade_state['hedge_price'], 
-                                    is_Maker=False,
-                                    fill_flag = 'CANCELED')
-            self.events.put(fill_event)
+        if self.schedule_at is None:
+            return
+        if self.stop_timer is not None:
+            self.stop_timer.cancel()
+        stop_time = max(self.trade_state['stop_time'], self.datahandler.backtest_now)
+        self.stop_timer = self.schedule_at(stop_time + 1, self.on_stop_time)
 
-            new_order_type = 'MARKET'
-            new_order_price = np.nan
-            # 策略额外部分，动态平仓尝试
-            if self.dynamic_stop_hedge:
-                if self.trade_state['has_start_force'] ==0:
-                    self.trade_state['stop_time'] += self.dynamic_stop_hedge
-                    self.trade_state['has_start_force'] = 1
-                    new_order_type = 'LIMIT'
-                    live_LOB = self.datahandler.get_latest_LOBs()[self.trade_state['hedge_symbol']]
-                    if self.trade_state['hedge_direction'] =="BUY":
-                        new_order_price = live_LOB.bid1
-                    if self.trade_state['hedge_direction'] =="SELL":
-                        new_order_price = live_LOB.ask1
+    def _cancel_stop(self):
+        if self.stop_timer is not None:
+            self.stop_timer.cancel()
+            self.stop_timer = None
 
-            order = OrderEvent(timestamp= self.datahandler.backtest_now, 
-                                symbol= self.trade_state['hedge_symbol'], 
-                                order_id = self._get_order_id(),
-                                order_type= new_order_type, 
-                                direction=self.trade_state['hedge_direction'],
-                                price = new_order_price,
-                                quantity=self.trade_state['hedge_qty'])
-            self.trade_state['hedge_order_id'] = order.order_id
-            self.events.put(order)
+    def on_stop_time(self):
+        """
+        挂单超过 stop_time 仍然没有成交, 由 scheduler 调用
+        先检查止损 (止损时以当前时间作为 stop_time), 然后强行平仓
+        """
+        self.stop_timer = None
+        self.monitor_stop_loss()
+        if self.force_time != self.datahandler.backtest_now:
+            self.force_hedge()
+
+    def force_hedge(self):
+        """
+        强行平仓: 取消上一次的对冲订单, 第一次 (dynamic_stop_hedge) 以对手价挂 LIMIT 单, 之后以市价单平仓
+        之后如果仍然没有成交, 在新的 stop_time 之后再次触发
+        """
+        self.force_time = self.datahandler.backtest_now
+        # print('===== start force hedge =====')     
+        # 取消上一次订单
+        fill_event = FillEvent(timestamp=self.datahandler.backtest_now, 
+                                symbol=self.trade_state['hedge_symbol'],
+                                exchange=self.trade_state['hedge_symbol'].split("_")[-1], 
+                                order_id=self.trade_state['hedge_order_id'],
+                                direction=self.trade_state['hedge_direction'], 
+                                quantity=self.trade_state['hedge_qty'], 
+                                price=self.trade_state['hedge_price'], 
+                                is_Maker=False,
+                                fill_flag = 'CANCELED')
+        self.events.put(fill_event)
+
+        new_order_type = 'MARKET'
+        new_order_price = np.nan
+        # 策略额外部分，动态平仓尝试
+        if self.dynamic_stop_hedge:
+            if self.trade_state['has_start_force'] ==0:
+                self.trade_state['stop_time'] += self.dynamic_stop_hedge
+                self.trade_state['has_start_force'] = 1
+                new_order_type = 'LIMIT'
+                bid1, ask1 = self.market_state.best_bid_ask(self.trade_state['hedge_symbol'])
+                if self.trade_state['hedge_direction'] =="BUY":
+                    new_order_price = bid1
+                if self.trade_state['hedge_direction'] =="SELL":
+                    new_order_price = ask1
+
+        order = OrderEvent(timestamp= self.datahandler.backtest_now, 
+                            symbol= self.trade_state['hedge_symbol'], 
+                            order_id = self._get_order_id(),
+                            order_type= new_order_type, 
+                            direction=self.trade_state['hedge_direction'],
+                            price = new_order_price,
+                            quantity=self.trade_state['hedge_qty'])
+        self.trade_state['hedge_order_id'] = order.order_id
+        self.events.put(order)
+        self._schedule_stop()
 
     def on_fill_event(self, event):
         """
@@ -232,6 +273,7 @@ class LeadLagArbitrageStrategy(Strategy):
             self.trade_state['hedge_direction'] = order.direction
             self.trade_state['hedge_qty'] = order.quantity
             self.trade_state['hedge_price'] = order.price
+            self._schedule_stop()
             return
         
         # 说明是在确认之前开仓的收益
@@ -247,6 +289,7 @@ class LeadLagArbitrageStrategy(Strategy):
             ## 初始化之后我们可以重新计算信号并且开仓
             self.strategy_history.append(self.trade_state)
             self.trade_state = {'leader_t':None}
+            self._cancel_stop()
             self.executor.cancel_all_orders()
             # sys.exit()
             
@@ -0,0 +1,254 @@
+# bench_engine.py
+
+"""
+notebook 主循环 (queue.Queue + get(False)/queue.Empty + if/elif 比较 event.type) vs BacktestEngine
+
+1. 只测循环本身: 合成的 event 序列, handler 不做任何事
+2. 完整回测: 同一份数据, 同一组参数, 端到端比较 try.ipynb 原来的循环 (queue.Queue, 组件每次行情检查时间)
+   与 BacktestEngine (EventQueue + scheduler), 检查 strategy_history 完全一致
+   同时给出只推送数据 (没有组件) 的耗时: 回测的大部分时间在 data handler 中, 循环/分发只占一小部分,
+   engine 端到端的收益以此为上限
+3. interest 路由: 同一个 engine 关闭/打开 routing, 比较耗时并检查结果一致
+   策略只交易前两个 symbol, 给出更多的 exchange 时其它 symbol 的数据在策略空仓且没有挂单时被 fast_forward 跳过
+
+仓库中的 data_sample 只有 trade 文件, 需要指定包含 *_trade 以及 *_LOB 文件的目录
+
+usage:
+    python benchmarks/bench_engine.py --file_dir DIR [--exchanges bybit,okex,...] [--csv] [--repeat 5]
+"""
+
+import argparse
+import contextlib
+import gc
+import io
+import os
+import queue
+import statistics
+import sys
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from event import MARKET_EVENT, OrderEvent, FillEvent
+from Engine.BacktestEngine import BacktestEngine, EventQueue, build_backtest
+from DataHandler.TradeLOBHourlyDataHandler import HistoricTradeLOBHourlyDataHandler
+from Strategy.LeadLagArbitrageStrategy import LeadLagArbitrageStrategy
+from Portfolio.LogPlotPortfolio import LogPlotPortfolio
+from Execution.execution import SimulatedExecutionHandler
+
+
+STRATEGY_PARAMS = dict(k1=0.5*1e-4, k2=0.7*1e-4, k3=1.5*1e-4, order_live_time=25*1000,
+                       dynamic_stop_hedge=5*1000, stop_loss_threshold=1*1e-4)
+
+
+########## 1. 只测循环 ##########
+
+class _NullComponent(object):
+    def on_market_event(self, event):
+        pass
+
+    def on_order_event(self, event):
+        pass
+
+    def on_fill_event(self, event):
+        pass
+
+
+class _SyntheticHandler(object):
+    """
+    每次 update 推送一个 MARKET, 每 10 次再推送 ORDER 和 FILL
+    """
+
+    def __init__(self, events, n):
+        self.events = events
+        self.n = n
+        self.i = 0
+        self.continue_backtest = True
+        self.order = OrderEvent(0, 'btc_usdt_bybit', 0, 'LIMIT', 'BUY', 0.1, 42611.99)
+        self.fill = FillEvent(0, 'btc_usdt_bybit', 'bybit', 0, 'BUY', 0.1, 42611.99, True, 'PARTIAL')
+
+    def update_TradeLOB(self):
+        self.i += 1
+        if self.i > self.n:
+            self.continue_backtest = False
+            return
+        self.events.put(MARKET_EVENT)
+        if self.i % 10 == 0:
+            self.events.put(self.order)
+            self.events.put(self.fill)
+
+
+def notebook_loop(event_queue, data_handler, strategy, portfolio, executor):
+    """
+    try.ipynb 中原来的循环 (原样), event_queue 为 queue.Queue
+    组件在没有 scheduler 的队列上每次行情检查订单生效时间以及超时
+    """
+    while True:
+        if data_handler.continue_backtest == True:
+            data_handler.update_TradeLOB()
+        else:
+            break
+        while True:
+            try:
+                event = event_queue.get(False)
+            except queue.Empty:
+                break
+            else:
+                if event is not None:
+                    if event.type == 'MARKET':
+                        strategy.on_market_event(event)
+                        portfolio.on_market_event(event)
+                        executor.on_market_event(event)
+                    elif event.type == 'ORDER':
+                        executor.on_order_event(event)
+                    elif event.type == 'FILL':
+                        executor.on_fill_event(event)
+                        portfolio.on_fill_event(event)
+                        strategy.on_fill_event(event)
+
+
+def scheduled_notebook_loop(events, data_handler, strategy, portfolio, executor):
+    """
+    notebook 的循环, 改为使用 EventQueue 并在每次推送后触发到期的 timer, 分发仍然是 if/elif
+    与 notebook_loop 的差为 queue.Queue 的锁以及组件每次行情检查时间的耗时, 与 engine 的差为 engine 循环本身
+    """
+    scheduler = events.scheduler
+    while True:
+        if data_handler.continue_backtest == True:
+            data_handler.update_TradeLOB()
+            scheduler.run_until(data_handler.backtest_now)
+        else:
+            break
+        while True:
+            try:
+                event = events.get(False)
+            except queue.Empty:
+                break
+            else:
+                if event is not None:
+                    if event.type == 'MARKET':
+                        strategy.on_market_event(event)
+                        portfolio.on_market_event(event)
+                        executor.on_market_event(event)
+                    elif event.type == 'ORDER':
+                        executor.on_order_event(event)
+                    elif event.type == 'FILL':
+                        executor.on_fill_event(event)
+                        portfolio.on_fill_event(event)
+                        strategy.on_fill_event(event)
+
+
+def bench_loop(n):
+    null = _NullComponent()
+    q = queue.Queue()
+    t0 = time.perf_counter()
+    notebook_loop(q, _SyntheticHandler(q, n), null, null, null)
+    old = time.perf_counter() - t0
+
+    events = EventQueue()
+    engine = BacktestEngine(events, _SyntheticHandler(events, n)).register_components(null, null, null)
+    n_new = engine.run()
+    print('loop only (%d events):  notebook %.0f events/s  engine %.0f events/s  (x%.2f)'
+          % (n_new, n_new / old, engine.events_per_sec(), old / engine.elapsed))
+
+
+########## 2. 完整回测 ##########
+
+# (名称, 说明), 按这个顺序交替运行, 减少机器负载变化的影响
+VARIANTS = (
+    ('notebook', 'try.ipynb loop, queue.Queue'),
+    ('replay', 'data handler only, no components'),
+    ('scheduled', 'notebook loop, EventQueue + scheduler'),
+    ('engine_nogc', 'BacktestEngine, gc_control=False'),
+    ('engine', 'BacktestEngine (default)'),
+)
+
+
+def _run_variant(variant, file_dir, exchange_list, is_csv):
+    """
+    返回 (循环耗时, event 数量, strategy_history), 不包括创建 handler (读取数据) 的时间
+    replay: 只推送数据 (update_TradeLOB) 并丢弃 event, 是完整回测耗时的下限
+    """
+    symbol_list = ['btc_usdt'] * len(exchange_list)
+    q = queue.Queue() if variant == 'notebook' else EventQueue()
+    n_events = None
+    # 组件的 print 输出不显示 (各种循环输出相同)
+    with contextlib.redirect_stdout(io.StringIO()):
+        data_handler = HistoricTradeLOBHourlyDataHandler(q, symbol_list=symbol_list, exchange_list=exchange_list,
+                                                         file_dir=file_dir, is_csv=is_csv)
+        portfolio = LogPlotPortfolio(q, data_handler)
+        executor = SimulatedExecutionHandler(q, data_handler)
+        strategy = LeadLagArbitrageStrategy(q, data_handler, portfolio, executor, **STRATEGY_PARAMS)
+        gc.collect()
+        t0 = time.perf_counter()
+        if variant == 'notebook':
+            notebook_loop(q, data_handler, strategy, portfolio, executor)
+        elif variant == 'scheduled':
+            scheduled_notebook_loop(q, data_handler, strategy, portfolio, executor)
+        elif variant == 'replay':
+            while data_handler.continue_backtest:
+                data_handler.update_TradeLOB()
+                q.clear()
+        else:
+            engine = BacktestEngine(q, data_handler, gc_control=variant == 'engine')
+            n_events = engine.register_components(strategy, portfolio, executor).run()
+        elapsed = time.perf_counter() - t0
+        data_handler.close()
+    return elapsed, n_events, strategy.strategy_history
+
+
+def bench_backtest(file_dir, exchange_list, is_csv, repeat):
+    """
+    同一份数据, 同一组参数, 端到端比较原来 notebook 的循环与 BacktestEngine, 并检查两者的 strategy_history 完全一致
+    给出每种方式 repeat 次中的最小值与中位数; replay 与 notebook 的差为组件以及循环 (分发) 的耗时
+    """
+    times = {name: [] for name, _ in VARIANTS}
+    histories = {}
+    n_events = 0
+    for _ in range(repeat):
+        for name, _ in VARIANTS:
+            elapsed, n, history = _run_variant(name, file_dir, exchange_list, is_csv)
+            times[name].append(elapsed)
+            histories[name] = history
+            n_events = n or n_events
+    same = all(histories['notebook'] == histories[name] for name, _ in VARIANTS if name != 'replay')
+    base = statistics.median(times['notebook'])
+    print('backtest (%d symbols, %d events, %d runs each, same result: %s):'
+          % (len(exchange_list), n_events, repeat, same))
+    for name, description in VARIANTS:
+        median = statistics.median(times[name])
+        print('    %-12s %-38s min %.3fs  median %.3fs  %7.0f events/s  (x%.2f)'
+              % (name, description, min(times[name]), median, n_events / median, base / median))
+
+
+def bench_routing(file_dir, exchange_list, is_csv):
+    results = {}
+    for routing in (False, True):
+        with contextlib.redirect_stdout(io.StringIO()):
+            engine = build_backtest(file_dir, ['btc_usdt'] * len(exchange_list), exchange_list,
+                                    strategy_params=STRATEGY_PARAMS, handler_params=dict(is_csv=is_csv),
+                                    routing=routing)
+            engine.run()
+            engine.data_handler.close()
+        results[routing] = engine
+    off, on = results[False], results[True]
+    same = off.strategy.strategy_history == on.strategy.strategy_history
+    print('routing (%d symbols):  off %d events %.3fs  on %d events (%d rows fast-forwarded) %.3fs  (x%.2f)  same result: %s'
+          % (len(exchange_list), off.n_events, off.elapsed, on.n_events, on.n_skipped, on.elapsed,
+             off.elapsed / on.elapsed, same))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='notebook loop vs BacktestEngine')
+    parser.add_argument('--file_dir', required=True, help='directory with *_trade and *_LOB files')
+    parser.add_argument('--exchanges', default='bybit,okex',
+                        help='comma separated; the strategy trades the first two, the others only add data')
+    parser.add_argument('--csv', action='store_true', help='data files are csv instead of parquet')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--loop_events', type=int, default=1000000)
+    args = parser.parse_args()
+    exchange_list = args.exchanges.split(',')
+    bench_loop(args.loop_events)
+    bench_backtest(args.file_dir, exchange_list[:2], args.csv, args.repeat)
+    if len(exchange_list) > 2:
+        bench_backtest(args.file_dir, exchange_list, args.csv, args.repeat)
+    bench_routing(args.file_dir, exchange_list, args.csv)
@@ -0,0 +1,223 @@
+# bench_records.py
+
+"""
+record 类型 (event/行情/订单) 的 microbenchmark: 原来基于 __dict__ 的类 vs __slots__ 的类
+
+1. 每个对象的内存 (tracemalloc) 以及创建速度
+2. copy(): deepcopy vs 逐字段复制
+3. 推送: 每次 MarketEvent() vs 共用 MARKET_EVENT
+4. GC: 存在大量长生命周期对象 (已加载的数据, 策略的历史记录) 时, 回放中 GC 的次数与耗时, 以及 replay_gc() 的效果
+
+usage:
+    python benchmarks/bench_records.py [N]
+"""
+
+import copy
+import gc
+import os
+import queue
+import sys
+import time
+import tracemalloc
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from event import MarketEvent, OrderEvent, FillEvent, MARKET_EVENT, replay_gc
+from DataHandler.MarketDataStructure import Trade, Orderbook
+from Execution.OrderDataStructure import LiveOrder
+
+
+########## 原来的 (基于 __dict__) record 类型 ##########
+
+class _DictRecord(object):
+    def __repr__(self):
+        return self.__dict__.__repr__()
+
+    def copy(self):
+        return copy.deepcopy(self)
+
+
+class OldTrade(_DictRecord):
+    def __init__(self, symbol=None, price=None, qty=None, is_buyer_maker=None, timestamp=None, receive_time=None):
+        self.symbol = symbol
+        self.price = price
+        self.qty = qty
+        self.is_buyer_maker = is_buyer_maker
+        self.timestamp = timestamp
+        self.receive_time = receive_time
+
+
+class OldOrderbook(_DictRecord):
+    def __init__(self, symbol=None, bid1=None, bidqty1=None, ask1=None, askqty1=None, timestamp=None, receive_time=None):
+        self.symbol = symbol
+        self.bid1 = bid1
+        self.bidqty1 = bidqty1
+        self.ask1 = ask1
+        self.askqty1 = askqty1
+        self.timestamp = timestamp
+        self.receive_time = receive_time
+
+
+class OldMarketEvent(_DictRecord):
+    def __init__(self):
+        self.type = 'MARKET'
+
+
+class OldOrderEvent(_DictRecord):
+    def __init__(self, timestamp, symbol, order_id, order_type, direction, quantity, price=None):
+        self.type = 'ORDER'
+        self.timestamp = timestamp
+        self.symbol = symbol
+        self.order_id = order_id
+        self.order_type = order_type
+        self.direction = direction
+        self.quantity = quantity
+        self.price = price
+
+
+class OldFillEvent(_DictRecord):
+    def __init__(self, timestamp, symbol, exchange, order_id, direction, quantity, price, is_Maker, fill_flag='ALL'):
+        self.type = 'FILL'
+        self.timestamp = timestamp
+        self.symbol = symbol
+        self.exchange = exchange
+        self.order_id = order_id
+        self.direction = direction
+        self.quantity = quantity
+        self.price = price
+        self.fill_flag = fill_flag
+        self.is_Maker = is_Maker
+
+
+class OldLiveOrder(_DictRecord):
+    def __init__(self, timestamp, symbol, order_id, order_type, direction, quantity, price=None):
+        self.timestamp = timestamp
+        self.symbol = symbol
+        self.order_id = order_id
+        self.order_type = order_type
+        self.direction = direction
+        self.quantity = quantity
+        self.price = price
+        self.help_state = 0
+
+
+CASES = [
+    ('Trade', OldTrade, Trade, lambda cls, i: cls('btc_usdt_bybit', 42611.99 + i, 0.01, True, 1704042025312 + i)),
+    ('Orderbook', OldOrderbook, Orderbook,
+     lambda cls, i: cls('btc_usdt_bybit', 42611.99, 1.0, 42612.0 + i, 0.5, 1704042025312 + i)),
+    ('MarketEvent', OldMarketEvent, MarketEvent, lambda cls, i: cls()),
+    ('OrderEvent', OldOrderEvent, OrderEvent,
+     lambda cls, i: cls(1704042025312 + i, 'btc_usdt_bybit', i, 'LIMIT', 'BUY', 0.1, 42611.99)),
+    ('FillEvent', OldFillEvent, FillEvent,
+     lambda cls, i: cls(1704042025312 + i, 'btc_usdt_bybit', 'bybit', i, 'BUY', 0.1, 42611.99, True, 'PARTIAL')),
+    ('LiveOrder', OldLiveOrder, LiveOrder,
+     lambda cls, i: cls(1704042025312 + i, 'btc_usdt_bybit', i, 'LIMIT', 'BUY', 0.1, 42611.99)),
+]
+
+
+def _bytes_per_object(cls, make, n):
+    gc.collect()
+    tracemalloc.start()
+    objects = [make(cls, i) for i in range(n)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # 包含 list 本身以及字段中新建的 int/float, 新旧两种类型相同
+    del objects
+    return size / n
+
+
+def _timeit(fn, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def bench_records(n):
+    print('%-12s %14s %14s %14s %14s %12s %12s' % ('record', 'old bytes/obj', 'new bytes/obj',
+                                                     'old create/s', 'new create/s', 'old copy/s', 'new copy/s'))
+    for name, old_cls, new_cls, make in CASES:
+        old_bytes = _bytes_per_object(old_cls, make, n)
+        new_bytes = _bytes_per_object(new_cls, make, n)
+        old_t = _timeit(lambda: [make(old_cls, i) for i in range(n)])
+        new_t = _timeit(lambda: [make(new_cls, i) for i in range(n)])
+        k = max(n // 20, 1)
+        old_obj, new_obj = make(old_cls, 0), make(new_cls, 0)
+        old_copy = _timeit(lambda: [old_obj.copy() for _ in range(k)]) if hasattr(old_obj, 'copy') else float('nan')
+        new_copy = _timeit(lambda: [new_obj.copy() for _ in range(k)]) if hasattr(new_obj, 'copy') else float('nan')
+        print('%-12s %14.0f %14.0f %14.0f %14.0f %12.0f %12.0f' % (name, old_bytes, new_bytes, n / old_t, n / new_t,
+                                                                    k / old_copy, k / new_copy))
+
+
+def bench_market_event(n):
+    q = queue.Queue()
+
+    def push_new():
+        for _ in range(n):
+            q.put(OldMarketEvent())
+            q.get(False)
+
+    def push_shared():
+        for _ in range(n):
+            q.put(MARKET_EVENT)
+            q.get(False)
+
+    print('\nmarket event push (%d):  MarketEvent() %.3fs  MARKET_EVENT %.3fs' % (n, _timeit(push_new), _timeit(push_shared)))
+
+
+def _replay(n, record_cls):
+    """
+    模拟回放: 每个事件生成几个短生命周期的 record, 少量 record 进入长期保存的历史
+    """
+    history = []
+    for i in range(n):
+        trades = [record_cls('btc_usdt_bybit', 42611.99, 0.01, True, i) for _ in range(3)]
+        if i % 100 == 0:
+            history.append({'t': i, 'trades': trades})
+    return history
+
+
+def _timed_replay(n, record_cls, stats):
+    stats['count'], stats['time'] = 0, 0.0
+    t0 = time.perf_counter()
+    _replay(n, record_cls)
+    return time.perf_counter() - t0
+
+
+def bench_gc(n, old_cls, new_cls):
+    # 长生命周期对象: 已经加载的数据以及之前的历史记录
+    live = [{'i': i, 'v': [i]} for i in range(n)]
+    stats = {'count': 0, 'time': 0.0}
+    start = [0.0]
+
+    def callback(phase, info):
+        if phase == 'start':
+            start[0] = time.perf_counter()
+        else:
+            stats['count'] += 1
+            stats['time'] += time.perf_counter() - start[0]
+
+    gc.callbacks.append(callback)
+    print('\nGC during replay (%d long-lived objects, %d events):' % (n, n))
+    try:
+        for label, cls, controlled in (('dict records', old_cls, False), ('slots records', new_cls, False),
+                                       ('slots records + replay_gc', new_cls, True)):
+            gc.collect()
+            if controlled:
+                # gc.collect()/gc.freeze() 在进入时只做一次, 不计入回放时间
+                with replay_gc():
+                    total = _timed_replay(n, cls, stats)
+            else:
+                total = _timed_replay(n, cls, stats)
+            print('  %-28s total %.3fs  gc runs %5d  gc time %.3fs' % (label, total, stats['count'], stats['time']))
+    finally:
+        gc.callbacks.remove(callback)
+    del live
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    bench_records(n)
+    bench_market_event(n)
+    bench_gc(n * 5, OldTrade, Trade)
@@ -0,0 +1,95 @@
+# bench_shared_memory.py
+
+"""
+N 个并行回测 worker 的内存: 每个 worker 自己读取数据 vs 从共享内存 (SharedMarketData) 读取
+
+worker 用 spawn 启动 (不继承父进程的内存), 每个 worker 创建 handler 并完成一次回测,
+统计创建 handler 之后增加的私有内存 (USS, /proc/self/smaps_rollup 中的 Private_*) 以及所有进程的 PSS 之和
+共享内存由父进程创建, worker 只读地 attach, 不计入 worker 的私有内存
+
+仓库中的 data_sample 只有 trade 文件, file_dir 需要包含 *_trade 以及 *_LOB 文件
+
+usage (仅 Linux):
+    python benchmarks/bench_shared_memory.py file_dir [exchange1,exchange2] [handler_params json]
+"""
+
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from DataHandler.SharedMarketData import SharedMarketData
+from DataHandler.TradeLOBHourlyDataHandler import HistoricTradeLOBHourlyDataHandler
+
+
+STRATEGY_PARAMS = dict(k1=0.5*1e-4, k2=0.7*1e-4, k3=1.5*1e-4, order_live_time=25*1000,
+                       dynamic_stop_hedge=5*1000, stop_loss_threshold=1*1e-4)
+
+
+def _memory(pid='self'):
+    """
+    (USS, PSS) bytes
+    """
+    values = {}
+    with open('/proc/%s/smaps_rollup' % pid) as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[1].isdigit():
+                values[parts[0].rstrip(':')] = int(parts[1]) * 1024
+    return values['Private_Clean'] + values['Private_Dirty'], values['Pss']
+
+
+def _worker(file_dir, exchange_list, handler_params, ready, done, results):
+    from Engine.BacktestEngine import build_backtest
+    before, _ = _memory()
+    with contextlib.redirect_stdout(io.StringIO()):
+        engine = build_backtest(file_dir, ['btc_usdt'] * len(exchange_list), exchange_list,
+                                strategy_params=STRATEGY_PARAMS, handler_params=handler_params)
+        engine.run()
+    after, _ = _memory()
+    results.put((os.getpid(), after - before, len(engine.strategy.strategy_history)))
+    ready.wait()
+    # 所有 worker 都完成之后父进程统计 PSS, 之后退出
+    done.wait()
+
+
+def bench(file_dir, exchange_list, handler_params, n_workers, shared):
+    ctx = multiprocessing.get_context('spawn')
+    ready, done, results = ctx.Event(), ctx.Event(), ctx.Queue()
+    data = None
+    if shared:
+        data = SharedMarketData.load(HistoricTradeLOBHourlyDataHandler, file_dir, ['btc_usdt'] * len(exchange_list),
+                                     exchange_list, **handler_params)
+        handler_params = dict(handler_params, shared_data=data.manifest)
+    processes = [ctx.Process(target=_worker, args=(file_dir, exchange_list, handler_params, ready, done, results))
+                 for _ in range(n_workers)]
+    for process in processes:
+        process.start()
+    outcomes = [results.get() for _ in processes]
+    ready.set()
+    pss = sum(_memory(pid)[1] for pid, _, _ in outcomes) + _memory()[1]
+    done.set()
+    for process in processes:
+        process.join()
+    shared_bytes = data.nbytes if data is not None else 0
+    if data is not None:
+        data.close()
+    uss = [delta for _, delta, _ in outcomes]
+    trades = {n for _, _, n in outcomes}
+    print('%-6s workers %d:  data/worker (USS) %7.1f MB  all workers %7.1f MB  shared %6.1f MB  total PSS %7.1f MB  trades %s'
+          % ('shared' if shared else 'disk', n_workers, sum(uss) / len(uss) / 1e6, sum(uss) / 1e6,
+             shared_bytes / 1e6, pss / 1e6, sorted(trades)))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        sys.exit(__doc__)
+    file_dir = sys.argv[1]
+    exchange_list = sys.argv[2].split(',') if len(sys.argv) > 2 else ['bybit', 'okex']
+    handler_params = dict(is_csv=False, **(json.loads(sys.argv[3]) if len(sys.argv) > 3 else {}))
+    for n_workers in (1, 2, 4):
+        for shared in (False, True):
+            bench(file_dir, exchange_list, handler_params, n_workers, shared)
@@ -16,24 +16,111 @@ Events
 - FillEvent, 
             consumed by PortfolioObject, may then produce OrderEvent
             当 ExecutionHandler 收到 OrderEvent 时，它必须处理订单。 一旦订单被交易，它就会生成一个 FillEvent ，它描述购买或销售的成本以及交易成本，例如费用或滑点。
+
+所有 event 使用 __slots__ (没有 __dict__), type 为类属性; MarketEvent 没有状态, DataHandler 每次推送同一个 MARKET_EVENT
+长时间回放时用 replay_gc() 减少循环 GC 的开销
+组件通过 market_interest() 返回 Interest 声明关心哪些 MarketEvent, BacktestEngine 只把匹配的 MarketEvent 交给该组件
 """
 
+import gc
+from contextlib import contextmanager
+
 
 class Event(object):
     """
     Event is base class providing an interface for all events, which will trigger further events.
     """
+    __slots__ = ()
+    type = None
+
+    def to_dict(self):
+        """
+        {'type': ..., 已经赋值的字段...}, 按照 __slots__ 的顺序
+        """
+        d = {'type': self.type}
+        for name in self.__slots__:
+            if hasattr(self, name):
+                d[name] = getattr(self, name)
+        return d
+
     def __repr__(self):
-        return self.__dict__.__repr__()
+        return self.to_dict().__repr__()
 
 
 class MarketEvent(Event):
     """
     Handles the event of receiving a new market update with corresponding bars.
     """
+    __slots__ = ()
+    type = 'MARKET'
+
+
+# MarketEvent 不携带数据, 所有推送共用一个实例
+MARKET_EVENT = MarketEvent()
+
+
+class Interest(object):
+    """
+    组件关心的 MarketEvent
+    symbols: 关心的 symbol_exchange, None 为全部
+    trade/LOB: 是否关心 trade/LOB 的更新
+    一次推送中 symbols 里任意一个 symbol 有关心的更新时, 该组件收到这次的 MarketEvent
+    组件的 market_interest() 每次推送都会被调用, 请返回预先生成的 Interest, 不要每次新建
+    """
+    __slots__ = ('symbols', 'trade', 'LOB', 'all')
 
-    def __init__(self):
-        self.type = 'MARKET'
+    def __init__(self, symbols=None, trade=True, LOB=True):
+        self.symbols = None if symbols is None else frozenset(symbols)
+        self.trade = trade
+        self.LOB = LOB
+        # 所有推送都需要
+        self.all = symbols is None and trade and LOB
+
+    def matches(self, trade_symbols, LOB_symbols):
+        """
+        trade_symbols/LOB_symbols: 本次推送中发生更新的 symbol
+        """
+        if self.all:
+            return True
+        if self.symbols is None:
+            return bool((self.trade and trade_symbols) or (self.LOB and LOB_symbols))
+        if self.trade:
+            for s in trade_symbols:
+                if s in self.symbols:
+                    return True
+        if self.LOB:
+            for s in LOB_symbols:
+                if s in self.symbols:
+                    return True
+        return False
+
+    def __repr__(self):
+        return 'Interest(symbols=%s, trade=%s, LOB=%s)' % (
+            None if self.symbols is None else sorted(self.symbols), self.trade, self.LOB)
+
+
+# 所有推送 / 不需要推送
+ALL_MARKET = Interest()
+NO_MARKET = Interest(symbols=())
+
+
+@contextmanager
+def replay_gc(threshold=100000):
+    """
+    回放期间的 GC 控制:
+    1. 进入时 collect 一次后 gc.freeze(), 已经加载的对象 (数据, handler, 策略) 不再被之后的 GC 扫描
+    2. 提高第 0 代的阈值, 减少回放中大量短生命周期对象触发的 GC 次数 (不关闭 GC, 循环引用仍然会被回收)
+    退出时恢复原来的阈值并 unfreeze
+    """
+    old_threshold = gc.get_threshold()
+    gc.collect()
+    gc.freeze()
+    gc.set_threshold(threshold, *old_threshold[1:])
+    try:
+        yield
+    finally:
+        gc.set_threshold(*old_threshold)
+        gc.unfreeze()
 
 
 # class SignalEvent(Event):
@@ -62,6 +149,8 @@ class OrderEvent(Event):
     Handles the event of sending an Order to an execution system.
     The order contains: 1.symbol, 2.type (market or limit or ....), 3.quantity, 4.direction, 5.arrive_time.
     """
+    __slots__ = ('timestamp', 'symbol', 'order_id', 'order_type', 'direction', 'quantity', 'price')
+    type = 'ORDER'
 
     def __init__(self, timestamp, symbol, order_id, order_type, direction, quantity, price=None, 
                  #execution_end_time=float('inf'),
@@ -77,7 +166,6 @@ class OrderEvent(Event):
         price                   # 订单价格，如果是市价单可以为 None, init 的时候会检查
         execution_end_time      # 订单的最后执行时间 目前版本暂时不支持
         """
-        self.type = 'ORDER'
         self.timestamp = timestamp
         self.symbol = symbol
         self.order_id = order_id
@@ -98,10 +186,13 @@ class OrderEvent(Event):
 class FillEvent(Event):
     """
     FillEvent
+    fee/cash_cost 只在 fill_flag == 'ALL' 时赋值
     """
+    __slots__ = ('timestamp', 'symbol', 'exchange', 'order_id', 'direction', 'quantity', 'price',
+                 'fill_flag', 'is_Maker', 'fee', 'cash_cost')
+    type = 'FILL'
 
     def __init__(self, timestamp, symbol, exchange, order_id, direction, quantity, price, is_Maker, fill_flag='ALL'):
-        self.type = 'FILL'
         self.timestamp = timestamp     # timestamp of Fill
         self.symbol = symbol
         self.exchange = exchange       # 交易所，不同的交易所有不同的手续费
@@ -116,7 +207,7 @@ class FillEvent(Event):
             self.fee = self.get_fee()      # 这里仅是费率，如果要考虑交易量的问题，应该进一步计算commission。这一版暂时忽略
             self.cal_cash_cost()
             print('order filled')
-            print(self.__dict__.__repr__())
+            print(self.__repr__())
 
     def get_fee(self):
         """
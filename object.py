@@ -6,6 +6,8 @@
 
 from abc import ABCMeta, abstractmethod
 
+from event import ALL_MARKET
+
 
 class DataHandlerError(Exception):
     def __init__(self,errorinfo):
@@ -40,6 +42,28 @@ class DataHandler(object):
         for all symbols in the symbol(exchange) list.
         """
         raise NotImplementedError("Should implement update_ticks()")
+
+    def get_order_book(self, symbol, exchange=None):
+        """
+        Returns the L2 order book (OrderBookL2) of the symbol(exchange),
+        or None if the data handler does not provide depth data.
+        """
+        return None
+
+    def _agg_symbol_exchange_list(self, symbol_list, exchange_list):
+        """
+        用于聚合 symbol_exchange_list 的工具函数
+        """
+        symbol_exchange_list_temp  = []
+        if len(symbol_list) != len(exchange_list):
+            raise DataHandlerError(' symbol_list 和 exchange_list 长度不同, 请检查您的输入')
+        for i in range(len(symbol_list)):
+            symbol_exchange = str(symbol_list[i]) + '_' + str(exchange_list[i])
+            if symbol_exchange in symbol_exchange_list_temp:
+                raise DataHandlerError(' symbol_list 和 exchange_list 聚合后不能形成数据的 key, 请检查您的输入')
+            symbol_exchange_list_temp.append(symbol_exchange)
+
+        return symbol_exchange_list_temp
     
 
 class Strategy(object):
@@ -56,6 +80,13 @@ class Strategy(object):
         Provides the mechanisms to calculate the list of signals.
         """
         raise NotImplementedError("Should implement calculate_signals()")
+
+    def market_interest(self):
+        """
+        Returns the Interest (see event.Interest) of the MarketEvents this component
+        needs to receive; by default all of them.
+        """
+        return ALL_MARKET
     
 
 class ExecutionHandler(object):
@@ -76,6 +107,13 @@ class ExecutionHandler(object):
         event - Contains an Event object with order information.
         """
         raise NotImplementedError("Should implement execute_order()")
+
+    def market_interest(self):
+        """
+        Returns the Interest (see event.Interest) of the MarketEvents this component
+        needs to receive; by default all of them.
+        """
+        return ALL_MARKET
     
 
 class Portfolio(object):
@@ -102,4 +140,10 @@ class Portfolio(object):
         from a FillEvent.
         """
         raise NotImplementedError("Should implement update_fill()")
-    
\ No newline at end of file
+
+    def market_interest(self):
+        """
+        Returns the Interest (see event.Interest) of the MarketEvents this component
+        needs to receive; by default all of them.
+        """
+        return ALL_MARKET
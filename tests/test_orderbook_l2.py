@@ -0,0 +1,88 @@
+# test_orderbook_l2.py
+
+"""
+L2DiffReplay: 手工构造的增量序列按窗口回放, 与逐步推算的快照比较
+
+usage:
+    python -m pytest tests/
+"""
+
+import os
+import sys
+import numpy as np
+import pytest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from DataHandler.OrderBookL2 import L2DiffStore, L2DiffReplay, L2SnapshotStore, BID, ASK
+
+
+nan = np.nan
+
+# (time, side, price, qty), qty 为 0 表示删除该档
+DIFFS = [
+    (1, BID, 100.0, 1.0), (1, BID, 99.0, 2.0), (1, BID, 98.0, 3.0),
+    (1, ASK, 101.0, 1.0), (1, ASK, 102.0, 2.0), (1, ASK, 103.0, 3.0),
+    (2, BID, 100.0, 0.0),                               # 删除 bid 第一档, 第三档 98 补上
+    (3, ASK, 101.5, 5.0),                               # 在 ask 第一档和第二档之间插入
+    (4, BID, 99.0, 4.0), (4, ASK, 101.0, 0.0),          # 同一个时间戳: 修改数量, 删除 ask 第一档
+    (6, BID, 99.0, 0.0), (6, BID, 98.0, 0.0),           # bid 全部删除
+]
+
+# 每个时间戳之后前 2 档的 (bid_px, bid_qty, ask_px, ask_qty)
+EXPECTED = {
+    1: ([100, 99], [1, 2], [101, 102], [1, 2]),
+    2: ([99, 98], [2, 3], [101, 102], [1, 2]),
+    3: ([99, 98], [2, 3], [101, 101.5], [1, 5]),
+    4: ([99, 98], [4, 3], [101.5, 102], [5, 2]),
+    6: ([nan, nan], [0, 0], [101.5, 102], [5, 2]),
+}
+
+
+def _diff_store(diffs):
+    time, side, price, qty = (np.array(column) for column in zip(*diffs))
+    return L2DiffStore('btc_usdt_test', time, side=side.astype(np.int8), price=price, qty=qty)
+
+
+def _check(snapshots, expected):
+    assert isinstance(snapshots, L2SnapshotStore)
+    assert snapshots.time.tolist() == sorted(expected)
+    for row, t in enumerate(sorted(expected)):
+        bid_px, bid_qty, ask_px, ask_qty = expected[t]
+        np.testing.assert_array_equal(snapshots.bid_px[row], bid_px)
+        np.testing.assert_array_equal(snapshots.bid_qty[row], bid_qty)
+        np.testing.assert_array_equal(snapshots.ask_px[row], ask_px)
+        np.testing.assert_array_equal(snapshots.ask_qty[row], ask_qty)
+
+
+def test_replay_one_window():
+    _check(L2DiffReplay(_diff_store(DIFFS), 2).read_window(0, 10), EXPECTED)
+
+
+def test_replay_keeps_book_across_windows():
+    replay = L2DiffReplay(_diff_store(DIFFS), 2, margin=1)
+    _check(replay.read_window(1, 2), {t: EXPECTED[t] for t in (1, 2)})
+    _check(replay.read_window(3, 4), {t: EXPECTED[t] for t in (3, 4)})
+    _check(replay.read_window(5, 10), {6: EXPECTED[6]})
+
+
+def test_replay_empty_window():
+    replay = L2DiffReplay(_diff_store(DIFFS), 2)
+    replay.read_window(1, 4)
+    assert len(replay.read_window(5, 5)) == 0
+    _check(replay.read_window(6, 6), {6: EXPECTED[6]})
+
+
+def test_replay_windows_in_time_order():
+    replay = L2DiffReplay(_diff_store(DIFFS), 2)
+    replay.read_window(1, 3)
+    with pytest.raises(ValueError):
+        replay.read_window(2, 4)
+
+
+def test_replay_bounded_book_drops_levels_beyond_margin():
+    # depth 1 + margin 1: bid 98 超出订单簿被丢弃, 删除前两档之后 bid 为空
+    diffs = [(1, BID, 100.0, 1.0), (1, BID, 99.0, 2.0), (1, BID, 98.0, 3.0), (1, ASK, 101.0, 1.0),
+             (2, BID, 100.0, 0.0), (3, BID, 99.0, 0.0)]
+    snapshots = L2DiffReplay(_diff_store(diffs), 1, margin=1).read_window(0, 10)
+    assert snapshots.bid_px[:, 0].tolist()[:2] == [100.0, 99.0]
+    assert np.isnan(snapshots.bid_px[2, 0])
@@ -0,0 +1,46 @@
+# test_parquet_window_reader.py
+
+"""
+ParquetWindowReader: 没有写入统计信息的 parquet 文件与有统计信息的文件切分出相同的窗口
+
+usage:
+    python -m pytest tests/
+"""
+
+import os
+import sys
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from DataHandler.MarketDataStore import ParquetWindowReader, TradeStore, TRADE_COLUMNS, next_window
+
+
+def _write(path, write_statistics):
+    time = np.sort(np.random.RandomState(0).randint(0, 3600 * 1000, 5000)).astype(np.int64)
+    table = pa.table({'time': time, 'price': np.full(len(time), 100.0), 'qty': np.ones(len(time)),
+                      'maker': np.zeros(len(time), dtype=bool)})
+    pq.write_table(table, path, row_group_size=700, write_statistics=write_statistics)
+    return ParquetWindowReader(TradeStore, 'btc_usdt_test', path, TRADE_COLUMNS)
+
+
+def _windows(source, max_rows):
+    windows, window = [], None
+    while True:
+        window = next_window([source], window and window[1], max_rows=max_rows)
+        if window is None:
+            return windows
+        windows.append(tuple(window))
+
+
+def test_row_groups_without_statistics(tmp_path):
+    with_stats = _write(str(tmp_path / 'with_stats.parquet'), True)
+    without_stats = _write(str(tmp_path / 'without_stats.parquet'), False)
+    assert not without_stats.row_group_has_stats.any()
+
+    assert without_stats.last_time() == with_stats.last_time()
+    start = with_stats.next_time_after()
+    for end in (start, start + 60 * 1000, with_stats.last_time()):
+        assert without_stats.count_between(start, end) == with_stats.count_between(start, end)
+    assert _windows(without_stats, 1000) == _windows(with_stats, 1000)